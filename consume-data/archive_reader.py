@@ -0,0 +1,139 @@
+import collections
+import queue
+import threading
+import time
+from archive_replay import ArchivedObject, iter_messages
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+_END = object()  # marks the end of an object's chunks
+
+
+class ArchiveReader:
+    """
+    Reads archived objects in parallel, streaming and decompressing each one.
+
+    Up to `workers` objects are fetched at a time over the store's pooled
+    connections. Each worker parses its object as it arrives and hands the
+    messages over in chunks through a small queue, so at most
+    workers * chunks_ahead * chunk_messages messages are held in memory
+    however large the objects are. Messages come out in the order of the
+    objects given.
+    """
+
+    def __init__(
+            self,
+            store: Any,
+            workers: int = 8,
+            chunk_messages: int = 1_000,
+            chunks_ahead: int = 4) -> None:
+        """
+        Set up a reader.
+
+        Args:
+            store (Any): Object store holding the archive, e.g. `object_store.S3ObjectStore`.
+            workers (int): Objects fetched in parallel. Defaults to 8.
+            chunk_messages (int): Messages handed over at a time. Defaults to 1,000.
+            chunks_ahead (int): Chunks each worker may parse ahead of the caller. Defaults to 4.
+        """
+        self.store = store
+        self.workers = workers
+        self.chunk_messages = chunk_messages
+        self.chunks_ahead = chunks_ahead
+
+    def _fetch(
+            self,
+            archived: ArchivedObject,
+            chunks: queue.Queue,
+            stop: threading.Event) -> None:
+        """Stream one object into a queue of message chunks, ending with _END or the error raised."""
+
+        def put(item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        if stop.is_set():
+            return
+        try:
+            with self.store.open(archived.key) as stream:
+                chunk: List[Dict[str, Any]] = []
+                for message in iter_messages(stream):
+                    chunk.append(message)
+                    if len(chunk) == self.chunk_messages:
+                        if not put(chunk):
+                            return
+                        chunk = []
+            if chunk and not put(chunk):
+                return
+            put(_END)
+        except Exception as error:
+            put(error)
+
+    def messages(
+            self,
+            objects: Iterable[ArchivedObject]) -> Iterator[Tuple[ArchivedObject, int, Dict[str, Any]]]:
+        """
+        Read the messages of objects, in order.
+
+        Args:
+            objects (Iterable[ArchivedObject]): Objects to read, e.g. from `archive_replay.list_archive`.
+
+        Yields:
+            Tuple[ArchivedObject, int, Dict[str, Any]]: Each message with its object and Kafka offset,
+                counting one offset per line from the object's start offset.
+        """
+        objects = iter(objects)
+        stop = threading.Event()
+        pending: collections.deque = collections.deque()
+        with ThreadPoolExecutor(self.workers) as pool:
+
+            def submit() -> None:
+                archived = next(objects, None)
+                if archived is not None:
+                    chunks: queue.Queue = queue.Queue(self.chunks_ahead)
+                    pool.submit(self._fetch, archived, chunks, stop)
+                    pending.append((archived, chunks))
+
+            try:
+                for _ in range(self.workers):
+                    submit()
+                while pending:
+                    archived, chunks = pending.popleft()
+                    offset = archived.start_offset
+                    for chunk in iter(chunks.get, _END):
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        for message in chunk:
+                            yield archived, offset, message
+                            offset += 1
+                    submit()
+            finally:
+                stop.set()  # let workers still parsing ahead give up if the caller stopped early
+
+    def read_all(
+            self,
+            objects: Iterable[ArchivedObject]) -> Dict[str, float]:
+        """
+        Read objects to the end, discarding the messages, to measure throughput.
+
+        Args:
+            objects (Iterable[ArchivedObject]): Objects to read.
+
+        Returns:
+            Dict[str, float]: Objects, messages and stored bytes read, and seconds taken.
+        """
+        stats = {"objects": 0, "messages": 0, "bytes": 0}
+        previous = None
+        start = time.perf_counter()
+        for archived, _, _ in self.messages(objects):
+            if archived is not previous:
+                stats["objects"] += 1
+                stats["bytes"] += archived.size
+                previous = archived
+            stats["messages"] += 1
+        return {**stats, "seconds": time.perf_counter() - start}
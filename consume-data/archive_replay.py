@@ -0,0 +1,330 @@
+import base64
+import collections
+import datetime
+import gzip
+import io
+import itertools
+import json
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from envelopes import TABLE_COLUMNS, encode_envelope, encode_key
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library parser
+    orjson = None
+try:
+    import zstandard
+except ImportError:  # only needed for archives written with file.compression.type zstd
+    zstandard = None
+
+# Keys written by the S3 sink's file.name.template: /{topic}/yyyy-MM-dd/HH/{partition}-{start_offset}.json
+ARCHIVE_KEY = re.compile(
+    r"(?:^|/)(?P<topic>[^/]+)/(?P<day>\d{4}-\d{2}-\d{2})/(?P<hour>\d{2})/(?P<partition>\d+)-(?P<offset>\d+)"
+    r"\.json(?:\.gz|\.zst)?$")
+
+ArchivedObject = namedtuple("ArchivedObject", ["key", "topic", "hour", "partition", "start_offset", "size"])
+ArchivedRecord = namedtuple("ArchivedRecord", ["key", "value", "timestamp"])
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def parse_key(
+        key: str,
+        size: int = 0) -> Optional[ArchivedObject]:
+    """
+    Parse the key of an archived object.
+
+    Args:
+        key (str): Object key.
+        size (int): Object size in bytes. Defaults to 0.
+
+    Returns:
+        Optional[ArchivedObject]: What the key says about the object, or None if it is not an archive file.
+    """
+    match = ARCHIVE_KEY.search(key)
+    if match is None:
+        return None
+    hour = datetime.datetime.strptime(f"{match['day']} {match['hour']}", "%Y-%m-%d %H")
+    return ArchivedObject(key, match["topic"], hour, int(match["partition"]), int(match["offset"]), size)
+
+
+def list_archive(
+        store: Any,
+        topics: Sequence[str],
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        prefix: str = "/") -> List[ArchivedObject]:
+    """
+    List the archived objects of some topics within a time range.
+
+    Keys sort by day and hour, so listing starts after the keys of the days
+    before the range and stops at its end: a short range of a long archive
+    is cheap.
+
+    Args:
+        store (Any): An object store, e.g. `object_store.S3ObjectStore`.
+        topics (Sequence[str]): Topics to list.
+        start (Optional[datetime.datetime]): First hour to include, in UTC. Defaults to None (all).
+        end (Optional[datetime.datetime]): Hour to stop before, in UTC. Defaults to None (all).
+        prefix (str): What keys start with before the topic. Defaults to '/', as in the sink's template.
+
+    Returns:
+        List[ArchivedObject]: The objects in replay order: by hour, then topic, partition and start offset.
+    """
+    first_hour = start.replace(minute=0, second=0, microsecond=0) if start is not None else None
+    objects = []
+    for topic in topics:
+        topic_prefix = f"{prefix}{topic}/"
+        start_after = f"{topic_prefix}{start:%Y-%m-%d}" if start is not None else None
+        for info in store.list(topic_prefix, start_after):
+            archived = parse_key(info.key, info.size)
+            if archived is None or archived.topic != topic:
+                continue
+            if end is not None and archived.hour >= end:
+                break
+            if first_hour is None or archived.hour >= first_hour:
+                objects.append(archived)
+    return sorted(objects, key=lambda archived: (archived.hour, archived.topic, archived.partition,
+                                                 archived.start_offset))
+
+
+def decompressed(
+        stream: BinaryIO) -> BinaryIO:
+    """
+    Wrap the content of an archived object so that it reads decompressed.
+
+    The codec is told by the first bytes rather than by the key, as the
+    sink keeps the key template's extension whatever file.compression.type is.
+
+    Args:
+        stream (BinaryIO): The object's content as written by the sink.
+
+    Returns:
+        BinaryIO: A stream of its JSON lines, decompressed as it is read.
+
+    Raises:
+        ValueError: If the object is compressed with a codec other than gzip or zstd.
+        ImportError: If it is zstd-compressed and zstandard is not installed.
+    """
+    if not hasattr(stream, "peek"):
+        stream = io.BufferedReader(stream)
+    magic = stream.peek(4)[:4]
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ImportError("Reading zstd-compressed archives requires zstandard")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream))
+    if magic and magic[:1] not in b"{[ \t\r\n":
+        raise ValueError(f"Unsupported archive compression (starts with {magic!r}); use none, gzip or zstd")
+    return stream
+
+
+def iter_messages(
+        stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """
+    Parse the JSON lines of an archived object as they are read.
+
+    Args:
+        stream (BinaryIO): The object's content, compressed or not.
+
+    Yields:
+        Dict[str, Any]: One message per line, as the sink wrote it, e.g. {"value": ...}.
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    for line in decompressed(stream):
+        if line.strip():
+            yield loads(line)
+
+
+def read_messages(
+        data: bytes) -> List[Dict[str, Any]]:
+    """
+    Parse the JSON lines of an archived object.
+
+    Args:
+        data (bytes): Content of the object, gzip- or zstd-compressed or not.
+
+    Returns:
+        List[Dict[str, Any]]: One message per line, as the sink wrote it, e.g. {"value": ...}.
+    """
+    return list(iter_messages(io.BytesIO(data)))
+
+
+def decode_object(
+        data: bytes,
+        topic: str,
+        schemas: bool = True) -> List[ArchivedRecord]:
+    """
+    Turn the JSON lines of an archived object back into Kafka messages.
+
+    The sink writes each message as {"value": ...}, optionally with "key"
+    and "timestamp". Values written as JSON are re-encoded the way the
+    connector's JsonConverter writes them; base64 strings, which the sink
+    writes for binary values such as Avro, are decoded to their bytes.
+    Without a key in the archive, the row's primary key is used, as Debezium does.
+
+    Args:
+        data (bytes): Content of the object, gzip- or zstd-compressed or not.
+        topic (str): Topic the object was archived from.
+        schemas (bool): Wrap payloads of known tables with their schema, as with schemas.enable=true.
+            Defaults to True.
+
+    Returns:
+        List[ArchivedRecord]: The messages, in archive order.
+    """
+    connector, _, table = topic.rpartition(".")
+    prefix = connector.split(".", 1)[0]
+    known = table in TABLE_COLUMNS
+    records = []
+    for message in read_messages(data):
+        value, key = message.get("value"), message.get("key")
+        row = None
+        if isinstance(value, dict):
+            payload = value.get("payload", value) if "schema" in value else value
+            row = payload.get("after") or payload.get("before")
+            if schemas and known and payload is value:
+                value = encode_envelope(table, payload, prefix=prefix)
+            else:
+                value = json.dumps(value, separators=(",", ":")).encode()
+        elif isinstance(value, str):
+            value = base64.b64decode(value)
+        if isinstance(key, str):
+            key = base64.b64decode(key)
+        elif isinstance(key, dict):
+            key = json.dumps(key, separators=(",", ":")).encode()
+        elif key is None and known and row and "id" in row:
+            key = encode_key(table, row["id"], schemas, prefix)
+        timestamp = message.get("timestamp")
+        records.append(ArchivedRecord(key, value, timestamp if isinstance(timestamp, int) else None))
+    return records
+
+
+def replay(
+        store: Any,
+        objects: Iterable[ArchivedObject],
+        producer: Any,
+        topic: Optional[str] = None,
+        workers: int = 8,
+        rate: Optional[float] = None,
+        schemas: bool = True,
+        keep_partitions: bool = True) -> Dict[str, float]:
+    """
+    Produce archived objects back into Kafka.
+
+    Objects are fetched and decoded by a thread pool, up to twice as many
+    as there are workers ahead of the producer, and produced strictly in
+    the given order. Each object holds consecutive records of one partition,
+    so with the producer retrying in order (one request in flight per
+    connection) every partition's order is preserved.
+
+    Args:
+        store (Any): Object store holding the archive.
+        objects (Iterable[ArchivedObject]): Objects in replay order, e.g. from `list_archive`.
+        producer (Any): A KafkaProducer, or a fake_broker.FakeProducer.
+        topic (Optional[str]): Topic to produce to. Defaults to None (each object's own topic).
+        workers (int): Objects fetched in parallel. Defaults to 8.
+        rate (Optional[float]): Maximum events per second. Defaults to None (as fast as possible).
+        schemas (bool): Wrap payloads with their schema, as with schemas.enable=true. Defaults to True.
+        keep_partitions (bool): Produce to each object's original partition if the topic has it,
+            rather than by key. Defaults to True.
+
+    Returns:
+        Dict[str, float]: Objects, events and bytes replayed, seconds taken and events per second.
+    """
+    objects = iter(objects)
+    partitions: Dict[str, set] = {}
+    stats = {"objects": 0, "events": 0, "bytes": 0}
+    start = time.perf_counter()
+
+    def fetch(archived: ArchivedObject) -> Tuple[ArchivedObject, List[ArchivedRecord]]:
+        return archived, decode_object(store.get(archived.key), archived.topic, schemas)
+
+    with ThreadPoolExecutor(workers) as pool:
+        pending = collections.deque(pool.submit(fetch, archived) for archived in itertools.islice(objects, 2 * workers))
+        while pending:
+            archived, records = pending.popleft().result()
+            following = next(objects, None)
+            if following is not None:
+                pending.append(pool.submit(fetch, following))
+
+            target = topic or archived.topic
+            if target not in partitions:
+                partitions[target] = set(producer.partitions_for(target) or ())
+            partition = archived.partition if keep_partitions and archived.partition in partitions[target] else None
+            for record in records:
+                if rate:
+                    ahead = stats["events"] / rate - (time.perf_counter() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                producer.send(target, value=record.value, key=record.key, partition=partition,
+                              timestamp_ms=record.timestamp)
+                stats["events"] += 1
+            stats["objects"] += 1
+            stats["bytes"] += archived.size
+    producer.flush()
+    seconds = time.perf_counter() - start
+    return {**stats, "seconds": seconds, "events_per_second": stats["events"] / seconds if seconds else 0.0}
+
+
+def parse_hour(
+        value: str) -> datetime.datetime:
+    """
+    Parse a command line time: an ISO date, or date and hour such as '2024-01-31T13'.
+
+    Args:
+        value (str): The time, in UTC.
+
+    Returns:
+        datetime.datetime: The time as a naive datetime.
+    """
+    return datetime.datetime.fromisoformat(value if "T" not in value or ":" in value else value + ":00")
+
+
+if __name__ == "__main__":
+    import argparse
+    from kafka import KafkaProducer
+    from object_store import open_store
+
+    parser = argparse.ArgumentParser(description="Replay the S3 sink's archive back into Kafka")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("--start", type=parse_hour, help="First hour to replay (UTC), e.g. 2024-01-31T13")
+    parser.add_argument("--end", type=parse_hour, help="Hour to stop before (UTC)")
+    parser.add_argument("--bucket", help="Bucket to read; defaults to $AWS_BUCKET_NAME")
+    parser.add_argument("--endpoint", default="http://minio:9000")
+    parser.add_argument("--directory", help="Replay from a local copy of the bucket instead")
+    parser.add_argument("--prefix", default="/", help="What object keys start with before the topic")
+    parser.add_argument("--target_topic", help="Produce everything to this topic instead of the archived ones")
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Objects fetched in parallel")
+    parser.add_argument("--rate", type=float, help="Maximum events per second")
+    parser.add_argument("--compression", choices=["gzip", "snappy", "lz4", "zstd", "none"], default="gzip")
+    parser.add_argument("--batch_size", type=int, default=1_048_576, help="Bytes per partition batch")
+    parser.add_argument("--linger_ms", type=int, default=20)
+    parser.add_argument("--without_schemas", action="store_true", help="Produce bare payloads")
+    args = parser.parse_args()
+
+    store = open_store(args.directory, args.bucket, args.endpoint)
+    objects = list_archive(store, args.topics, args.start, args.end, args.prefix)
+    print(f"{len(objects)} objects, {sum(archived.size for archived in objects):,} bytes")
+    producer = KafkaProducer(
+        bootstrap_servers=args.bootstrap_servers,
+        compression_type=None if args.compression == "none" else args.compression,
+        batch_size=args.batch_size,
+        linger_ms=args.linger_ms,
+        acks="all",
+        retries=5,
+        max_in_flight_requests_per_connection=1)
+    try:
+        stats = replay(store, objects, producer, args.target_topic, args.workers, args.rate,
+                       not args.without_schemas)
+    finally:
+        producer.close()
+    print(f"{stats['events']} events from {stats['objects']} objects in {stats['seconds']:.1f} s, "
+          f"{stats['events_per_second']:,.0f} events/sec")
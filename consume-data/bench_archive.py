@@ -0,0 +1,107 @@
+import gzip
+import tempfile
+import time
+from archive_reader import ArchiveReader
+from archive_replay import ArchivedObject, list_archive, read_messages, zstandard
+from envelopes import encode_envelope, synthetic_payloads
+from fake_s3 import FakeS3Server
+from object_store import LocalObjectStore, S3ObjectStore
+from typing import Any, Dict, List, Sequence
+
+CODECS = ("none", "gzip", "zstd")
+SUFFIXES = {"none": ".json", "gzip": ".json.gz", "zstd": ".json.zst"}  # as the sink names the objects of each codec
+
+
+def compress(
+        data: bytes,
+        codec: str) -> bytes:
+    """
+    Compress an object the way the sink does for a file.compression.type.
+
+    Args:
+        data (bytes): The JSON lines.
+        codec (str): 'none', 'gzip' or 'zstd'.
+
+    Returns:
+        bytes: The object as stored.
+    """
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)  # the JDK's default level
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)  # zstd-jni's default level
+    return data
+
+
+def write_archive(
+        store: Any,
+        table: str,
+        payloads: Sequence[Dict[str, Any]],
+        events_per_object: int,
+        codec: str) -> None:
+    """
+    Write payloads as the sink would, as JSON lines with schemas, one object per `events_per_object`.
+
+    Args:
+        store (Any): Store to write to.
+        table (str): 'users' or 'products'.
+        payloads (Sequence[Dict[str, Any]]): Change event payloads.
+        events_per_object (int): The sink's flush.size.
+        codec (str): 'none', 'gzip' or 'zstd'.
+
+    Returns:
+        None
+    """
+    for offset in range(0, len(payloads), events_per_object):
+        lines = b"\n".join(b'{"value":' + encode_envelope(table, payload) + b"}"
+                           for payload in payloads[offset:offset + events_per_object])
+        key = f"/debezium.commerce.{table}/2024-01-31/13/0000000000-{offset:020d}{SUFFIXES[codec]}"
+        store.put(key, compress(lines, codec))
+
+
+def read_sequential(
+        store: Any,
+        objects: List[ArchivedObject]) -> int:
+    """
+    Download and parse whole objects one after another, as readers did before ArchiveReader.
+
+    Args:
+        store (Any): Store holding the objects.
+        objects (List[ArchivedObject]): Objects to read.
+
+    Returns:
+        int: Number of messages read.
+    """
+    return sum(len(read_messages(store.get(archived.key))) for archived in objects)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare sink compression codecs and archive readers on a local S3")
+    parser.add_argument("-n", "--num_events", type=int, default=20_000)
+    parser.add_argument("--table", choices=["users", "products"], default="products")
+    parser.add_argument("--events_per_object", type=int, default=20, help="The sink's flush.size")
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds added to every S3 response")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Objects fetched in parallel")
+    args = parser.parse_args()
+
+    payloads = synthetic_payloads(args.num_events, args.table)
+    codecs = [codec for codec in CODECS if codec != "zstd" or zstandard is not None]
+    print(f"{args.num_events} {args.table} events, {args.events_per_object} per object, "
+          f"{args.latency * 1000:.0f} ms per request")
+    print(f"{'codec':>6} {'stored':>12} {'ratio':>6} {'sequential':>16} {f'{args.workers} workers':>16}")
+    raw = None
+    for codec in codecs:
+        with tempfile.TemporaryDirectory() as directory, FakeS3Server(directory, args.latency) as server:
+            write_archive(LocalObjectStore(directory), args.table, payloads, args.events_per_object, codec)
+            store = S3ObjectStore("commerce", server.endpoint)
+            objects = list_archive(store, [f"debezium.commerce.{args.table}"])
+            stored = sum(archived.size for archived in objects)
+            raw = raw or stored
+            start = time.perf_counter()
+            assert read_sequential(store, objects) == args.num_events
+            sequential = args.num_events / (time.perf_counter() - start)
+            stats = ArchiveReader(store, args.workers).read_all(objects)
+            assert stats["messages"] == args.num_events
+            parallel = args.num_events / stats["seconds"]
+        print(f"{codec:>6} {stored:>12,} {raw / stored:>5.1f}x {sequential:>9,.0f} ev/sec {parallel:>9,.0f} ev/sec")
@@ -0,0 +1,130 @@
+import json
+import tempfile
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, List
+from avro_events import AvroDecoder, FileSchemaRegistry, encode_avro
+from change_events import ChangeBatch, EnvelopeDecoder, decode_records, orjson
+from envelopes import encode_envelope, envelope_avro_schema, synthetic_payloads
+
+Record = namedtuple("Record", ["topic", "partition", "offset", "key", "value"])
+
+
+def synthetic_records(
+        table: str,
+        payloads: List[Dict[str, Any]],
+        registry: FileSchemaRegistry = None) -> List[Record]:
+    """
+    Encode payloads as messages of the table's topic.
+
+    Args:
+        table (str): 'users' or 'products'.
+        payloads (List[Dict[str, Any]]): Change event payloads.
+        registry (FileSchemaRegistry): Encode as Avro with schema ids from this registry.
+            Defaults to None (JSON with schemas, as the default converter writes).
+
+    Returns:
+        List[Record]: One record per payload.
+    """
+    topic = f"debezium.commerce.{table}"
+    if registry is not None:
+        schema = envelope_avro_schema(table)
+        schema_id = registry.register(schema)
+        encode = lambda payload: encode_avro(schema_id, schema, payload)
+    else:
+        encode = lambda payload: encode_envelope(table, payload)
+    return [Record(topic, 0, offset, None, encode(payload)) for offset, payload in enumerate(payloads)]
+
+
+def decode_naive(
+        records: List[Record],
+        loads: Callable = json.loads) -> int:
+    """
+    Decode each message in full, schema included, and collect the same fields row by row.
+
+    Args:
+        records (List[Record]): Messages of one topic.
+        loads (Callable): JSON parser. Defaults to json.loads.
+
+    Returns:
+        int: Number of decoded events.
+    """
+    rows = []
+    for record in records:
+        payload = loads(record.value)["payload"]
+        rows.append((payload["op"], payload["source"]["lsn"], payload["ts_ms"],
+                     payload["before"], payload["after"]))
+    return len(rows)
+
+
+def decode_columnar(
+        records: List[Record],
+        decoder: Any = None) -> int:
+    """
+    Decode messages into a ChangeBatch.
+
+    Args:
+        records (List[Record]): Messages of one topic.
+        decoder (Any): Decoder to use. Defaults to None (a fresh EnvelopeDecoder).
+
+    Returns:
+        int: Number of decoded events.
+    """
+    batch: ChangeBatch = decode_records(decoder or EnvelopeDecoder(), records[0].topic, records)
+    return len(batch)
+
+
+def bench(
+        decode: Callable[[List[Record]], int],
+        records: List[Record],
+        repeat: int = 3) -> float:
+    """
+    Time a decoder on the records, best of `repeat` runs.
+
+    Args:
+        decode (Callable[[List[Record]], int]): Decodes all records and returns the event count.
+        records (List[Record]): Messages of one topic.
+        repeat (int): Number of timed runs. Defaults to 3.
+
+    Returns:
+        float: Events per second.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(records)
+        best = min(best, time.perf_counter() - start)
+    return len(records) / best
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare Debezium envelope decoders and encodings")
+    parser.add_argument("-n", "--num_events", type=int, default=100_000)
+    parser.add_argument("--table", choices=["users", "products"], default="users")
+    args = parser.parse_args()
+
+    payloads = synthetic_payloads(args.num_events, args.table)
+    json_records = synthetic_records(args.table, payloads)
+    with tempfile.TemporaryDirectory() as directory:
+        registry = FileSchemaRegistry(directory)
+        avro_records = synthetic_records(args.table, payloads, registry)
+        candidates = [("json.loads per message", decode_naive, json_records)]
+        if orjson is not None:
+            candidates.append((
+                "orjson.loads per message", lambda records: decode_naive(records, orjson.loads), json_records))
+        candidates += [
+            ("columnar, schema skipped", decode_columnar, json_records),
+            ("columnar, avro", lambda records: decode_columnar(records, AvroDecoder(registry)), avro_records),
+        ]
+
+        print(f"{args.num_events} {args.table} events")
+        for name, records in (("json", json_records), ("avro", avro_records)):
+            size = sum(len(record.value) for record in records) / len(records)
+            print(f"{name:>26}: {size:>12,.0f} bytes/event")
+        baseline = None
+        for name, decode, records in candidates:
+            rate = bench(decode, records)
+            baseline = baseline or rate
+            print(f"{name:>26}: {rate:>12,.0f} events/sec ({rate / baseline:.1f}x)")
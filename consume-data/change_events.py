@@ -0,0 +1,508 @@
+import json
+import time
+import numpy as np
+from kafka import ConsumerRebalanceListener, KafkaConsumer, TopicPartition
+from kafka.structs import OffsetAndMetadata
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library parser
+    orjson = None
+
+loads = orjson.loads if orjson is not None else json.loads
+
+PAYLOAD_KEY = b',"payload":'
+MISSING = -1  # stands in for null lsn/txId in the integer columns
+
+
+class EnvelopeDecoder:
+    """
+    Extracts the payload of Debezium JSON envelopes without re-parsing their schema.
+
+    With schemas enabled, Kafka Connect's JsonConverter writes every message
+    as {"schema": ..., "payload": ...}, and the schema part is byte-identical
+    for all messages of a topic until the table changes. The first message of
+    a topic is parsed in full and its bytes up to the payload are remembered;
+    later messages that start with the same bytes only have their payload
+    parsed. Anything else (a new schema, schemas disabled) is parsed in full.
+    """
+
+    def __init__(self) -> None:
+        """Create a decoder with no known schemas."""
+        self.prefixes: Dict[str, bytes] = {}
+        self.schemas: Dict[str, Dict[str, Any]] = {}
+        self.full_parses = 0
+
+    def payload(
+            self,
+            topic: str,
+            value: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        """
+        Return the payload of one message.
+
+        Args:
+            topic (str): Topic the message came from.
+            value (Optional[bytes]): The raw message value; None for a tombstone.
+
+        Returns:
+            Optional[Dict[str, Any]]: The Debezium payload (before, after, source, op, ts_ms),
+                or None for a tombstone.
+        """
+        if value is None:
+            return None
+        prefix = self.prefixes.get(topic)
+        if prefix is not None and value.startswith(prefix) and value.endswith(b"}"):
+            return loads(value[len(prefix):-1])
+        return self._parse_full(topic, value)
+
+    def payloads(
+            self,
+            topic: str,
+            values: Sequence[Optional[bytes]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Return the payloads of a batch of messages.
+
+        Args:
+            topic (str): Topic the messages came from.
+            values (Sequence[Optional[bytes]]): Raw message values; None for tombstones.
+
+        Returns:
+            List[Optional[Dict[str, Any]]]: One payload per value, None for tombstones.
+        """
+        return [self.payload(topic, value) for value in values]
+
+    def _parse_full(
+            self,
+            topic: str,
+            value: bytes) -> Dict[str, Any]:
+        """
+        Parse a whole message and remember its schema prefix if it can be reused.
+
+        Args:
+            topic (str): Topic the message came from.
+            value (bytes): The raw message value.
+
+        Returns:
+            Dict[str, Any]: The Debezium payload.
+        """
+        self.full_parses += 1
+        envelope = loads(value)
+        if "schema" not in envelope or "payload" not in envelope:
+            return envelope  # schemas.enable=false: the message is the payload
+        payload = envelope["payload"]
+        index = value.find(PAYLOAD_KEY)
+        if index > 0 and value.endswith(b"}"):
+            prefix = value[:index + len(PAYLOAD_KEY)]
+            try:
+                reusable = loads(value[len(prefix):-1]) == payload
+            except ValueError:
+                reusable = False
+            if reusable:
+                self.prefixes[topic] = prefix
+                self.schemas[topic] = envelope["schema"]
+        return payload
+
+
+class ChangeBatch:
+    """
+    Change events of one topic in columnar form.
+
+    `op` and the metadata columns are NumPy arrays, so a batch can be
+    filtered with masks such as `batch.op == "d"`. `before` and `after` map
+    each table column to a list with one value per event, None where the
+    event has no row image (e.g. `after` of a delete).
+    """
+
+    META = ("lsn", "ts_ms", "source_ts_ms", "tx_id", "partition", "offset", "kafka_ts_ms")
+
+    def __init__(
+            self,
+            topic: str,
+            op: np.ndarray,
+            before: Dict[str, List[Any]],
+            after: Dict[str, List[Any]],
+            **meta: np.ndarray) -> None:
+        """
+        Wrap already-built columns.
+
+        Args:
+            topic (str): Topic the events came from.
+            op (np.ndarray): Debezium operation per event: 'c', 'u', 'd' or 'r'.
+            before (Dict[str, List[Any]]): Columns of the row images before each change.
+            after (Dict[str, List[Any]]): Columns of the row images after each change.
+            **meta (np.ndarray): One int64 array per name in META; -1 where unknown.
+        """
+        self.topic = topic
+        self.op = op
+        self.before = before
+        self.after = after
+        for name in self.META:
+            setattr(self, name, meta[name])
+
+    def __len__(self) -> int:
+        return len(self.op)
+
+    @classmethod
+    def from_payloads(
+            cls,
+            topic: str,
+            payloads: Sequence[Dict[str, Any]],
+            partitions: Optional[Sequence[int]] = None,
+            offsets: Optional[Sequence[int]] = None,
+            timestamps: Optional[Sequence[int]] = None) -> "ChangeBatch":
+        """
+        Build a batch from decoded payloads.
+
+        Args:
+            topic (str): Topic the events came from.
+            payloads (Sequence[Dict[str, Any]]): Debezium payloads, tombstones already removed.
+            partitions (Optional[Sequence[int]]): Partition of each event. Defaults to None (-1).
+            offsets (Optional[Sequence[int]]): Offset of each event. Defaults to None (-1).
+            timestamps (Optional[Sequence[int]]): Kafka record timestamp of each event, in epoch
+                milliseconds. Defaults to None (-1).
+
+        Returns:
+            ChangeBatch: The columnar batch.
+        """
+        n = len(payloads)
+        ops, lsns, ts, source_ts, tx_ids = [], [], [], [], []
+        images = {"before": {}, "after": {}}
+        for i, payload in enumerate(payloads):
+            source = payload["source"]
+            ops.append(payload["op"])
+            lsn = source.get("lsn")
+            lsns.append(MISSING if lsn is None else lsn)
+            ts.append(payload.get("ts_ms") or MISSING)
+            source_ts.append(source.get("ts_ms") or MISSING)
+            tx_id = source.get("txId")
+            tx_ids.append(MISSING if tx_id is None else tx_id)
+            for side, columns in images.items():
+                row = payload[side]
+                if row:
+                    for name, value in row.items():
+                        column = columns.get(name)
+                        if column is None:
+                            column = columns[name] = [None] * n
+                        column[i] = value
+
+        return cls(
+            topic,
+            np.array(ops, dtype="U1"),
+            images["before"],
+            images["after"],
+            lsn=np.array(lsns, dtype=np.int64),
+            ts_ms=np.array(ts, dtype=np.int64),
+            source_ts_ms=np.array(source_ts, dtype=np.int64),
+            tx_id=np.array(tx_ids, dtype=np.int64),
+            partition=np.array(partitions if partitions is not None else [MISSING] * n, dtype=np.int64),
+            offset=np.array(offsets if offsets is not None else [MISSING] * n, dtype=np.int64),
+            kafka_ts_ms=np.array(timestamps if timestamps is not None else [MISSING] * n, dtype=np.int64),
+        )
+
+    def select(
+            self,
+            mask: np.ndarray) -> "ChangeBatch":
+        """
+        Return the events where mask is True, as a new batch.
+
+        Args:
+            mask (np.ndarray): One bool per event.
+
+        Returns:
+            ChangeBatch: The selected events.
+        """
+        positions = np.flatnonzero(mask).tolist()
+        images = [{name: [values[i] for i in positions] for name, values in side.items()}
+                  for side in (self.before, self.after)]
+        return ChangeBatch(
+            self.topic, self.op[mask], images[0], images[1],
+            **{name: getattr(self, name)[mask] for name in self.META})
+
+    def rows(self, side: str = "after") -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over one side's row images as dictionaries.
+
+        Args:
+            side (str): 'before' or 'after'. Defaults to 'after'.
+
+        Yields:
+            Dict[str, Any]: One row image per event; empty for events without one.
+        """
+        columns = getattr(self, side)
+        for i in range(len(self)):
+            yield {name: values[i] for name, values in columns.items() if values[i] is not None}
+
+
+def decode_records(
+        decoder: EnvelopeDecoder,
+        topic: str,
+        records: Iterable[Any]) -> ChangeBatch:
+    """
+    Decode Kafka records of one topic into a ChangeBatch, skipping tombstones.
+
+    Args:
+        decoder (EnvelopeDecoder): Decoder holding the topic's cached schema prefix, or
+            any other decoder with a `payloads(topic, values)` method.
+        topic (str): Topic of the records.
+        records (Iterable[Any]): Records with value, partition, offset and optionally timestamp
+            attributes, e.g. kafka-python ConsumerRecords.
+
+    Returns:
+        ChangeBatch: The decoded events.
+    """
+    records = list(records)
+    decoded = decoder.payloads(topic, [record.value for record in records])
+    payloads, partitions, offsets, timestamps = [], [], [], []
+    for record, payload in zip(records, decoded):
+        if payload is not None:
+            payloads.append(payload)
+            partitions.append(record.partition)
+            offsets.append(record.offset)
+            timestamps.append(getattr(record, "timestamp", None) or MISSING)
+    return ChangeBatch.from_payloads(topic, payloads, partitions, offsets, timestamps)
+
+
+class _SeekOnAssign(ConsumerRebalanceListener):
+    """Moves newly assigned partitions to given start offsets."""
+
+    def __init__(
+            self,
+            consumer: KafkaConsumer,
+            offsets: Dict[Tuple[str, int], int]) -> None:
+        self.consumer = consumer
+        self.offsets = offsets
+
+    def on_partitions_revoked(self, revoked):
+        pass
+
+    def on_partitions_assigned(self, assigned):
+        for partition in assigned:
+            offset = self.offsets.get((partition.topic, partition.partition))
+            if offset is not None:
+                self.consumer.seek(partition, offset)
+
+
+class ChangeEventConsumer:
+    """
+    Kafka consumer that polls Debezium topics in batches and decodes them into ChangeBatches.
+
+    Offsets are not committed automatically; call `commit` once a batch has
+    been processed.
+    """
+
+    def __init__(
+            self,
+            topics: Sequence[str],
+            bootstrap_servers: Sequence[str] = ("kafka:9092",),
+            group_id: Optional[str] = None,
+            max_records: int = 5_000,
+            decoder: Optional[Any] = None,
+            start_offsets: Optional[Dict[Tuple[str, int], int]] = None,
+            consumer_factory: Callable[..., Any] = KafkaConsumer,
+            **config: Any) -> None:
+        """
+        Subscribe to the topics.
+
+        Args:
+            topics (Sequence[str]): Debezium topics, e.g. 'debezium.commerce.users'.
+            bootstrap_servers (Sequence[str]): Kafka brokers. Defaults to ('kafka:9092',).
+            group_id (Optional[str]): Consumer group; None disables offset commits. Defaults to None.
+            max_records (int): Maximum records per poll. Defaults to 5,000.
+            decoder (Optional[Any]): Turns message values into payloads, e.g. an
+                `avro_events.AvroDecoder`. Defaults to None (EnvelopeDecoder for JSON).
+            start_offsets (Optional[Dict[Tuple[str, int], int]]): Offset to start reading at per
+                (topic, partition), e.g. from a snapshot; other partitions start at the committed
+                or earliest offset. Defaults to None.
+            consumer_factory (Callable[..., Any]): Builds the client from KafkaConsumer settings, e.g.
+                `fake_broker.FakeBroker.consumer` to run without Kafka. Defaults to KafkaConsumer.
+            **config (Any): Extra KafkaConsumer settings.
+        """
+        config.setdefault("auto_offset_reset", "earliest")
+        self.consumer = consumer_factory(
+            bootstrap_servers=list(bootstrap_servers),
+            group_id=group_id,
+            enable_auto_commit=False,
+            max_poll_records=max_records,
+            **config)
+        if start_offsets and group_id is None:
+            # Without a group there are no rebalances to hook into: assign all partitions up front
+            partitions = [TopicPartition(topic, partition) for topic in topics
+                          for partition in sorted(self.consumer.partitions_for_topic(topic) or ())]
+            self.consumer.assign(partitions)
+            for partition in partitions:
+                offset = start_offsets.get((partition.topic, partition.partition))
+                if offset is not None:
+                    self.consumer.seek(partition, offset)
+        elif start_offsets:
+            self.consumer.subscribe(list(topics), listener=_SeekOnAssign(self.consumer, start_offsets))
+        else:
+            self.consumer.subscribe(list(topics))
+        self.decoder = decoder if decoder is not None else EnvelopeDecoder()
+        self.group_id = group_id
+        self.max_records = max_records
+
+    def poll(
+            self,
+            timeout_ms: int = 1_000) -> Dict[str, ChangeBatch]:
+        """
+        Fetch and decode the next batch of records.
+
+        Args:
+            timeout_ms (int): How long to wait for records. Defaults to 1,000.
+
+        Returns:
+            Dict[str, ChangeBatch]: One batch per topic that had records; empty on timeout.
+        """
+        records = self.poll_records(timeout_ms)
+        return {topic: decode_records(self.decoder, topic, records) for topic, records in records.items()}
+
+    def poll_records(
+            self,
+            timeout_ms: int = 1_000) -> Dict[str, List[Any]]:
+        """
+        Fetch the next batch of records without decoding them.
+
+        Args:
+            timeout_ms (int): How long to wait for records. Defaults to 1,000.
+
+        Returns:
+            Dict[str, List[Any]]: The records of each topic that had any, in partition
+                and offset order; empty on timeout.
+        """
+        fetched = self.consumer.poll(timeout_ms=timeout_ms, max_records=self.max_records)
+        by_topic: Dict[str, List[Any]] = {}
+        for partition in sorted(fetched, key=lambda tp: (tp.topic, tp.partition)):
+            by_topic.setdefault(partition.topic, []).extend(fetched[partition])
+        return by_topic
+
+    def batches(
+            self,
+            idle_timeout_ms: int = 1_000) -> Iterator[Dict[str, ChangeBatch]]:
+        """
+        Yield batches until no records arrive for `idle_timeout_ms`.
+
+        Args:
+            idle_timeout_ms (int): Stop after an empty poll of this length. Defaults to 1,000.
+
+        Yields:
+            Dict[str, ChangeBatch]: One batch per topic that had records.
+        """
+        while True:
+            batches = self.poll(idle_timeout_ms)
+            if not batches:
+                return
+            yield batches
+
+    def pause(
+            self,
+            topics: Iterable[str]) -> None:
+        """
+        Stop fetching the given topics until they are resumed.
+
+        Args:
+            topics (Iterable[str]): Topics to pause.
+
+        Returns:
+            None
+        """
+        topics = set(topics)
+        self.consumer.pause(*[partition for partition in self.consumer.assignment() if partition.topic in topics])
+
+    def resume(
+            self,
+            topics: Iterable[str]) -> None:
+        """
+        Fetch the given topics again after `pause`.
+
+        Args:
+            topics (Iterable[str]): Topics to resume.
+
+        Returns:
+            None
+        """
+        topics = set(topics)
+        self.consumer.resume(*[partition for partition in self.consumer.paused() if partition.topic in topics])
+
+    def assignment(self) -> Set[Tuple[str, int]]:
+        """
+        Return the partitions currently assigned to this consumer.
+
+        Returns:
+            Set[Tuple[str, int]]: (topic, partition) pairs.
+        """
+        return {(partition.topic, partition.partition) for partition in self.consumer.assignment()}
+
+    def commit(
+            self,
+            offsets: Optional[Dict[Tuple[str, int], int]] = None) -> None:
+        """
+        Commit the offsets of everything returned by `poll` so far, or the given offsets.
+
+        Args:
+            offsets (Optional[Dict[Tuple[str, int], int]]): Next offset to read per (topic, partition).
+                Defaults to None (the current positions).
+
+        Returns:
+            None
+        """
+        if offsets is None:
+            self.consumer.commit()
+            return
+        self.consumer.commit({TopicPartition(topic, partition): OffsetAndMetadata(offset, None)
+                              for (topic, partition), offset in offsets.items()})
+
+    def close(self) -> None:
+        """
+        Close the underlying consumer.
+
+        Returns:
+            None
+        """
+        self.consumer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Consume Debezium topics in columnar batches")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("-g", "--group_id", help="Consumer group to commit offsets to")
+    parser.add_argument("--max_records", type=int, default=5_000)
+    parser.add_argument("--converter", choices=["json", "avro"], default="json", help="Converter the connector uses")
+    parser.add_argument(
+        "--schema_registry", default="http://schema-registry:8081", help="Registry URL for --converter avro")
+    parser.add_argument("--idle_timeout_ms", type=int, default=10_000, help="Stop after this long without records")
+    parser.add_argument("--dedup", action="store_true", help="Drop redelivered events on (table, lsn, id)")
+    args = parser.parse_args()
+
+    decoder = None
+    if args.converter == "avro":
+        from avro_events import AvroDecoder, HttpSchemaRegistry
+        decoder = AvroDecoder(HttpSchemaRegistry(args.schema_registry))
+    consumer = ChangeEventConsumer(args.topics, args.bootstrap_servers, args.group_id, args.max_records, decoder)
+    dedup = None
+    if args.dedup:
+        from dedup import Deduplicator
+        dedup = Deduplicator()
+    events = 0
+    start = time.perf_counter()
+    try:
+        for batches in consumer.batches(args.idle_timeout_ms):
+            for topic, batch in batches.items():
+                if dedup is not None:
+                    batch = dedup.filter(batch)
+                    if not len(batch):
+                        continue
+                ops = {str(op): int(count) for op, count in zip(*np.unique(batch.op, return_counts=True))}
+                print(f"{topic}: {len(batch)} events {ops}, lsn {batch.lsn.min()}..{batch.lsn.max()}")
+                events += len(batch)
+            if args.group_id:
+                consumer.commit()
+    finally:
+        consumer.close()
+    print(f"{events} events, {events / (time.perf_counter() - start):,.0f} events/sec")
+    if dedup is not None:
+        print(json.dumps(dedup.stats()))
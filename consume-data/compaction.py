@@ -0,0 +1,275 @@
+import datetime
+import hashlib
+import io
+import json
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from archive_reader import ArchiveReader
+from archive_replay import ArchivedObject, list_archive
+from change_events import MISSING, ChangeBatch
+from envelopes import TABLE_COLUMNS
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Sequence
+
+MANIFEST = "_compacted.json"
+
+# Arrow types of the Kafka Connect schema types in envelopes.TABLE_COLUMNS
+ARROW_TYPES = {"int32": pa.int32(), "int64": pa.int64(), "string": pa.string(), "float": pa.float32(),
+               "double": pa.float64(), "boolean": pa.bool_()}
+
+SORT_KEYS = [("lsn", "ascending"), ("partition", "ascending"), ("offset", "ascending")]
+
+
+def hour_prefix(
+        output: str,
+        topic: str,
+        hour: datetime.datetime) -> str:
+    """
+    Return where the compacted files of one topic and hour go.
+
+    Args:
+        output (str): Prefix of all compacted output, e.g. 'compacted/'.
+        topic (str): The topic.
+        hour (datetime.datetime): The hour.
+
+    Returns:
+        str: A Hive-style prefix, e.g. 'compacted/debezium.commerce.users/date=2024-01-31/hour=13/'.
+    """
+    return f"{output}{topic}/date={hour:%Y-%m-%d}/hour={hour:%H}/"
+
+
+def to_table(
+        batch: ChangeBatch) -> pa.Table:
+    """
+    Turn a batch of change events into a flat table.
+
+    The table has the op, the metadata of ChangeBatch.META with nulls where
+    unknown, and one before_<column> and after_<column> per table column,
+    typed from the table's schema where it is known.
+
+    Args:
+        batch (ChangeBatch): The events.
+
+    Returns:
+        pa.Table: One row per event.
+    """
+    n = len(batch)
+    types = {name: ARROW_TYPES[kind] for name, kind, _ in TABLE_COLUMNS.get(batch.topic.rsplit(".", 1)[-1], [])}
+    columns = {"op": pa.array(batch.op.tolist(), pa.string())}
+    for name in ChangeBatch.META:
+        values = getattr(batch, name)
+        columns[name] = pa.array(values, pa.int64(), mask=values == MISSING)
+    names = list(types) + sorted((set(batch.before) | set(batch.after)) - set(types))
+    for side, images in (("before", batch.before), ("after", batch.after)):
+        for name in names:
+            columns[f"{side}_{name}"] = pa.array(images.get(name, [None] * n), types.get(name))
+    return pa.table(columns)
+
+
+def flatten(
+        topic: str,
+        payloads: Sequence[Dict[str, Any]],
+        partitions: Sequence[int],
+        offsets: Sequence[int]) -> pa.Table:
+    """
+    Turn Debezium payloads into a flat table, as `to_table` does.
+
+    Args:
+        topic (str): Topic the payloads came from.
+        payloads (Sequence[Dict[str, Any]]): Debezium payloads, tombstones already removed.
+        partitions (Sequence[int]): Kafka partition of each payload.
+        offsets (Sequence[int]): Kafka offset of each payload.
+
+    Returns:
+        pa.Table: One row per payload.
+    """
+    return to_table(ChangeBatch.from_payloads(topic, payloads, partitions, offsets))
+
+
+def read_manifest(
+        store: Any,
+        prefix: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the manifest of a compacted hour.
+
+    Args:
+        store (Any): Object store holding the output.
+        prefix (str): The hour's prefix, from `hour_prefix`.
+
+    Returns:
+        Optional[Dict[str, Any]]: The manifest, or None if the hour was never compacted.
+    """
+    try:
+        return json.loads(store.get(prefix + MANIFEST))
+    except FileNotFoundError:
+        return None
+
+
+def compact_hour(
+        store: Any,
+        objects: Sequence[ArchivedObject],
+        output: str = "compacted/",
+        rows_per_file: int = 1_000_000,
+        compression: str = "zstd",
+        delete_sources: bool = False,
+        workers: int = 8) -> Optional[Dict[str, Any]]:
+    """
+    Merge the archived objects of one topic and hour into sorted Parquet files.
+
+    The hour's manifest lists the source objects already compacted and the
+    files holding them. Objects it lists are skipped, so re-running is cheap
+    and safe; new objects, e.g. ones the sink wrote late, are merged with the
+    existing files into a new set of files. The manifest is written last and
+    names the only valid files, and files it no longer names are deleted
+    afterwards, so a run that fails halfway leaves the last manifest intact.
+
+    Args:
+        store (Any): Object store holding the archive and the output.
+        objects (Sequence[ArchivedObject]): All archived objects of one topic and hour.
+        output (str): Prefix of all compacted output. Defaults to 'compacted/'.
+        rows_per_file (int): Maximum rows per Parquet file. Defaults to 1,000,000.
+        compression (str): Parquet compression codec. Defaults to 'zstd'.
+        delete_sources (bool): Delete the source objects once compacted. Defaults to False.
+        workers (int): Source objects fetched in parallel. Defaults to 8.
+
+    Returns:
+        Optional[Dict[str, Any]]: The new manifest, or None if there was nothing new to compact.
+    """
+    topic, hour = objects[0].topic, objects[0].hour
+    prefix = hour_prefix(output, topic, hour)
+    manifest = read_manifest(store, prefix)
+    done = set(manifest["sources"]) if manifest is not None else set()
+    new = [archived for archived in objects if archived.key not in done]
+    if not new:
+        return None
+
+    tables = [pq.read_table(io.BytesIO(store.get(prefix + file["key"]))) for file in manifest["files"]] \
+        if manifest is not None else []
+    payloads, partitions, offsets = [], [], []
+    for archived, offset, message in ArchiveReader(store, workers).messages(new):
+        value = message.get("value")
+        if value is None:
+            continue
+        if not isinstance(value, dict):
+            raise ValueError(f"{archived.key} holds binary values; only JSON archives can be compacted")
+        payloads.append(value["payload"] if "schema" in value and "payload" in value else value)
+        partitions.append(archived.partition)
+        offsets.append(offset)
+    if payloads:
+        tables.append(flatten(topic, payloads, partitions, offsets))
+    table = pa.concat_tables(tables, promote_options="default").sort_by(SORT_KEYS) if tables else None
+
+    sources = sorted(done | {archived.key for archived in new})
+    version = hashlib.sha1("\n".join(sources).encode()).hexdigest()[:8]
+    files = []
+    for i, start in enumerate(range(0, len(table) if table is not None else 0, rows_per_file)):
+        part = table.slice(start, rows_per_file)
+        buffer = io.BytesIO()
+        pq.write_table(part, buffer, compression=compression)
+        key = f"part-{i:05d}-{version}.parquet"
+        store.put(prefix + key, buffer.getvalue())
+        lsns, timestamps = part.column("lsn"), part.column("source_ts_ms")
+        files.append({"key": key, "rows": len(part), "bytes": buffer.tell(),
+                      "min_lsn": pc.min(lsns).as_py(), "max_lsn": pc.max(lsns).as_py(),
+                      "min_ts_ms": pc.min(timestamps).as_py(), "max_ts_ms": pc.max(timestamps).as_py()})
+
+    previous_bytes = manifest["source_bytes"] if manifest is not None else 0
+    updated = {
+        "topic": topic,
+        "hour": hour.isoformat(),
+        "sources": sources,
+        "source_bytes": previous_bytes + sum(archived.size for archived in new),
+        "rows": sum(file["rows"] for file in files),
+        "files": files,
+        "compacted_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    store.put(prefix + MANIFEST, json.dumps(updated, indent=2).encode())
+
+    current = {file["key"] for file in files}
+    for file in manifest["files"] if manifest is not None else []:
+        if file["key"] not in current:
+            store.delete(prefix + file["key"])
+    if delete_sources:
+        for archived in objects:
+            store.delete(archived.key)
+    return updated
+
+
+def compact(
+        store: Any,
+        topics: Sequence[str],
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        prefix: str = "/",
+        output: str = "compacted/",
+        rows_per_file: int = 1_000_000,
+        compression: str = "zstd",
+        delete_sources: bool = False,
+        now: Optional[datetime.datetime] = None,
+        workers: int = 8) -> List[Dict[str, Any]]:
+    """
+    Compact every finished hour of the archive in a time range.
+
+    The current hour is left alone, as the sink is still writing to it.
+
+    Args:
+        store (Any): Object store holding the archive and the output.
+        topics (Sequence[str]): Topics to compact.
+        start (Optional[datetime.datetime]): First hour, in UTC. Defaults to None (all).
+        end (Optional[datetime.datetime]): Hour to stop before, in UTC. Defaults to None (the current hour).
+        prefix (str): What archive keys start with before the topic. Defaults to '/'.
+        output (str): Prefix of all compacted output. Defaults to 'compacted/'.
+        rows_per_file (int): Maximum rows per Parquet file. Defaults to 1,000,000.
+        compression (str): Parquet compression codec. Defaults to 'zstd'.
+        delete_sources (bool): Delete the source objects once compacted. Defaults to False.
+        now (Optional[datetime.datetime]): Current time in UTC. Defaults to None (the clock).
+        workers (int): Source objects fetched in parallel. Defaults to 8.
+
+    Returns:
+        List[Dict[str, Any]]: The manifests of the hours that were (re)compacted.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    end = min(end, current_hour) if end is not None else current_hour
+    objects = list_archive(store, topics, start, end, prefix)
+    manifests = []
+    for _, hour_objects in groupby(sorted(objects, key=lambda archived: (archived.topic, archived.hour)),
+                                   key=lambda archived: (archived.topic, archived.hour)):
+        manifest = compact_hour(store, list(hour_objects), output, rows_per_file, compression, delete_sources,
+                                workers)
+        if manifest is not None:
+            manifests.append(manifest)
+    return manifests
+
+
+if __name__ == "__main__":
+    import argparse
+    from archive_replay import parse_hour
+    from object_store import open_store
+
+    parser = argparse.ArgumentParser(description="Compact the S3 sink's small JSON objects into Parquet per hour")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("--start", type=parse_hour, help="First hour to compact (UTC), e.g. 2024-01-31T13")
+    parser.add_argument("--end", type=parse_hour, help="Hour to stop before (UTC); at most the current hour")
+    parser.add_argument("--bucket", help="Bucket to compact; defaults to $AWS_BUCKET_NAME")
+    parser.add_argument("--endpoint", default="http://minio:9000")
+    parser.add_argument("--directory", help="Compact a local copy of the bucket instead")
+    parser.add_argument("--prefix", default="/", help="What object keys start with before the topic")
+    parser.add_argument("-o", "--output", default="compacted/", help="Prefix to write the Parquet files under")
+    parser.add_argument("--rows_per_file", type=int, default=1_000_000)
+    parser.add_argument("--compression", choices=["zstd", "snappy", "gzip", "none"], default="zstd")
+    parser.add_argument("--delete_sources", action="store_true", help="Delete the JSON objects once compacted")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Source objects fetched in parallel")
+    args = parser.parse_args()
+
+    store = open_store(args.directory, args.bucket, args.endpoint)
+    manifests = compact(store, args.topics, args.start, args.end, args.prefix, args.output, args.rows_per_file,
+                        args.compression, args.delete_sources, workers=args.workers)
+    for manifest in manifests:
+        size = sum(file["bytes"] for file in manifest["files"])
+        print(f"{manifest['topic']} {manifest['hour']}: {len(manifest['sources'])} objects, "
+              f"{manifest['source_bytes']:,} bytes -> {len(manifest['files'])} files, {size:,} bytes, "
+              f"{manifest['rows']} rows")
+    print(f"{len(manifests)} hours compacted")
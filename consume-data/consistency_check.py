@@ -0,0 +1,418 @@
+import hashlib
+import os
+import time
+import numpy as np
+import psycopg2
+from archive_reader import ArchiveReader
+from archive_replay import list_archive
+from change_events import ChangeBatch
+from decimal import Decimal
+from envelopes import TABLE_COLUMNS
+from materializer import Materializer, TableState
+from psycopg2.extensions import connection
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+POSTGRES_USER = os.getenv("POSTGRES_USER")
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+POSTGRES_HOSTNAME = os.getenv("POSTGRES_HOST")
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+SCHEMA = os.getenv("DB_SCHEMA", "commerce")
+
+SEPARATOR = "\x1f"  # between the columns of a row's canonical text
+NULL = "\\N"
+MASK64 = (1 << 64) - 1
+
+
+# Per column type: SQL expression giving the canonical text of a column, and the same in Python.
+# REAL goes through numeric, i.e. 6 significant digits, which Postgres and Python render alike.
+CANONICAL: Dict[str, Tuple[str, Callable[[Any], str]]] = {
+    "int16": ("{}::text", lambda value: str(int(value))),
+    "int32": ("{}::text", lambda value: str(int(value))),
+    "int64": ("{}::text", lambda value: str(int(value))),
+    "string": ("{}", str),
+    "float": ("{}::numeric::text", lambda value: format(Decimal(format(float(np.float32(value)), ".6g")), "f")),
+}
+
+
+def row_hash(
+        values: Sequence[Any],
+        kinds: Sequence[str]) -> int:
+    """
+    Hash a row the same way `PostgresRanges` does in SQL.
+
+    Args:
+        values (Sequence[Any]): Column values, None for NULL.
+        kinds (Sequence[str]): Kafka Connect type of each column.
+
+    Returns:
+        int: First 64 bits of the MD5 of the row's canonical text, as an unsigned integer.
+    """
+    text = SEPARATOR.join(
+        NULL if value is None else CANONICAL[kind][1](value) for value, kind in zip(values, kinds))
+    return int(hashlib.md5(text.encode()).hexdigest()[:16], 16)
+
+
+def _canonical_column(
+        values: List[Any],
+        kind: str) -> List[str]:
+    """Canonical texts of a column's values; each distinct float is formatted once."""
+    if kind == "string":
+        return [NULL if value is None else value for value in values]
+    render = CANONICAL[kind][1]
+    if kind != "float":
+        return [NULL if value is None else render(value) for value in values]
+    rendered: Dict[Any, str] = {}
+    texts = []
+    for value in values:
+        text = rendered.get(value)
+        if text is None:
+            text = rendered[value] = NULL if value is None else render(value)
+        texts.append(text)
+    return texts
+
+
+class PostgresRanges:
+    """
+    Row counts and hashes of key ranges of a source table, computed inside Postgres.
+
+    The hash of a range is the sum, modulo 2**64, of its rows' hashes, so it
+    does not depend on row order and any range can be split into sub-ranges
+    whose hashes add up to it. Only one row per sub-range leaves the database.
+    """
+
+    def __init__(
+            self,
+            conn: str,
+            table: str,
+            columns: Sequence[tuple],
+            schema: str = SCHEMA,
+            key: str = "id") -> None:
+        """
+        Prepare the queries for a table.
+
+        Args:
+            conn (str): The database connection.
+            table (str): Table name, e.g. 'users'.
+            columns (Sequence[tuple]): (name, Kafka Connect type, optional) per column, as in
+                `envelopes.TABLE_COLUMNS`.
+            schema (str): Database schema of the table. Defaults to DB_SCHEMA or 'commerce'.
+            key (str): Integer primary key column. Defaults to 'id'.
+        """
+        self.conn = conn
+        self.queries = 0
+        texts = [f"coalesce({CANONICAL[kind][0].format(name)}, '{NULL}')" for name, kind, _ in columns]
+        text = f" || chr({ord(SEPARATOR)}) || ".join(texts)
+        self.hash = f"('x' || left(md5({text}), 16))::bit(64)::bigint::numeric"
+        self.source = f"{schema}.{table}"
+        self.key = key
+
+    def bounds(self) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Return the smallest and largest key.
+
+        Returns:
+            Tuple[Optional[int], Optional[int]]: (min, max), or (None, None) for an empty table.
+        """
+        self.queries += 1
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT min({self.key}), max({self.key}) FROM {self.source}")
+            return cur.fetchone()
+
+    def ranges(
+            self,
+            lo: int,
+            width: int,
+            parts: int) -> Dict[int, Tuple[int, int]]:
+        """
+        Count and hash `parts` consecutive ranges of `width` keys each, starting at lo.
+
+        Args:
+            lo (int): First key of the first range.
+            width (int): Keys per range.
+            parts (int): Number of ranges.
+
+        Returns:
+            Dict[int, Tuple[int, int]]: (count, hash) per range index; empty ranges are left out.
+        """
+        self.queries += 1
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"SELECT ({self.key} - %(lo)s) / %(width)s, count(*), sum({self.hash}) FROM {self.source} "
+                f"WHERE {self.key} >= %(lo)s AND {self.key} < %(hi)s GROUP BY 1",
+                {"lo": lo, "width": width, "hi": lo + width * parts})
+            return {int(part): (count, int(total) & MASK64) for part, count, total in cur.fetchall()}
+
+    def rows(
+            self,
+            lo: int,
+            hi: int) -> Dict[int, int]:
+        """
+        Hash every row with a key in lo..hi-1.
+
+        Args:
+            lo (int): First key.
+            hi (int): Key after the last one.
+
+        Returns:
+            Dict[int, int]: Row hash per key.
+        """
+        self.queries += 1
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {self.key}, {self.hash} FROM {self.source} WHERE {self.key} >= %s AND {self.key} < %s",
+                (lo, hi))
+            return {key: int(value) & MASK64 for key, value in cur.fetchall()}
+
+
+class ReplicaRanges:
+    """
+    The same counts and hashes as `PostgresRanges`, for a table rebuilt from change events.
+
+    Row hashes are computed once and kept with running sums in key order, so
+    the count and hash of any range cost two binary searches.
+    """
+
+    def __init__(
+            self,
+            table: TableState) -> None:
+        """
+        Hash every row of a materialized table.
+
+        Args:
+            table (TableState): The rebuilt table.
+        """
+        keys = np.fromiter(table.index.keys(), dtype=np.int64, count=len(table))
+        slots = np.fromiter(table.index.values(), dtype=np.int64, count=len(table))
+        order = np.argsort(keys)
+        self.keys, slots = keys[order], slots[order]
+        columns = []
+        for name, kind, _ in table.columns:
+            if name == table.key:
+                values = self.keys.tolist()
+            elif isinstance(table.data[name], np.ndarray):
+                values = table.data[name][slots].tolist()
+            else:
+                column = table.data[name]
+                values = [column[slot] for slot in slots.tolist()]
+            columns.append(_canonical_column(values, kind))
+        self.hashes = np.array(
+            [int(hashlib.md5(SEPARATOR.join(texts).encode()).hexdigest()[:16], 16) for texts in zip(*columns)],
+            dtype=np.uint64)
+        self.sums = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(self.hashes, dtype=np.uint64)])
+        self.queries = 0
+
+    def bounds(self) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Return the smallest and largest key.
+
+        Returns:
+            Tuple[Optional[int], Optional[int]]: (min, max), or (None, None) for an empty table.
+        """
+        if not len(self.keys):
+            return None, None
+        return int(self.keys[0]), int(self.keys[-1])
+
+    def ranges(
+            self,
+            lo: int,
+            width: int,
+            parts: int) -> Dict[int, Tuple[int, int]]:
+        """
+        Count and hash `parts` consecutive ranges of `width` keys each, starting at lo.
+
+        Args:
+            lo (int): First key of the first range.
+            width (int): Keys per range.
+            parts (int): Number of ranges.
+
+        Returns:
+            Dict[int, Tuple[int, int]]: (count, hash) per range index; empty ranges are left out.
+        """
+        self.queries += 1
+        edges = np.searchsorted(self.keys, lo + width * np.arange(parts + 1, dtype=np.int64))
+        counts = np.diff(edges)
+        totals = self.sums[edges[1:]] - self.sums[edges[:-1]]  # wraps modulo 2**64
+        return {part: (int(counts[part]), int(totals[part])) for part in np.flatnonzero(counts).tolist()}
+
+    def rows(
+            self,
+            lo: int,
+            hi: int) -> Dict[int, int]:
+        """
+        Hash every row with a key in lo..hi-1.
+
+        Args:
+            lo (int): First key.
+            hi (int): Key after the last one.
+
+        Returns:
+            Dict[int, int]: Row hash per key.
+        """
+        self.queries += 1
+        start, end = np.searchsorted(self.keys, [lo, hi])
+        return dict(zip(self.keys[start:end].tolist(), self.hashes[start:end].tolist()))
+
+
+def find_differences(
+        source: Any,
+        replica: Any,
+        fanout: int = 16,
+        leaf_rows: int = 256) -> Dict[str, List[int]]:
+    """
+    Find the keys whose rows differ between the source and the replica.
+
+    The key space is split into `fanout` ranges whose counts and hashes are
+    compared; only ranges that differ are split further, until they hold at
+    most `leaf_rows` rows and are compared row by row. Equal ranges cost one
+    (count, hash) pair each, so the transferred data grows with the number of
+    differences rather than with the size of the table.
+
+    Args:
+        source (Any): The source side, e.g. PostgresRanges.
+        replica (Any): The replica side, e.g. ReplicaRanges.
+        fanout (int): Sub-ranges per split. Defaults to 16.
+        leaf_rows (int): Largest range that is compared row by row. Defaults to 256.
+
+    Returns:
+        Dict[str, List[int]]: Sorted keys that are 'missing' from the replica, 'extra' in it,
+            or 'changed'.
+    """
+    differences: Dict[str, List[int]] = {"missing": [], "extra": [], "changed": []}
+    bounds = [bound for bound in source.bounds() + replica.bounds() if bound is not None]
+    if not bounds:
+        return differences
+    pending = [(min(bounds), max(bounds) + 1)]
+    while pending:
+        lo, hi = pending.pop()
+        width = -(-(hi - lo) // fanout)
+        parts = -(-(hi - lo) // width)
+        expected = source.ranges(lo, width, parts)
+        actual = replica.ranges(lo, width, parts)
+        for part in sorted(set(expected) | set(actual)):
+            source_range, replica_range = expected.get(part, (0, 0)), actual.get(part, (0, 0))
+            if source_range == replica_range:
+                continue
+            start, end = lo + part * width, min(lo + (part + 1) * width, hi)
+            if max(source_range[0], replica_range[0]) <= leaf_rows or end - start <= fanout:
+                source_rows, replica_rows = source.rows(start, end), replica.rows(start, end)
+                differences["missing"] += [key for key in source_rows if key not in replica_rows]
+                differences["extra"] += [key for key in replica_rows if key not in source_rows]
+                differences["changed"] += [key for key, value in source_rows.items()
+                                           if key in replica_rows and replica_rows[key] != value]
+            else:
+                pending.append((start, end))
+    return {kind: sorted(keys) for kind, keys in differences.items()}
+
+
+def archive_materializer(
+        store: Any,
+        topics: Sequence[str],
+        prefix: str = "/",
+        workers: int = 8,
+        batch_size: int = 10_000) -> Materializer:
+    """
+    Rebuild tables from the S3 sink's archive instead of from Kafka.
+
+    Kafka keeps change events only for its retention period, while the
+    archive keeps all of them. Each topic's objects are streamed by an
+    `ArchiveReader` in hour, partition and start offset order. Every message
+    keeps its Kafka offset, so a materializer that already holds some of
+    them skips those.
+
+    Args:
+        store (Any): Object store holding the archive, e.g. from `object_store.open_store`.
+        topics (Sequence[str]): Topics to rebuild, e.g. 'debezium.commerce.users'.
+        prefix (str): What keys start with before the topic. Defaults to '/', as in the sink's template.
+        workers (int): Objects fetched in parallel. Defaults to 8.
+        batch_size (int): Events per applied batch. Defaults to 10,000.
+
+    Returns:
+        Materializer: The rebuilt tables.
+
+    Raises:
+        ValueError: If an object holds values that are not JSON change events, e.g. Avro.
+    """
+    materializer = Materializer()
+    reader = ArchiveReader(store, workers)
+    for topic in topics:
+        payloads, partitions, offsets = [], [], []
+        for archived, offset, message in reader.messages(list_archive(store, [topic], prefix=prefix)):
+            value = message.get("value")
+            if value is None:  # tombstone
+                continue
+            if not isinstance(value, dict):
+                raise ValueError(f"{archived.key} does not hold JSON change events")
+            payloads.append(value["payload"] if "schema" in value and "payload" in value else value)
+            partitions.append(archived.partition)
+            offsets.append(offset)
+            if len(payloads) == batch_size:
+                materializer.apply(ChangeBatch.from_payloads(topic, payloads, partitions, offsets))
+                payloads, partitions, offsets = [], [], []
+        materializer.apply(ChangeBatch.from_payloads(topic, payloads, partitions, offsets))
+    return materializer
+
+
+def connect() -> connection:
+    """
+    Open a connection to the source database using the environment settings.
+
+    Returns:
+        connection: A new database connection.
+    """
+    return psycopg2.connect(
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        host=POSTGRES_HOSTNAME)
+
+
+if __name__ == "__main__":
+    import argparse
+    from change_events import ChangeEventConsumer
+    from object_store import open_store
+
+    parser = argparse.ArgumentParser(description="Compare the source tables with their replica rebuilt from Kafka")
+    parser.add_argument("--tables", nargs="+", default=["users", "products"])
+    parser.add_argument("-s", "--snapshot_file", help="Materializer snapshot to compare instead of reading Kafka")
+    parser.add_argument("--archive", action="store_true", help="Rebuild from the S3 sink's archive instead of Kafka")
+    parser.add_argument("--bucket", help="Bucket of the archive; defaults to $AWS_BUCKET_NAME")
+    parser.add_argument("--endpoint", default="http://minio:9000")
+    parser.add_argument("--directory", help="Read a local copy of the bucket instead")
+    parser.add_argument("--prefix", default="/", help="What object keys start with before the topic")
+    parser.add_argument("--topic_prefix", default="debezium", help="The connector's topic.prefix")
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("--fanout", type=int, default=16)
+    parser.add_argument("--leaf_rows", type=int, default=256)
+    parser.add_argument(
+        "--idle_timeout_ms", type=int, default=10_000, help="Stop reading Kafka after this long without records")
+    args = parser.parse_args()
+
+    topics = [f"{args.topic_prefix}.{SCHEMA}.{table}" for table in args.tables]
+    if args.snapshot_file:
+        materializer = Materializer.restore(args.snapshot_file)
+    elif args.archive:
+        materializer = archive_materializer(open_store(args.directory, args.bucket, args.endpoint), topics, args.prefix)
+    else:
+        materializer = Materializer()
+        consumer = ChangeEventConsumer(topics, args.bootstrap_servers)
+        try:
+            for batches in consumer.batches(args.idle_timeout_ms):
+                for batch in batches.values():
+                    materializer.apply(batch)
+        finally:
+            consumer.close()
+
+    conn = connect()
+    try:
+        for table in args.tables:
+            start = time.perf_counter()
+            source = PostgresRanges(conn, table, TABLE_COLUMNS[table])
+            replica = ReplicaRanges(materializer.table(table))
+            differences = find_differences(source, replica, args.fanout, args.leaf_rows)
+            found = ", ".join(f"{len(keys)} {kind}" for kind, keys in differences.items())
+            print(f"{table}: {found} ({source.queries} queries, {time.perf_counter() - start:.1f}s)")
+            for kind, keys in differences.items():
+                if keys:
+                    print(f"  {kind}: {keys[:20]}{' ...' if len(keys) > 20 else ''}")
+    finally:
+        conn.close()
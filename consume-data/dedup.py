@@ -0,0 +1,220 @@
+import hashlib
+import math
+import numpy as np
+from change_events import MISSING, ChangeBatch
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over pairs of 64-bit hashes, queried a batch at a time.
+
+    The k bit positions of an item are h1 + i * h2 (double hashing), so each
+    item is hashed only once, outside the filter.
+    """
+
+    def __init__(
+            self,
+            capacity: int,
+            error_rate: float) -> None:
+        """
+        Size an empty filter.
+
+        Args:
+            capacity (int): Items the filter is meant to hold.
+            error_rate (float): False positive rate once it holds `capacity` items.
+        """
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(
+            self,
+            h1: np.ndarray,
+            h2: np.ndarray) -> np.ndarray:
+        """Bit positions of every item, one row per item."""
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        return (h1[:, None] + steps * h2[:, None]) % np.uint64(self.size)
+
+    def contains(
+            self,
+            h1: np.ndarray,
+            h2: np.ndarray) -> np.ndarray:
+        """
+        Test items for membership.
+
+        Args:
+            h1 (np.ndarray): First uint64 hash of each item.
+            h2 (np.ndarray): Second uint64 hash of each item.
+
+        Returns:
+            np.ndarray: True where the item may have been added, False where it certainly was not.
+        """
+        positions = self._positions(h1, h2)
+        bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    def add(
+            self,
+            h1: np.ndarray,
+            h2: np.ndarray) -> None:
+        """
+        Add items.
+
+        Args:
+            h1 (np.ndarray): First uint64 hash of each item.
+            h2 (np.ndarray): Second uint64 hash of each item.
+
+        Returns:
+            None
+        """
+        positions = self._positions(h1, h2).ravel()
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+        self.count += len(h1)
+
+    def error_rate(self) -> float:
+        """
+        Estimate the current false positive rate from the share of bits set.
+
+        Returns:
+            float: Probability that an item never added tests positive.
+        """
+        fill = np.unpackbits(self.bits)[:self.size].mean()
+        return float(fill ** self.hashes)
+
+
+class Deduplicator:
+    """
+    Drops change events that were delivered before, in bounded memory.
+
+    Events are identified by (table, lsn, id). The most recent `window` keys
+    are kept exactly in an LRU; older ones are remembered by two generations
+    of Bloom filters, the older of which is dropped whenever the newer one
+    fills up, so memory stays fixed however long the stream runs.
+
+    An event whose lsn is above the highest one seen for its table cannot
+    be a redelivery. If the filters still claim to know it, that is a false
+    positive: it is passed on and counted, which measures the actual false
+    positive rate. Below that mark a filter hit is taken as a duplicate, so
+    a new event is dropped with at most the filters' false positive rate.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 1_000_000,
+            error_rate: float = 0.001,
+            window: int = 10_000) -> None:
+        """
+        Create an empty deduplicator.
+
+        Args:
+            capacity (int): Events per Bloom filter generation; redeliveries older than
+                one to two generations are not recognised. Defaults to 1,000,000.
+            error_rate (float): False positive rate of a full generation. Defaults to 0.001.
+            window (int): Most recent keys that are kept exactly. Defaults to 10,000.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window = window
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous: Optional[BloomFilter] = None
+        self.recent: "OrderedDict[Tuple[str, int, Any], None]" = OrderedDict()
+        self.high: Dict[str, int] = {}
+        self.events = 0
+        self.exact_duplicates = 0
+        self.probable_duplicates = 0
+        self.false_positives = 0
+        self.fresh_checks = 0
+
+    def _hashes(
+            self,
+            keys: List[Tuple[str, int, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Two independent 64-bit hashes per key."""
+        digests = b"".join(hashlib.blake2b(repr(key).encode(), digest_size=16).digest() for key in keys)
+        words = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+        return words[:, 0], words[:, 1] | np.uint64(1)  # an odd step visits distinct positions
+
+    def filter(
+            self,
+            batch: ChangeBatch) -> ChangeBatch:
+        """
+        Remove the events that were seen before.
+
+        Args:
+            batch (ChangeBatch): Events of one topic.
+
+        Returns:
+            ChangeBatch: The events seen for the first time, in their original order.
+        """
+        n = len(batch)
+        if not n:
+            return batch
+        table = batch.topic.rsplit(".", 1)[-1]
+        after, before = batch.after.get("id", [None] * n), batch.before.get("id", [None] * n)
+        lsns = batch.lsn.tolist()
+        keys = [(table, lsn, after[i] if after[i] is not None else before[i]) for i, lsn in enumerate(lsns)]
+        h1, h2 = self._hashes(keys)
+        known = self.current.contains(h1, h2)
+        if self.previous is not None:
+            known |= self.previous.contains(h1, h2)
+
+        keep = np.zeros(n, dtype=bool)
+        kept = set()  # the filters only learn about this batch at the end, and the window may be shorter
+        high = self.high.get(table, MISSING)
+        for i, key in enumerate(keys):
+            lsn = lsns[i]
+            if key in self.recent or key in kept:
+                if key in self.recent:
+                    self.recent.move_to_end(key)
+                self.exact_duplicates += 1
+                continue
+            if lsn != MISSING and lsn > high:
+                self.fresh_checks += 1
+                if known[i]:
+                    self.false_positives += 1
+                high = lsn
+            elif known[i]:
+                self.probable_duplicates += 1
+                continue
+            keep[i] = True
+            kept.add(key)
+            self.recent[key] = None
+            if len(self.recent) > self.window:
+                self.recent.popitem(last=False)
+        self.high[table] = high
+        self.events += n
+
+        self.current.add(h1[keep], h2[keep])
+        if self.current.count >= self.capacity:
+            self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+        return batch if keep.all() else batch.select(keep)
+
+    __call__ = filter
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report what was dropped and how reliable the filters are.
+
+        Returns:
+            Dict[str, Any]: Event and duplicate counts, the duplicate rate, the false positive
+                rate observed on events above each table's highest lsn, and the rate the
+                filters' fill predicts.
+        """
+        expected = self.current.error_rate()
+        if self.previous is not None:
+            expected = 1 - (1 - expected) * (1 - self.previous.error_rate())
+        duplicates = self.exact_duplicates + self.probable_duplicates
+        return {
+            "events": self.events,
+            "exact_duplicates": self.exact_duplicates,
+            "probable_duplicates": self.probable_duplicates,
+            "duplicate_rate": duplicates / self.events if self.events else 0.0,
+            "false_positives": self.false_positives,
+            "false_positive_rate": self.false_positives / self.fresh_checks if self.fresh_checks else 0.0,
+            "expected_false_positive_rate": expected,
+            "bloom_bytes": self.current.bits.nbytes + (self.previous.bits.nbytes if self.previous else 0),
+        }
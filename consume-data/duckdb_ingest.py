@@ -0,0 +1,206 @@
+import datetime
+import time
+import duckdb
+import pyarrow as pa
+from archive_reader import ArchiveReader
+from archive_replay import ArchivedObject, list_archive
+from compaction import flatten
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+MANIFEST_TABLE = "_ingested_objects"
+
+
+class DuckDbIngester:
+    """
+    Loads the S3 sink's archive into DuckDB incrementally.
+
+    Each topic gets a table named after its database table, holding the
+    flattened change events (see `compaction.flatten`). A manifest table
+    records every object loaded, keyed by the (topic, partition, start
+    offset) in its name. Objects and their manifest rows are inserted in one
+    transaction, so an object is never loaded twice or half.
+
+    Only the archive from the last loaded hour, less a lookback for objects
+    the sink flushed late, is listed, so a refresh costs time in proportion
+    to the new data rather than to the archive.
+    """
+
+    def __init__(
+            self,
+            connection: duckdb.DuckDBPyConnection,
+            store: Any,
+            prefix: str = "/") -> None:
+        """
+        Prepare a database for loading, creating the manifest table if needed.
+
+        Args:
+            connection (duckdb.DuckDBPyConnection): The database.
+            store (Any): Object store holding the archive, e.g. `object_store.S3ObjectStore`.
+            prefix (str): What archive keys start with before the topic. Defaults to '/'.
+        """
+        self.connection = connection
+        self.store = store
+        self.prefix = prefix
+        connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+                topic VARCHAR, "partition" INTEGER, start_offset BIGINT, key VARCHAR, hour TIMESTAMP,
+                size BIGINT, "rows" BIGINT, ingested_at TIMESTAMP, PRIMARY KEY (topic, "partition", start_offset))""")
+
+    def last_hour(
+            self,
+            topic: str) -> Optional[datetime.datetime]:
+        """
+        Return the latest hour loaded for a topic.
+
+        Args:
+            topic (str): The topic.
+
+        Returns:
+            Optional[datetime.datetime]: The hour, or None if nothing was loaded yet.
+        """
+        return self.connection.execute(
+            f"SELECT max(hour) FROM {MANIFEST_TABLE} WHERE topic = ?", [topic]).fetchone()[0]
+
+    def pending(
+            self,
+            topics: Sequence[str],
+            lookback_hours: int = 2,
+            full: bool = False) -> List[ArchivedObject]:
+        """
+        List the archived objects that are not loaded yet.
+
+        Args:
+            topics (Sequence[str]): Topics to look at.
+            lookback_hours (int): Hours before the last loaded one to list again, for objects
+                written late. Defaults to 2.
+            full (bool): List the whole archive instead. Defaults to False.
+
+        Returns:
+            List[ArchivedObject]: The new objects in hour, topic, partition and offset order.
+        """
+        objects = []
+        for topic in topics:
+            last = None if full else self.last_hour(topic)
+            start = last - datetime.timedelta(hours=lookback_hours) if last is not None else None
+            loaded: Set[Tuple[int, int]] = set(self.connection.execute(
+                f'SELECT "partition", start_offset FROM {MANIFEST_TABLE} WHERE topic = ? AND hour >= ?',
+                [topic, start or datetime.datetime.min]).fetchall())
+            objects += [archived for archived in list_archive(self.store, [topic], start, None, self.prefix)
+                        if (archived.partition, archived.start_offset) not in loaded]
+        return sorted(objects, key=lambda archived: (archived.hour, archived.topic, archived.partition,
+                                                     archived.start_offset))
+
+    def load(
+            self,
+            objects: Sequence[ArchivedObject],
+            workers: int = 8,
+            batch_objects: int = 500) -> Dict[str, float]:
+        """
+        Load objects, streaming them in parallel and inserting them in bulk.
+
+        Args:
+            objects (Sequence[ArchivedObject]): Objects to load, e.g. from `pending`.
+            workers (int): Objects fetched in parallel. Defaults to 8.
+            batch_objects (int): Objects per insert transaction. Defaults to 500.
+
+        Returns:
+            Dict[str, float]: Objects, rows and bytes loaded, and seconds taken.
+        """
+        stats = {"objects": 0, "rows": 0, "bytes": 0}
+        start = time.perf_counter()
+        reader = ArchiveReader(self.store, workers)
+        for first in range(0, len(objects), batch_objects):
+            batch = objects[first:first + batch_objects]
+            contents: Dict[str, List[Dict[str, Any]]] = {archived.key: [] for archived in batch}
+            for archived, _, message in reader.messages(batch):
+                contents[archived.key].append(message)
+            stats["rows"] += self._insert(batch, [contents[archived.key] for archived in batch])
+            stats["objects"] += len(batch)
+            stats["bytes"] += sum(archived.size for archived in batch)
+        return {**stats, "seconds": time.perf_counter() - start}
+
+    def _insert(
+            self,
+            objects: Sequence[ArchivedObject],
+            contents: Sequence[List[Dict[str, Any]]]) -> int:
+        """Insert the events of some objects and their manifest rows in one transaction."""
+        by_topic: Dict[str, Tuple[list, list, list]] = {}
+        manifest = []
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        for archived, messages in zip(objects, contents):
+            payloads, partitions, offsets = by_topic.setdefault(archived.topic, ([], [], []))
+            rows = 0
+            for i, message in enumerate(messages):
+                value = message.get("value")
+                if not isinstance(value, dict):
+                    continue  # tombstones, and binary values that need a schema registry
+                payloads.append(value["payload"] if "schema" in value and "payload" in value else value)
+                partitions.append(archived.partition)
+                offsets.append(archived.start_offset + i)
+                rows += 1
+            manifest.append((archived.topic, archived.partition, archived.start_offset, archived.key,
+                             archived.hour, archived.size, rows, now))
+
+        self.connection.begin()
+        try:
+            for topic, (payloads, partitions, offsets) in by_topic.items():
+                if payloads:
+                    self._append(topic.rsplit(".", 1)[-1], flatten(topic, payloads, partitions, offsets))
+            self.connection.executemany(f"INSERT INTO {MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", manifest)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return sum(row[6] for row in manifest)
+
+    def _append(
+            self,
+            table: str,
+            rows: pa.Table) -> None:
+        """Append rows to a table, creating it or adding columns it lacks."""
+        self.connection.register("incoming", rows)
+        try:
+            columns = {name: kind for name, kind, *_ in self.connection.execute(
+                "DESCRIBE SELECT * FROM incoming").fetchall()}
+            existing = {row[0] for row in self.connection.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [table]).fetchall()}
+            if not existing:
+                self.connection.execute(f'CREATE TABLE "{table}" AS SELECT * FROM incoming')
+                return
+            for name, kind in columns.items():
+                if name not in existing:
+                    self.connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {kind}')
+            self.connection.execute(f'INSERT INTO "{table}" BY NAME SELECT * FROM incoming')
+        finally:
+            self.connection.unregister("incoming")
+
+
+if __name__ == "__main__":
+    import argparse
+    from object_store import open_store
+
+    parser = argparse.ArgumentParser(description="Load new objects of the S3 sink's archive into DuckDB")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("-d", "--database", default="commerce.duckdb", help="DuckDB database file")
+    parser.add_argument("--bucket", help="Bucket to read; defaults to $AWS_BUCKET_NAME")
+    parser.add_argument("--endpoint", default="http://minio:9000")
+    parser.add_argument("--directory", help="Read a local copy of the bucket instead")
+    parser.add_argument("--prefix", default="/", help="What object keys start with before the topic")
+    parser.add_argument("--lookback_hours", type=int, default=2, help="Hours before the last loaded one to recheck")
+    parser.add_argument("--full", action="store_true", help="List the whole archive, not only recent hours")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Objects fetched in parallel")
+    parser.add_argument("--batch_objects", type=int, default=500, help="Objects per insert transaction")
+    args = parser.parse_args()
+
+    connection = duckdb.connect(args.database)
+    try:
+        ingester = DuckDbIngester(connection, open_store(args.directory, args.bucket, args.endpoint), args.prefix)
+        start = time.perf_counter()
+        objects = ingester.pending(args.topics, args.lookback_hours, args.full)
+        listed = time.perf_counter() - start
+        stats = ingester.load(objects, args.workers, args.batch_objects)
+    finally:
+        connection.close()
+    print(f"{stats['objects']} new objects, {stats['rows']} rows, {stats['bytes']:,} bytes: "
+          f"listed in {listed:.1f} s, loaded in {stats['seconds']:.1f} s")
@@ -0,0 +1,231 @@
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+# Column types of the commerce tables, as Kafka Connect schema types (see postgres/init.sql)
+TABLE_COLUMNS = {
+    "users": [("id", "int32", False), ("username", "string", False), ("email_address", "string", False)],
+    "products": [
+        ("id", "int32", False), ("name", "string", False), ("description", "string", True), ("price", "float", False)],
+    "heartbeat": [("id", "int32", False), ("ts_ms", "int64", False)],
+}
+
+SOURCE_FIELDS = [
+    ("version", "string", False), ("connector", "string", False), ("name", "string", False),
+    ("ts_ms", "int64", False), ("snapshot", "string", True), ("db", "string", False),
+    ("sequence", "string", True), ("schema", "string", False), ("table", "string", False),
+    ("txId", "int64", True), ("lsn", "int64", True), ("xmin", "int64", True),
+]
+
+
+def _fields(
+        columns: List[tuple]) -> List[Dict[str, Any]]:
+    """Kafka Connect field definitions for (name, type, optional) tuples."""
+    return [{"type": kind, "optional": optional, "field": name} for name, kind, optional in columns]
+
+
+def envelope_schema(
+        table: str,
+        prefix: str = "debezium",
+        schema: str = "commerce") -> Dict[str, Any]:
+    """
+    Return the Kafka Connect schema Debezium attaches to change events of a commerce table.
+
+    Args:
+        table (str): 'users' or 'products'.
+        prefix (str): The connector's topic.prefix. Defaults to 'debezium'.
+        schema (str): Database schema of the table. Defaults to 'commerce'.
+
+    Returns:
+        Dict[str, Any]: The envelope schema.
+    """
+    name = f"{prefix}.{schema}.{table}"
+    row = {"type": "struct", "fields": _fields(TABLE_COLUMNS[table]), "optional": True, "name": f"{name}.Value"}
+    return {
+        "type": "struct",
+        "fields": [
+            {**row, "field": "before"},
+            {**row, "field": "after"},
+            {"type": "struct", "fields": _fields(SOURCE_FIELDS), "optional": False,
+             "name": "io.debezium.connector.postgresql.Source", "field": "source"},
+            {"type": "string", "optional": False, "field": "op"},
+            {"type": "int64", "optional": True, "field": "ts_ms"},
+        ],
+        "optional": False,
+        "name": f"{name}.Envelope",
+        "version": 1,
+    }
+
+
+AVRO_TYPES = {"int32": "int", "int64": "long", "string": "string", "float": "float"}
+
+
+def _avro_fields(
+        columns: List[tuple]) -> List[Dict[str, Any]]:
+    """Avro field definitions for (name, type, optional) tuples."""
+    fields = []
+    for name, kind, optional in columns:
+        if optional:
+            fields.append({"name": name, "type": ["null", AVRO_TYPES[kind]], "default": None})
+        else:
+            fields.append({"name": name, "type": AVRO_TYPES[kind]})
+    return fields
+
+
+def envelope_avro_schema(
+        table: str,
+        prefix: str = "debezium",
+        schema: str = "commerce") -> Dict[str, Any]:
+    """
+    Return the Avro schema the AvroConverter registers for change events of a commerce table.
+
+    Args:
+        table (str): 'users' or 'products'.
+        prefix (str): The connector's topic.prefix. Defaults to 'debezium'.
+        schema (str): Database schema of the table. Defaults to 'commerce'.
+
+    Returns:
+        Dict[str, Any]: The Avro record schema of the envelope.
+    """
+    namespace = f"{prefix}.{schema}.{table}"
+    value = {"type": "record", "name": "Value", "namespace": namespace, "fields": _avro_fields(TABLE_COLUMNS[table])}
+    return {
+        "type": "record",
+        "name": "Envelope",
+        "namespace": namespace,
+        "fields": [
+            {"name": "before", "type": ["null", value], "default": None},
+            {"name": "after", "type": ["null", "Value"], "default": None},
+            {"name": "source", "type": {
+                "type": "record", "name": "Source", "namespace": "io.debezium.connector.postgresql",
+                "fields": _avro_fields(SOURCE_FIELDS)}},
+            {"name": "op", "type": "string"},
+            {"name": "ts_ms", "type": ["null", "long"], "default": None},
+        ],
+    }
+
+
+def change_event(
+        table: str,
+        op: str,
+        before: Optional[Dict[str, Any]],
+        after: Optional[Dict[str, Any]],
+        lsn: int,
+        tx_id: int,
+        ts_ms: int,
+        schema: str = "commerce",
+        commit_lsn: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build the payload of one Debezium change event.
+
+    Args:
+        table (str): 'users' or 'products'.
+        op (str): 'c', 'u', 'd' or 'r'.
+        before (Optional[Dict[str, Any]]): Row before the change.
+        after (Optional[Dict[str, Any]]): Row after the change.
+        lsn (int): Log sequence number of the change.
+        tx_id (int): Id of the source transaction.
+        ts_ms (int): Commit time in epoch milliseconds.
+        schema (str): Database schema of the table. Defaults to 'commerce'.
+        commit_lsn (Optional[int]): Last committed LSN, the first element of source.sequence.
+            Defaults to None.
+
+    Returns:
+        Dict[str, Any]: The payload.
+    """
+    return {
+        "before": before,
+        "after": after,
+        "source": {
+            "version": "2.4.0.Final", "connector": "postgresql", "name": "debezium", "ts_ms": ts_ms,
+            "snapshot": "false", "db": "cdc-demo-db", "schema": schema,
+            "sequence": json.dumps([None if commit_lsn is None else str(commit_lsn), str(lsn)], separators=(",", ":")),
+            "table": table, "txId": tx_id, "lsn": lsn, "xmin": None,
+        },
+        "op": op,
+        "ts_ms": ts_ms + 5,
+    }
+
+
+def synthetic_payloads(
+        num_events: int,
+        table: str = "users",
+        seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Build Debezium change event payloads for a commerce table.
+
+    Roughly 85% inserts, 10% updates and 5% deletes, with full before images
+    as produced by REPLICA IDENTITY FULL.
+
+    Args:
+        num_events (int): Number of events.
+        table (str): 'users' or 'products'. Defaults to 'users'.
+        seed (int): Seed for the operation mix. Defaults to 42.
+
+    Returns:
+        List[Dict[str, Any]]: The payloads.
+    """
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(num_events):
+        id = i + 1
+        if table == "users":
+            row = {"id": id, "username": f"user{id}", "email_address": f"user{id}@example.com"}
+        else:
+            row = {"id": id, "name": f"Product {id}", "description": "Lorem ipsum dolor sit amet. " * 4,
+                   "price": float(rng.randint(1, 4096)) / 4}
+        draw = rng.random()
+        if draw < 0.85:
+            op, before, after = "c", None, row
+        elif draw < 0.95:
+            op, before, after = "u", row, {**row, "id": id}
+        else:
+            op, before, after = "d", row, None
+        payloads.append(change_event(table, op, before, after, lsn=30_000_000 + 64 * i, tx_id=700 + i,
+                                     ts_ms=1_700_000_000_000 + i))
+    return payloads
+
+
+def encode_envelope(
+        table: str,
+        payload: Dict[str, Any],
+        schemas: bool = True,
+        prefix: str = "debezium") -> bytes:
+    """
+    Serialise a payload the way Kafka Connect's JsonConverter does.
+
+    Args:
+        table (str): 'users' or 'products'.
+        payload (Dict[str, Any]): The change event payload.
+        schemas (bool): Wrap the payload with its schema, as with schemas.enable=true. Defaults to True.
+        prefix (str): The connector's topic.prefix. Defaults to 'debezium'.
+
+    Returns:
+        bytes: The message value.
+    """
+    message = {"schema": envelope_schema(table, prefix), "payload": payload} if schemas else payload
+    return json.dumps(message, separators=(",", ":")).encode()
+
+
+def encode_key(
+        table: str,
+        id: int,
+        schemas: bool = True,
+        prefix: str = "debezium") -> bytes:
+    """
+    Serialise the message key Debezium writes for a row, i.e. its primary key.
+
+    Args:
+        table (str): 'users' or 'products'.
+        id (int): Primary key of the row.
+        schemas (bool): Wrap the key with its schema, as with schemas.enable=true. Defaults to True.
+        prefix (str): The connector's topic.prefix. Defaults to 'debezium'.
+
+    Returns:
+        bytes: The message key.
+    """
+    payload = {"id": id}
+    schema = {"type": "struct", "fields": _fields(TABLE_COLUMNS[table][:1]), "optional": False,
+              "name": f"{prefix}.commerce.{table}.Key"}
+    message = {"schema": schema, "payload": payload} if schemas else payload
+    return json.dumps(message, separators=(",", ":")).encode()
@@ -0,0 +1,465 @@
+import random
+import threading
+import time
+import zlib
+from collections import namedtuple
+from envelopes import encode_envelope, encode_key, synthetic_payloads
+from kafka import TopicPartition
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# The fields of kafka-python's ConsumerRecord that the consumers read
+FakeRecord = namedtuple("FakeRecord", ["topic", "partition", "offset", "timestamp", "key", "value"])
+
+
+class FakeBroker:
+    """
+    In-process stand-in for a Kafka cluster: topics, partitions, offsets and consumer groups.
+
+    Thread-safe, so producers and consumers can run on separate threads.
+    Consumers in a group split the partitions of their topics like the
+    range assignor, rebalancing whenever a member joins or leaves; consumers
+    without a group read every partition.
+    """
+
+    def __init__(self) -> None:
+        """
+        Create a broker without topics.
+        """
+        self.topics: Dict[str, List[List[FakeRecord]]] = {}
+        self.groups: Dict[str, List["FakeConsumer"]] = {}
+        self.committed: Dict[str, Dict[TopicPartition, int]] = {}
+        self.changed = threading.Condition()
+        self.round_robin = 0
+
+    def create_topic(
+            self,
+            topic: str,
+            partitions: int = 1) -> None:
+        """
+        Create a topic, if it does not exist yet.
+
+        Args:
+            topic (str): Name of the topic.
+            partitions (int): Number of partitions. Defaults to 1.
+
+        Returns:
+            None
+        """
+        with self.changed:
+            self.topics.setdefault(topic, [[] for _ in range(partitions)])
+
+    def produce(
+            self,
+            topic: str,
+            value: Optional[bytes],
+            key: Optional[bytes] = None,
+            partition: Optional[int] = None,
+            timestamp: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Append a record to a topic, creating the topic with one partition if needed.
+
+        Args:
+            topic (str): The topic.
+            value (Optional[bytes]): Message value; None is a tombstone.
+            key (Optional[bytes]): Message key. Defaults to None.
+            partition (Optional[int]): Partition to write to. Defaults to None (by a hash of the key,
+                so equal keys share a partition as with Kafka's default partitioner, or round robin
+                without a key).
+            timestamp (Optional[int]): Record timestamp in epoch milliseconds. Defaults to None (now).
+
+        Returns:
+            Tuple[int, int]: The partition and offset of the record.
+        """
+        with self.changed:
+            logs = self.topics.get(topic)
+            if logs is None:
+                logs = self.topics[topic] = [[]]
+            if partition is None:
+                if key is not None:
+                    partition = zlib.crc32(key) % len(logs)
+                else:
+                    partition = self.round_robin % len(logs)
+                    self.round_robin += 1
+            log = logs[partition]
+            timestamp = timestamp if timestamp is not None else int(time.time() * 1000)
+            log.append(FakeRecord(topic, partition, len(log), timestamp, key, value))
+            self.changed.notify_all()
+            return partition, len(log) - 1
+
+    def partitions(
+            self,
+            topics: Iterable[str]) -> List[TopicPartition]:
+        """
+        Return the partitions of the topics that exist.
+
+        Args:
+            topics (Iterable[str]): Topics.
+
+        Returns:
+            List[TopicPartition]: Their partitions, in topic and partition order.
+        """
+        return [TopicPartition(topic, partition) for topic in sorted(set(topics)) if topic in self.topics
+                for partition in range(len(self.topics[topic]))]
+
+    def end_offset(
+            self,
+            partition: TopicPartition) -> int:
+        """
+        Return the offset the next record of a partition will get.
+
+        Args:
+            partition (TopicPartition): The partition.
+
+        Returns:
+            int: Its end offset.
+        """
+        return len(self.topics[partition.topic][partition.partition])
+
+    def consumer(
+            self,
+            group_id: Optional[str] = None,
+            max_poll_records: int = 500,
+            auto_offset_reset: str = "latest",
+            **config: Any) -> "FakeConsumer":
+        """
+        Create a consumer, taking the same settings as KafkaConsumer.
+
+        Pass this method as `consumer_factory` to ChangeEventConsumer to run it against the broker.
+
+        Args:
+            group_id (Optional[str]): Consumer group. Defaults to None.
+            max_poll_records (int): Maximum records per poll. Defaults to 500.
+            auto_offset_reset (str): 'earliest' or 'latest', where to start without a committed
+                offset. Defaults to 'latest'.
+            **config (Any): Other KafkaConsumer settings, which are ignored.
+
+        Returns:
+            FakeConsumer: The consumer.
+        """
+        return FakeConsumer(self, group_id, max_poll_records, auto_offset_reset)
+
+    def producer(
+            self,
+            **config: Any) -> "FakeProducer":
+        """
+        Create a producer, taking the same settings as KafkaProducer.
+
+        Args:
+            **config (Any): KafkaProducer settings, which are ignored.
+
+        Returns:
+            FakeProducer: The producer.
+        """
+        return FakeProducer(self)
+
+    def _rebalance(
+            self,
+            group_id: str) -> None:
+        """Split the partitions of a group's topics among its members, calling their listeners."""
+        members = self.groups.get(group_id, [])
+        for member in members:
+            if member.listener is not None and member.assigned:
+                member.listener.on_partitions_revoked(set(member.assigned))
+            member.assigned = []
+        for topic in {topic for member in members for topic in member.topics}:
+            subscribed = [member for member in members if topic in member.topics]
+            partitions = self.partitions([topic])
+            share, extra = divmod(len(partitions), len(subscribed))
+            start = 0
+            for i, member in enumerate(subscribed):
+                end = start + share + (i < extra)
+                member.assigned.extend(partitions[start:end])
+                start = end
+        for member in members:
+            member._reset_positions()
+            if member.listener is not None:
+                member.listener.on_partitions_assigned(set(member.assigned))
+
+
+class FakeConsumer:
+    """
+    The subset of kafka-python's KafkaConsumer API that ChangeEventConsumer uses, served by a FakeBroker.
+
+    Polls wait for records up to their timeout like the real consumer, so
+    code that treats an empty poll as "caught up" behaves the same.
+    """
+
+    def __init__(
+            self,
+            broker: FakeBroker,
+            group_id: Optional[str],
+            max_poll_records: int,
+            auto_offset_reset: str) -> None:
+        self.broker = broker
+        self.group_id = group_id
+        self.max_poll_records = max_poll_records
+        self.auto_offset_reset = auto_offset_reset
+        self.topics: Set[str] = set()
+        self.listener: Optional[Any] = None
+        self.assigned: List[TopicPartition] = []
+        self.positions: Dict[TopicPartition, int] = {}
+        self.paused_partitions: Set[TopicPartition] = set()
+        self.closed = False
+
+    def partitions_for_topic(
+            self,
+            topic: str) -> Optional[Set[int]]:
+        with self.broker.changed:
+            logs = self.broker.topics.get(topic)
+            return set(range(len(logs))) if logs is not None else None
+
+    def subscribe(
+            self,
+            topics: Sequence[str],
+            listener: Optional[Any] = None) -> None:
+        with self.broker.changed:
+            self.topics, self.listener = set(topics), listener
+            if self.group_id is None:
+                self.assigned = self.broker.partitions(self.topics)
+                self._reset_positions()
+                if listener is not None:
+                    listener.on_partitions_assigned(set(self.assigned))
+                return
+            members = self.broker.groups.setdefault(self.group_id, [])
+            if self not in members:
+                members.append(self)
+            self.broker._rebalance(self.group_id)
+
+    def assign(
+            self,
+            partitions: Sequence[TopicPartition]) -> None:
+        with self.broker.changed:
+            self.assigned = list(partitions)
+            self._reset_positions()
+
+    def assignment(self) -> Set[TopicPartition]:
+        return set(self.assigned)
+
+    def _reset_positions(self) -> None:
+        """Start newly assigned partitions at the committed offset or per auto_offset_reset."""
+        committed = self.broker.committed.get(self.group_id, {}) if self.group_id is not None else {}
+        self.positions = {
+            partition: self.positions.get(partition, committed.get(partition, (
+                0 if self.auto_offset_reset == "earliest" else self.broker.end_offset(partition))))
+            for partition in self.assigned}
+
+    def seek(
+            self,
+            partition: TopicPartition,
+            offset: int) -> None:
+        self.positions[partition] = offset
+
+    def position(
+            self,
+            partition: TopicPartition) -> int:
+        return self.positions[partition]
+
+    def pause(self, *partitions: TopicPartition) -> None:
+        self.paused_partitions.update(partitions)
+
+    def resume(self, *partitions: TopicPartition) -> None:
+        self.paused_partitions.difference_update(partitions)
+
+    def paused(self) -> Set[TopicPartition]:
+        return set(self.paused_partitions)
+
+    def poll(
+            self,
+            timeout_ms: int = 0,
+            max_records: Optional[int] = None) -> Dict[TopicPartition, List[FakeRecord]]:
+        limit = max_records or self.max_poll_records
+        deadline = time.monotonic() + timeout_ms / 1000
+        with self.broker.changed:
+            while True:
+                fetched: Dict[TopicPartition, List[FakeRecord]] = {}
+                for partition in self.assigned:
+                    if limit <= 0:
+                        break
+                    if partition in self.paused_partitions:
+                        continue
+                    position = self.positions[partition]
+                    records = self.broker.topics[partition.topic][partition.partition][position:position + limit]
+                    if records:
+                        fetched[partition] = records
+                        self.positions[partition] = position + len(records)
+                        limit -= len(records)
+                remaining = deadline - time.monotonic()
+                if fetched or remaining <= 0:
+                    return fetched
+                self.broker.changed.wait(remaining)
+
+    def commit(
+            self,
+            offsets: Optional[Dict[TopicPartition, Any]] = None) -> None:
+        if self.group_id is None:
+            raise ValueError("Committing offsets requires a group_id")
+        with self.broker.changed:
+            if offsets is None:
+                offsets = dict(self.positions)
+            committed = self.broker.committed.setdefault(self.group_id, {})
+            for partition, offset in offsets.items():
+                committed[partition] = getattr(offset, "offset", offset)
+
+    def committed(
+            self,
+            partition: TopicPartition) -> Optional[int]:
+        return self.broker.committed.get(self.group_id, {}).get(partition)
+
+    def close(self) -> None:
+        with self.broker.changed:
+            if self.closed:
+                return
+            self.closed = True
+            members = self.broker.groups.get(self.group_id, [])
+            if self in members:
+                members.remove(self)
+                self.broker._rebalance(self.group_id)
+
+
+class FakeProducer:
+    """
+    The subset of kafka-python's KafkaProducer API the tools use, writing to a FakeBroker.
+
+    Records are appended as they are sent, so there is nothing to flush.
+    """
+
+    def __init__(
+            self,
+            broker: FakeBroker) -> None:
+        self.broker = broker
+        self.sent = 0
+
+    def partitions_for(
+            self,
+            topic: str) -> Set[int]:
+        with self.broker.changed:
+            return set(range(len(self.broker.topics.setdefault(topic, [[]]))))
+
+    def send(
+            self,
+            topic: str,
+            value: Optional[bytes] = None,
+            key: Optional[bytes] = None,
+            partition: Optional[int] = None,
+            timestamp_ms: Optional[int] = None) -> Tuple[int, int]:
+        self.sent += 1
+        return self.broker.produce(topic, value, key, partition, timestamp_ms)
+
+    def flush(
+            self,
+            timeout: Optional[float] = None) -> None:
+        pass
+
+    def close(
+            self,
+            timeout: Optional[float] = None) -> None:
+        pass
+
+
+def preload(
+        broker: FakeBroker,
+        num_events: int,
+        tables: Sequence[str] = ("users", "products"),
+        partitions: int = 1,
+        duplicate_rate: float = 0.0,
+        seed: int = 42,
+        prefix: str = "debezium") -> Dict[str, int]:
+    """
+    Fill the table topics with synthetic Debezium change events, as the JSON converter writes them.
+
+    Records are keyed by primary key, so each row's changes stay in one
+    partition. A share of the events is written a second time a few
+    records later, as a producer retry after a lost acknowledgement would.
+
+    Args:
+        broker (FakeBroker): Broker to write to.
+        num_events (int): Distinct events per table.
+        tables (Sequence[str]): Tables to write topics for. Defaults to ('users', 'products').
+        partitions (int): Partitions per topic. Defaults to 1.
+        duplicate_rate (float): Share of events written twice. Defaults to 0.0.
+        seed (int): Seed for the events and the duplicates. Defaults to 42.
+        prefix (str): The connector's topic.prefix. Defaults to 'debezium'.
+
+    Returns:
+        Dict[str, int]: Records written per topic.
+    """
+    rng = random.Random(seed)
+    written = {}
+    for table in tables:
+        topic = f"{prefix}.commerce.{table}"
+        broker.create_topic(topic, partitions)
+        retries: List[Tuple[int, bytes, bytes, int]] = []
+        count = 0
+        for i, payload in enumerate(synthetic_payloads(num_events, table, seed)):
+            row = payload["after"] if payload["after"] is not None else payload["before"]
+            record = (encode_key(table, row["id"], prefix=prefix), encode_envelope(table, payload, prefix=prefix),
+                      payload["ts_ms"] + 10)
+            broker.produce(topic, record[1], record[0], timestamp=record[2])
+            count += 1
+            if rng.random() < duplicate_rate:
+                retries.append((i + rng.randint(1, 10),) + record)
+            while retries and retries[0][0] <= i:
+                _, key, value, timestamp = retries.pop(0)
+                broker.produce(topic, value, key, timestamp=timestamp)
+                count += 1
+        for _, key, value, timestamp in retries:
+            broker.produce(topic, value, key, timestamp=timestamp)
+            count += 1
+        written[topic] = count
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    from change_events import ChangeEventConsumer
+    from dedup import Deduplicator
+    from parallel_consumer import OpCounter, ParallelConsumer
+
+    parser = argparse.ArgumentParser(description="Benchmark the consumers against an in-process fake broker")
+    parser.add_argument("-n", "--num_events", type=int, default=50_000, help="Events per table")
+    parser.add_argument("-p", "--partitions", type=int, default=4)
+    parser.add_argument("--duplicate_rate", type=float, default=0.01, help="Share of events written twice")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Parallel consumer processes")
+    parser.add_argument("--max_records", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    broker = FakeBroker()
+    written = preload(broker, args.num_events, partitions=args.partitions,
+                      duplicate_rate=args.duplicate_rate, seed=args.seed)
+    topics = sorted(written)
+    total = sum(written.values())
+    print(f"{total} records in {len(topics)} topics with {args.partitions} partitions each")
+
+    def consumer(group_id: str) -> ChangeEventConsumer:
+        return ChangeEventConsumer(topics, group_id=group_id, max_records=args.max_records,
+                                   consumer_factory=broker.consumer)
+
+    def report(name: str, events: int, start: float) -> None:
+        print(f"{name:>20}: {events:>9} events, {events / (time.perf_counter() - start):>12,.0f} events/sec")
+
+    source = consumer("bench-decode")
+    start = time.perf_counter()
+    events = sum(len(batch) for batches in source.batches(0) for batch in batches.values())
+    report("decode", events, start)
+    source.close()
+
+    source = consumer("bench-dedup")
+    dedup = Deduplicator()
+    start = time.perf_counter()
+    events = sum(len(dedup.filter(batch)) for batches in source.batches(0) for batch in batches.values())
+    report("decode + dedup", events, start)
+    source.close()
+    stats = dedup.stats()
+    print(f"{'':>20}  {stats['exact_duplicates'] + stats['probable_duplicates']} duplicates dropped, "
+          f"{stats['false_positives']} false positives")
+
+    source = consumer("bench-parallel")
+    runtime = ParallelConsumer(source, OpCounter(), args.workers)
+    try:
+        start = time.perf_counter()
+        events = runtime.run(idle_timeout_ms=0)
+        report(f"parallel ({runtime.workers} workers)", events, start)
+    finally:
+        runtime.close()
+        source.close()
@@ -0,0 +1,182 @@
+import hashlib
+import http.server
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+import uuid
+import xml.etree.ElementTree as ElementTree
+from object_store import LocalObjectStore
+from typing import Dict
+from xml.sax.saxutils import escape
+
+PAGE_SIZE = 1_000  # keys per ListObjectsV2 page, as in S3
+
+
+class FakeS3Handler(http.server.BaseHTTPRequestHandler):
+    """Serves the S3 requests `object_store.S3ObjectStore` makes from the server's local store, ignoring signatures."""
+
+    protocol_version = "HTTP/1.1"  # keep connections alive, as S3 does
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def parse_request(self) -> bool:
+        """Parse the request line and headers, and record the request's Authorization header."""
+        parsed = super().parse_request()
+        if parsed:
+            self.server.authorizations.append(self.headers.get("Authorization", ""))
+        return parsed
+
+    def _key(self) -> str:
+        """Object key of the request path, after the bucket."""
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        return path.lstrip("/").partition("/")[2]
+
+    def _query(self) -> Dict[str, str]:
+        """Query parameters of the request, including ones without a value such as 'uploads'."""
+        return dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query, keep_blank_values=True))
+
+    def _reply(
+            self,
+            status: int,
+            body: bytes = b"") -> None:
+        """Send a whole response."""
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = self._query()
+        store: LocalObjectStore = self.server.store
+        if "list-type" in query:
+            after = query.get("continuation-token", query.get("start-after"))
+            page_size = self.server.page_size
+            infos = []
+            for info in store.list(query.get("prefix", ""), after):
+                infos.append(info)
+                if len(infos) > page_size:
+                    break
+            more = len(infos) > page_size
+            infos = infos[:page_size]
+            body = "".join(f"<Contents><Key>{escape(info.key)}</Key><Size>{info.size}</Size></Contents>"
+                           for info in infos)
+            token = f"<NextContinuationToken>{escape(infos[-1].key)}</NextContinuationToken>" if more else ""
+            self._reply(200, (f'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">{body}'
+                              f'<IsTruncated>{str(more).lower()}</IsTruncated>{token}</ListBucketResult>').encode())
+            return
+        try:
+            f = store.open(self._key())
+        except (FileNotFoundError, IsADirectoryError):
+            self._reply(404)
+            return
+        with f:
+            time.sleep(self.server.latency)
+            self.send_response(200)
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, 256 * 1024)
+
+    def do_PUT(self):
+        query = self._query()
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        if "uploadId" not in query:
+            self.server.store.put(self._key(), data)
+            self._reply(200)
+            return
+        parts = self.server.uploads.get(query["uploadId"])
+        if parts is None:
+            self._reply(404)
+            return
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        parts[int(query["partNumber"])] = (etag, data)
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        query = self._query()
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.server.uploads[upload_id] = {}
+            self._reply(200, (f'<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                              f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>').encode())
+            return
+        parts = self.server.uploads.pop(query.get("uploadId"), None)
+        if parts is None:
+            self._reply(404)
+            return
+        chosen = [(int(part.findtext("PartNumber")), part.findtext("ETag"))
+                  for part in ElementTree.fromstring(data).iter("Part")]
+        if any(parts.get(number, (None,))[0] != etag for number, etag in chosen) or \
+                any(len(parts[number][1]) < self.server.min_part_size for number, _ in chosen[:-1]):
+            self._reply(400, b"<Error><Code>InvalidPart</Code></Error>")
+            return
+        self.server.store.put(self._key(), b"".join(parts[number][1] for number, _ in chosen))
+        self._reply(200, b"<CompleteMultipartUploadResult/>")
+
+    def do_DELETE(self):
+        query = self._query()
+        if "uploadId" in query:
+            self.server.uploads.pop(query["uploadId"], None)
+        else:
+            self.server.store.delete(self._key())
+        self._reply(204)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeS3Server:
+    """
+    In-process stand-in for an S3-compatible store, serving a directory over HTTP.
+
+    Any bucket name is accepted and maps to the same directory. Used by
+    tests and benchmarks of the S3 client, the archive readers and the
+    object sink, where MinIO is not running; `latency` adds a delay to every
+    response to mimic a store across a network. Multipart uploads are kept
+    in memory until completed, and `uploads` shows the unfinished ones.
+    The Authorization header of every request is kept in `authorizations`.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            latency: float = 0.0,
+            min_part_size: int = 5 * 1024 * 1024,
+            page_size: int = PAGE_SIZE) -> None:
+        """
+        Start serving a directory on a free local port.
+
+        Args:
+            directory (str): Directory holding the objects; created if missing.
+            latency (float): Seconds to wait before each response. Defaults to 0.
+            min_part_size (int): Smallest multipart upload part accepted, but for the last. Defaults to
+                5 MiB, as in S3.
+            page_size (int): Keys per ListObjectsV2 page. Defaults to 1,000, as in S3.
+        """
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeS3Handler)
+        self.server.daemon_threads = True
+        self.server.store = LocalObjectStore(directory)
+        self.server.latency = latency
+        self.server.min_part_size = min_part_size
+        self.server.page_size = page_size
+        self.server.authorizations = self.authorizations = []
+        self.server.uploads = self.uploads = {}
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeS3Server":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
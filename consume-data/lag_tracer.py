@@ -0,0 +1,232 @@
+import json
+import math
+import time
+import numpy as np
+from change_events import MISSING, ChangeBatch, ChangeEventConsumer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Stages of the path from a Postgres commit to this consumer, and the timestamps that bound them:
+# source.ts_ms (commit) -> payload ts_ms (connector) -> Kafka record timestamp -> time of consumption
+STAGES = ("commit_to_connector", "connector_to_kafka", "kafka_to_consumer", "end_to_end")
+
+
+class LagHistogram:
+    """
+    Log-bucketed histogram of lags in milliseconds with bounded relative error.
+
+    Like the generator's latency histogram, but fed a batch at a time with
+    NumPy. Negative lags, which only clock skew between hosts can cause, are
+    counted as 0 and tallied in `negative`.
+    """
+
+    def __init__(
+            self,
+            precision: float = 0.05) -> None:
+        """
+        Create an empty histogram.
+
+        Args:
+            precision (float): Relative width of each bucket. Defaults to 0.05 (5%).
+        """
+        self.log_base = math.log1p(precision)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.negative = 0
+        self.max_ms = 0
+
+    def record(
+            self,
+            lags_ms: np.ndarray) -> None:
+        """
+        Record lag samples.
+
+        Args:
+            lags_ms (np.ndarray): Lags in milliseconds.
+
+        Returns:
+            None
+        """
+        if not len(lags_ms):
+            return
+        self.negative += int((lags_ms < 0).sum())
+        clipped = np.maximum(lags_ms, 1)
+        indices, counts = np.unique((np.log(clipped) / self.log_base).astype(np.int64), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += len(lags_ms)
+        self.max_ms = max(self.max_ms, int(lags_ms.max()))
+
+    def percentile(
+            self,
+            q: float) -> float:
+        """
+        Return the lag at quantile q.
+
+        Args:
+            q (float): Quantile between 0 and 1, e.g. 0.99.
+
+        Returns:
+            float: Upper bound of the bucket containing the quantile in milliseconds, or 0.0 if empty.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(math.exp((index + 1) * self.log_base), max(self.max_ms, 1))
+        return float(self.max_ms)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarise the histogram.
+
+        Returns:
+            Dict[str, Any]: Count, negative count, p50/p95/p99 and max in milliseconds, and the
+                bucket counts keyed by their upper bound in milliseconds.
+        """
+        return {
+            "count": self.count,
+            "negative": self.negative,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+            "buckets": {f"{math.exp((index + 1) * self.log_base):.1f}": count
+                        for index, count in sorted(self.buckets.items())},
+        }
+
+
+class LagTracer:
+    """
+    Per-table, per-stage replication lag, in consecutive time windows.
+
+    Each event contributes to the stages whose bounding timestamps it has.
+    Snapshot reads ('r') are skipped, as their source timestamp is when the
+    snapshot ran, not when the row was committed. The connector-to-Kafka
+    stage uses the record timestamp, which is the producer's send time
+    unless the topic uses LogAppendTime.
+    """
+
+    def __init__(
+            self,
+            window: float = 10.0,
+            precision: float = 0.05) -> None:
+        """
+        Start the first window.
+
+        Args:
+            window (float): Seconds per window. Defaults to 10.0.
+            precision (float): Relative bucket width of the histograms. Defaults to 0.05.
+        """
+        self.window = window
+        self.precision = precision
+        self.window_start = time.time()
+        self.histograms: Dict[Tuple[str, str], LagHistogram] = {}
+
+    def observe(
+            self,
+            batch: ChangeBatch,
+            now_ms: Optional[int] = None) -> None:
+        """
+        Record the lags of a batch.
+
+        Args:
+            batch (ChangeBatch): Events of one topic.
+            now_ms (Optional[int]): Time the batch was consumed, in epoch milliseconds.
+                Defaults to None (now).
+
+        Returns:
+            None
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        table = batch.topic.rsplit(".", 1)[-1]
+        live = batch.op != "r"
+        committed = live & (batch.source_ts_ms != MISSING)
+        connected = live & (batch.ts_ms != MISSING)
+        produced = live & (batch.kafka_ts_ms != MISSING)
+        lags = {
+            "commit_to_connector": (batch.ts_ms - batch.source_ts_ms)[committed & connected],
+            "connector_to_kafka": (batch.kafka_ts_ms - batch.ts_ms)[connected & produced],
+            "kafka_to_consumer": (now_ms - batch.kafka_ts_ms)[produced],
+            "end_to_end": (now_ms - batch.source_ts_ms)[committed],
+        }
+        for stage, values in lags.items():
+            if len(values):
+                histogram = self.histograms.get((table, stage))
+                if histogram is None:
+                    histogram = self.histograms[(table, stage)] = LagHistogram(self.precision)
+                histogram.record(values)
+
+    def due(self) -> bool:
+        """
+        Tell whether the current window is over.
+
+        Returns:
+            bool: True once `window` seconds have passed since it started.
+        """
+        return time.time() - self.window_start >= self.window
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """
+        Close the current window and start the next one.
+
+        Returns:
+            List[Dict[str, Any]]: One histogram summary per table and stage that had samples,
+                with the window's start and end in epoch seconds.
+        """
+        end = time.time()
+        windows = [
+            {"window_start": self.window_start, "window_end": end, "table": table, "stage": stage,
+             **histogram.summary()}
+            for (table, stage), histogram in sorted(
+                self.histograms.items(), key=lambda item: (item[0][0], STAGES.index(item[0][1])))]
+        self.window_start = end
+        self.histograms = {}
+        return windows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure replication lag from Postgres to this consumer")
+    parser.add_argument(
+        "-t", "--topics", nargs="+",
+        default=["debezium.commerce.users", "debezium.commerce.products", "debezium.commerce.heartbeat"])
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("--window", type=float, default=10.0, help="Seconds per reported window")
+    parser.add_argument("-o", "--output", help="Append each window's histograms to this JSON lines file")
+    parser.add_argument("--from_beginning", action="store_true", help="Read existing events, not only new ones")
+    parser.add_argument("--idle_timeout_ms", type=int, default=60_000, help="Stop after this long without records")
+    args = parser.parse_args()
+
+    consumer = ChangeEventConsumer(
+        args.topics, args.bootstrap_servers, auto_offset_reset="earliest" if args.from_beginning else "latest")
+    tracer = LagTracer(args.window)
+
+    def report() -> None:
+        windows = tracer.flush()
+        for window in windows:
+            print(f"{window['table']:>10} {window['stage']:>20}: {window['count']:>7} events, "
+                  f"p50 {window['p50_ms']:>8.0f} ms, p99 {window['p99_ms']:>8.0f} ms, max {window['max_ms']:>8} ms")
+        if args.output and windows:
+            with open(args.output, "a") as f:
+                for window in windows:
+                    f.write(json.dumps(window) + "\n")
+
+    last_event = time.time()
+    try:
+        while True:
+            batches = consumer.poll(min(args.idle_timeout_ms, int(args.window * 1000)))
+            for batch in batches.values():
+                tracer.observe(batch)
+                last_event = time.time()
+            if tracer.due():
+                report()
+            if time.time() - last_event >= args.idle_timeout_ms / 1000:
+                break
+    finally:
+        report()
+        consumer.close()
@@ -0,0 +1,311 @@
+import heapq
+import itertools
+import json
+import time
+from change_events import MISSING, ChangeEventConsumer
+from collections import namedtuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+MergedEvent = namedtuple("MergedEvent", ["commit_lsn", "lsn", "topic", "partition", "offset", "payload"])
+Transaction = namedtuple("Transaction", ["tx_id", "commit_lsn", "events"])
+
+Key = Tuple[int, int]
+
+
+def order_key(
+        payload: Dict[str, Any]) -> Key:
+    """
+    Return the position of an event in the source's commit order.
+
+    The Postgres connector streams whole transactions in commit order and
+    puts the last committed LSN first in `source.sequence`, so (last commit
+    LSN, lsn) grows with every event a connector emits, across tables. Without
+    a sequence it falls back to the lsn alone.
+
+    Args:
+        payload (Dict[str, Any]): A Debezium payload.
+
+    Returns:
+        Key: (last commit LSN, lsn), -1 where unknown.
+    """
+    source = payload["source"]
+    lsn = source.get("lsn")
+    commit_lsn = None
+    sequence = source.get("sequence")
+    if sequence:
+        commit_lsn = json.loads(sequence)[0]
+    return (MISSING if commit_lsn is None else int(commit_lsn)), (MISSING if lsn is None else lsn)
+
+
+class LsnMerger:
+    """
+    Merges per-table change streams into one stream in source order.
+
+    Each input is already in order, so an event can be released once every
+    input has shown an event at or after it: the watermark is the lowest
+    latest key over the inputs. Buffered events sit in a heap. An input that
+    has nothing new (see `set_idle`) stops holding the watermark back until
+    it delivers again. Events that arrive behind what was already released
+    are passed through at once and counted as `late`.
+
+    With `group_transactions`, events are released as whole Transactions:
+    the events of one transaction are adjacent in source order, and a
+    transaction is complete once the watermark has moved past its commit
+    position or an event of the next transaction was released.
+    """
+
+    def __init__(
+            self,
+            inputs: Sequence[str],
+            group_transactions: bool = False) -> None:
+        """
+        Create a merger with empty inputs.
+
+        Args:
+            inputs (Sequence[str]): Names of the inputs, e.g. the per-table topics.
+            group_transactions (bool): Release Transactions instead of single events. Defaults to False.
+        """
+        self.inputs = list(inputs)
+        self.group_transactions = group_transactions
+        self.high: Dict[str, Optional[Key]] = {name: None for name in self.inputs}
+        self.idle: Set[str] = set()
+        self.heap: List[Tuple[Key, int, MergedEvent]] = []
+        self.counter = itertools.count()
+        self.released: Optional[Key] = None
+        self.released_offsets: Dict[Tuple[str, int], int] = {}
+        self.transaction: List[MergedEvent] = []
+        self.late = 0
+        self.out_of_order = 0
+        self.max_buffered = 0
+
+    def __len__(self) -> int:
+        return len(self.heap) + len(self.transaction)
+
+    def add(
+            self,
+            name: str,
+            payloads: Iterable[Optional[Dict[str, Any]]],
+            partitions: Optional[Sequence[int]] = None,
+            offsets: Optional[Sequence[int]] = None) -> None:
+        """
+        Buffer the next events of an input, which also ends its idleness.
+
+        Args:
+            name (str): The input.
+            payloads (Iterable[Optional[Dict[str, Any]]]): Debezium payloads in the input's order;
+                None (tombstones) are skipped.
+            partitions (Optional[Sequence[int]]): Kafka partition of each payload. Defaults to None (-1).
+            offsets (Optional[Sequence[int]]): Kafka offset of each payload. Defaults to None (-1).
+
+        Returns:
+            None
+        """
+        high = self.high[name]
+        for i, payload in enumerate(payloads):
+            if payload is None:
+                continue
+            key = order_key(payload)
+            if high is not None and key < high:
+                self.out_of_order += 1
+            else:
+                high = key
+            event = MergedEvent(
+                key[0], key[1], name,
+                partitions[i] if partitions is not None else MISSING,
+                offsets[i] if offsets is not None else MISSING,
+                payload)
+            heapq.heappush(self.heap, (key, next(self.counter), event))
+        self.high[name] = high
+        self.idle.discard(name)
+        self.max_buffered = max(self.max_buffered, len(self.heap))
+
+    def set_idle(
+            self,
+            name: str) -> None:
+        """
+        Mark an input as caught up, so it does not hold back the watermark.
+
+        Args:
+            name (str): The input.
+
+        Returns:
+            None
+        """
+        self.idle.add(name)
+
+    def watermark(self) -> Optional[Key]:
+        """
+        Return the key up to which events can be released.
+
+        Returns:
+            Optional[Key]: The lowest latest key of the inputs that are not idle; None if all
+                inputs are idle, i.e. everything can be released.
+        """
+        active = [self.high[name] for name in self.inputs if name not in self.idle]
+        if not active:
+            return None
+        if any(high is None for high in active):
+            return (MISSING - 1, MISSING - 1)  # an input has not delivered anything yet
+        return min(active)
+
+    def lagging(self) -> List[str]:
+        """
+        Return the inputs holding back the watermark, i.e. the ones to read next.
+
+        Returns:
+            List[str]: Inputs that are not idle and whose latest key is the watermark.
+        """
+        mark = self.watermark()
+        return [name for name in self.inputs
+                if name not in self.idle and (self.high[name] is None or self.high[name] == mark)]
+
+    def ready(self) -> Iterator[Union[MergedEvent, Transaction]]:
+        """
+        Release the events that no input can precede any more.
+
+        Yields:
+            Union[MergedEvent, Transaction]: Events, or complete transactions, in source order.
+        """
+        mark = self.watermark()
+        while self.heap and (mark is None or self.heap[0][0] <= mark):
+            key, _, event = heapq.heappop(self.heap)
+            if self.released is not None and key < self.released:
+                self.late += 1
+            else:
+                self.released = key
+            yield from self._release(event)
+        if self.transaction and (mark is None or mark[0] > self.transaction[0].commit_lsn):
+            yield self._complete()
+
+    def flush(self) -> Iterator[Union[MergedEvent, Transaction]]:
+        """
+        Release everything that is buffered, e.g. at the end of the input.
+
+        Yields:
+            Union[MergedEvent, Transaction]: The remaining events or transactions, in source order.
+        """
+        while self.heap:
+            yield from self._release(heapq.heappop(self.heap)[2])
+        if self.transaction:
+            yield self._complete()
+
+    def _release(
+            self,
+            event: MergedEvent) -> Iterator[Union[MergedEvent, Transaction]]:
+        """Pass on one event, or add it to the open transaction."""
+        if not self.group_transactions:
+            self._passed([event])
+            yield event
+            return
+        if self.transaction and _tx_key(self.transaction[0]) != _tx_key(event):
+            yield self._complete()
+        self.transaction.append(event)
+
+    def _complete(self) -> Transaction:
+        """Close the open transaction."""
+        events, self.transaction = self.transaction, []
+        self._passed(events)
+        return Transaction(events[0].payload["source"].get("txId"), events[0].commit_lsn, events)
+
+    def _passed(
+            self,
+            events: List[MergedEvent]) -> None:
+        """Remember the offsets after the events handed out."""
+        for event in events:
+            if event.offset != MISSING:
+                self.released_offsets[(event.topic, event.partition)] = event.offset + 1
+
+
+def _tx_key(
+        event: MergedEvent) -> Tuple[int, Any]:
+    """What the events of one transaction have in common."""
+    return event.commit_lsn, event.payload["source"].get("txId")
+
+
+def merge_topics(
+        consumer: ChangeEventConsumer,
+        topics: Sequence[str],
+        group_transactions: bool = False,
+        max_buffered: int = 100_000,
+        idle_ms: int = 1_000,
+        idle_timeout_ms: Optional[int] = None,
+        merger: Optional[LsnMerger] = None) -> Iterator[Union[MergedEvent, Transaction]]:
+    """
+    Read per-table topics and yield their events merged into source order.
+
+    While more than `max_buffered` events are waiting, the topics that are
+    ahead are paused, so only the topics holding back the watermark are read.
+    To commit, pass in a merger and commit its `released_offsets` rather than
+    the consumer's position, as buffered events lie before it.
+
+    Args:
+        consumer (ChangeEventConsumer): Consumer subscribed to the topics.
+        topics (Sequence[str]): Topics to merge.
+        group_transactions (bool): Yield Transactions instead of single events. Defaults to False.
+        max_buffered (int): Events to buffer before pausing the topics that are ahead. Defaults to 100,000.
+        idle_ms (int): A topic without records for this long stops holding back the others. Defaults to 1,000.
+        idle_timeout_ms (Optional[int]): Stop after this long without any records, releasing what is
+            buffered. Defaults to None (never stop).
+        merger (Optional[LsnMerger]): Merger to use; its inputs must be the topics. Defaults to None (a new one).
+
+    Yields:
+        Union[MergedEvent, Transaction]: Events, or complete transactions, in source order.
+    """
+    merger = merger if merger is not None else LsnMerger(topics, group_transactions)
+    now = time.monotonic()
+    last_seen = {topic: now for topic in topics}
+    last_record = now
+    paused: Set[str] = set()
+    while True:
+        records = consumer.poll_records(min(idle_ms, idle_timeout_ms or idle_ms))
+        now = time.monotonic()
+        for topic, topic_records in records.items():
+            payloads = consumer.decoder.payloads(topic, [record.value for record in topic_records])
+            merger.add(topic, payloads, [record.partition for record in topic_records],
+                       [record.offset for record in topic_records])
+            last_seen[topic] = last_record = now
+        for topic in topics:
+            if topic not in records and now - last_seen[topic] >= idle_ms / 1000:
+                merger.set_idle(topic)
+        yield from merger.ready()
+
+        if len(merger) >= max_buffered:
+            ahead = set(topics) - set(merger.lagging()) - paused
+            if ahead:
+                consumer.pause(ahead)
+                paused |= ahead
+        elif paused:
+            consumer.resume(paused)
+            paused = set()
+        if idle_timeout_ms is not None and now - last_record >= idle_timeout_ms / 1000:
+            yield from merger.flush()
+            return
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge the per-table topics into one stream in source order")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("--transactions", action="store_true", help="Print whole transactions")
+    parser.add_argument("--max_buffered", type=int, default=100_000)
+    parser.add_argument("--idle_ms", type=int, default=1_000, help="Time after which a quiet topic stops holding back")
+    parser.add_argument("--idle_timeout_ms", type=int, default=10_000, help="Stop after this long without records")
+    args = parser.parse_args()
+
+    consumer = ChangeEventConsumer(args.topics, args.bootstrap_servers)
+    count = 0
+    try:
+        for item in merge_topics(consumer, args.topics, args.transactions, args.max_buffered,
+                                 args.idle_ms, args.idle_timeout_ms):
+            count += 1
+            if isinstance(item, Transaction):
+                tables = sorted({event.topic.rsplit(".", 1)[-1] for event in item.events})
+                print(f"tx {item.tx_id}: {len(item.events)} events on {', '.join(tables)}")
+            else:
+                print(f"{item.commit_lsn}/{item.lsn} {item.topic} {item.payload['op']}")
+    finally:
+        consumer.close()
+    print(f"{count} {'transactions' if args.transactions else 'events'}")
@@ -0,0 +1,472 @@
+import os
+import pickle
+import time
+import numpy as np
+from change_events import MISSING, ChangeBatch, ChangeEventConsumer
+from envelopes import TABLE_COLUMNS
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# NumPy dtypes of Kafka Connect types that can be stored unboxed; everything else is kept in a list
+DTYPES = {"int16": np.int16, "int32": np.int32, "int64": np.int64, "float": np.float64, "double": np.float64}
+FREE = -1  # key of an unused slot
+SNAPSHOT_VERSION = 1
+
+
+class TableState:
+    """
+    Current rows of one table, stored column by column.
+
+    Each row lives in a slot: a position in `keys` and in every column.
+    Non-null numeric columns are NumPy arrays and everything else is a list,
+    so a row costs a few machine words instead of a dict per row. Deleted
+    slots are reused by later inserts.
+    """
+
+    def __init__(
+            self,
+            columns: Sequence[tuple],
+            key: str = "id",
+            capacity: int = 1_024) -> None:
+        """
+        Create an empty table.
+
+        Args:
+            columns (Sequence[tuple]): (name, Kafka Connect type, optional) per column, as in
+                `envelopes.TABLE_COLUMNS`. Must include the key column.
+            key (str): Integer primary key column. Defaults to 'id'.
+            capacity (int): Initial number of slots. Defaults to 1,024.
+        """
+        self.columns = [tuple(column) for column in columns]
+        self.key = key
+        self.index: Dict[int, int] = {}
+        self.keys = np.full(capacity, FREE, dtype=np.int64)
+        self.free: List[int] = []
+        self.size = 0  # slots in use or freed; slots from here on were never used
+        self.data: Dict[str, Any] = {}
+        for name, kind, optional in self.columns:
+            if name == key:
+                continue
+            dtype = DTYPES.get(kind) if not optional else None
+            self.data[name] = np.zeros(capacity, dtype=dtype) if dtype is not None else [None] * capacity
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.index
+
+    def _grow(
+            self,
+            capacity: int) -> None:
+        """Make room for at least `capacity` slots, doubling the current size."""
+        old = len(self.keys)
+        if capacity <= old:
+            return
+        capacity = max(capacity, 2 * old)
+        self.keys = np.concatenate([self.keys, np.full(capacity - old, FREE, dtype=np.int64)])
+        for name, column in self.data.items():
+            if isinstance(column, np.ndarray):
+                self.data[name] = np.concatenate([column, np.zeros(capacity - old, dtype=column.dtype)])
+            else:
+                column.extend([None] * (capacity - old))
+
+    def _slots(
+            self,
+            keys: Sequence[int]) -> List[int]:
+        """Return the slot of each key, allocating slots for new keys."""
+        slots = []
+        new = [key for key in keys if key not in self.index]
+        self._grow(self.size + max(len(new) - len(self.free), 0))
+        for key in keys:
+            slot = self.index.get(key)
+            if slot is None:
+                if self.free:
+                    slot = self.free.pop()
+                else:
+                    slot = self.size
+                    self.size += 1
+                self.index[key] = slot
+                self.keys[slot] = key
+            slots.append(slot)
+        return slots
+
+    def upsert(
+            self,
+            keys: Sequence[int],
+            values: Dict[str, Sequence[Any]]) -> None:
+        """
+        Insert or replace rows.
+
+        Args:
+            keys (Sequence[int]): Primary keys, each at most once.
+            values (Dict[str, Sequence[Any]]): Column values, aligned with keys. Columns
+                that are missing keep their current value (or the column default for new rows).
+
+        Returns:
+            None
+        """
+        slots = self._slots(keys)
+        for name, column_values in values.items():
+            column = self.data.get(name)
+            if column is None:
+                if name == self.key:
+                    continue
+                column = self.data[name] = [None] * len(self.keys)  # a column the table did not have
+                self.columns.append((name, "string", True))
+            if isinstance(column, np.ndarray):
+                column[slots] = column_values
+            else:
+                for slot, value in zip(slots, column_values):
+                    column[slot] = value
+
+    def delete(
+            self,
+            keys: Sequence[int]) -> int:
+        """
+        Delete rows; keys that are not present are ignored.
+
+        Args:
+            keys (Sequence[int]): Primary keys.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        deleted = 0
+        for key in keys:
+            slot = self.index.pop(key, None)
+            if slot is None:
+                continue
+            self.keys[slot] = FREE
+            for column in self.data.values():
+                if not isinstance(column, np.ndarray):
+                    column[slot] = None  # drop the reference
+            self.free.append(slot)
+            deleted += 1
+        return deleted
+
+    def clear(self) -> None:
+        """
+        Delete all rows, e.g. after a TRUNCATE.
+
+        Returns:
+            None
+        """
+        self.__init__(self.columns, self.key)
+
+    def _row(
+            self,
+            slot: int) -> Dict[str, Any]:
+        """The row in a slot, with plain Python values."""
+        row = {self.key: int(self.keys[slot])}
+        for name, column in self.data.items():
+            value = column[slot]
+            row[name] = value.item() if isinstance(value, np.generic) else value
+        return row
+
+    def get(
+            self,
+            key: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up one row.
+
+        Args:
+            key (int): Primary key.
+
+        Returns:
+            Optional[Dict[str, Any]]: The row, or None if there is none with this key.
+        """
+        slot = self.index.get(key)
+        return None if slot is None else self._row(slot)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over all rows in primary key order.
+
+        Yields:
+            Dict[str, Any]: One row.
+        """
+        for key in sorted(self.index):
+            yield self._row(self.index[key])
+
+    def state(self) -> Dict[str, Any]:
+        """
+        Return the table trimmed to its used slots, for a snapshot.
+
+        Returns:
+            Dict[str, Any]: Columns, key, keys and data.
+        """
+        return {
+            "columns": self.columns,
+            "key": self.key,
+            "keys": self.keys[:self.size].copy(),
+            "data": {name: column[:self.size] for name, column in self.data.items()},
+        }
+
+    @classmethod
+    def from_state(
+            cls,
+            state: Dict[str, Any]) -> "TableState":
+        """
+        Rebuild a table from `state()`.
+
+        Args:
+            state (Dict[str, Any]): A table state.
+
+        Returns:
+            TableState: The table.
+        """
+        keys = state["keys"]
+        table = cls(state["columns"], state["key"], capacity=max(len(keys), 1))
+        table.size = len(keys)
+        table.keys[:table.size] = keys
+        used = np.flatnonzero(keys != FREE)
+        table.index = dict(zip(keys[used].tolist(), used.tolist()))
+        table.free = np.flatnonzero(keys == FREE).tolist()[::-1]
+        for name, column in state["data"].items():
+            table.data[name][:table.size] = column
+        return table
+
+
+class Materializer:
+    """
+    Rebuilds the current contents of the captured tables from their change events.
+
+    Create, read (snapshot), update and delete events are applied by primary
+    key; within a batch only the last event of each key matters. The last
+    applied offset of every (topic, partition) is tracked, so events that are
+    delivered again after a restart are skipped, and a snapshot records
+    exactly where to resume reading.
+    """
+
+    def __init__(
+            self,
+            tables: Optional[Dict[str, Sequence[tuple]]] = None,
+            key: str = "id") -> None:
+        """
+        Create an empty store.
+
+        Args:
+            tables (Optional[Dict[str, Sequence[tuple]]]): Columns per table name. Tables not
+                listed get their columns from the events. Defaults to None (`envelopes.TABLE_COLUMNS`).
+            key (str): Integer primary key column of every table. Defaults to 'id'.
+        """
+        self.columns = dict(TABLE_COLUMNS if tables is None else tables)
+        self.key = key
+        self.tables: Dict[str, TableState] = {}
+        self.offsets: Dict[Tuple[str, int], int] = {}
+        self.events = 0
+        self.skipped = 0
+
+    def table(
+            self,
+            name: str) -> TableState:
+        """
+        Return a table's state, creating it empty if needed.
+
+        Args:
+            name (str): Table name, e.g. 'users'.
+
+        Returns:
+            TableState: The table.
+        """
+        table = self.tables.get(name)
+        if table is None:
+            columns = self.columns.get(name, [(self.key, "int64", False)])
+            table = self.tables[name] = TableState(columns, self.key)
+        return table
+
+    def get(
+            self,
+            table: str,
+            key: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up the current version of a row.
+
+        Args:
+            table (str): Table name, e.g. 'users'.
+            key (int): Primary key.
+
+        Returns:
+            Optional[Dict[str, Any]]: The row, or None if it does not exist.
+        """
+        state = self.tables.get(table)
+        return None if state is None else state.get(key)
+
+    def apply(
+            self,
+            batch: ChangeBatch) -> int:
+        """
+        Apply a batch of change events of one topic.
+
+        Args:
+            batch (ChangeBatch): Events of one topic, in offset order per partition.
+
+        Returns:
+            int: Number of events applied, i.e. not skipped as already applied.
+        """
+        n = len(batch)
+        if not n:
+            return 0
+        fresh = np.ones(n, dtype=bool)
+        tracked = batch.offset != MISSING  # events that did not come from Kafka have no offset
+        partitions = np.unique(batch.partition[tracked]).tolist()
+        for partition in partitions:
+            applied = self.offsets.get((batch.topic, partition))
+            if applied is not None:
+                fresh &= ~((batch.partition == partition) & (batch.offset <= applied) & tracked)
+        self.skipped += n - int(fresh.sum())
+
+        table = self.table(batch.topic.rsplit(".", 1)[-1])
+        truncates = np.flatnonzero(batch.op == "t").tolist()
+        start = 0
+        for end in truncates + [n]:
+            self._apply_range(table, batch, fresh, start, end)
+            if end < n and fresh[end]:
+                table.clear()
+            start = end + 1
+
+        for partition in partitions:
+            last = int(batch.offset[(batch.partition == partition) & tracked].max())
+            self.offsets[(batch.topic, partition)] = max(last, self.offsets.get((batch.topic, partition), last))
+        applied = int(fresh.sum())
+        self.events += applied
+        return applied
+
+    __call__ = apply  # so a Materializer can be used as a ParallelConsumer handler
+
+    def _apply_range(
+            self,
+            table: TableState,
+            batch: ChangeBatch,
+            fresh: np.ndarray,
+            start: int,
+            end: int) -> None:
+        """
+        Apply the events at positions start..end-1 of a batch, keeping only the last one per key.
+
+        Args:
+            table (TableState): Table the events belong to.
+            batch (ChangeBatch): The batch.
+            fresh (np.ndarray): Mask of events that were not applied before.
+            start (int): First position.
+            end (int): Position after the last one.
+
+        Returns:
+            None
+        """
+        after_keys = batch.after.get(self.key, [None] * len(batch))
+        before_keys = batch.before.get(self.key, [None] * len(batch))
+        last: Dict[int, int] = {}
+        for i in range(start, end):
+            if fresh[i]:
+                key = after_keys[i] if after_keys[i] is not None else before_keys[i]
+                if key is not None:
+                    last[key] = i
+
+        deletes = [key for key, i in last.items() if batch.op[i] == "d"]
+        upserts = [(key, i) for key, i in last.items() if batch.op[i] != "d"]
+        table.delete(deletes)
+        if upserts:
+            positions = [i for _, i in upserts]
+            values = {name: [column[i] for i in positions]
+                      for name, column in batch.after.items() if name != self.key}
+            table.upsert([key for key, _ in upserts], values)
+
+    def next_offsets(self) -> Dict[Tuple[str, int], int]:
+        """
+        Return where reading should resume.
+
+        Returns:
+            Dict[Tuple[str, int], int]: The offset after the last applied one per (topic, partition),
+                as `ChangeEventConsumer` takes for `start_offsets`.
+        """
+        return {partition: offset + 1 for partition, offset in self.offsets.items()}
+
+    def snapshot(
+            self,
+            path: str) -> None:
+        """
+        Atomically write all tables and offsets to a file.
+
+        Args:
+            path (str): Destination file.
+
+        Returns:
+            None
+        """
+        state = {
+            "version": SNAPSHOT_VERSION,
+            "key": self.key,
+            "columns": self.columns,
+            "offsets": self.offsets,
+            "events": self.events,
+            "tables": {name: table.state() for name, table in self.tables.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(
+            cls,
+            path: str) -> "Materializer":
+        """
+        Load a snapshot written by `snapshot`. Only load snapshots you wrote yourself.
+
+        Args:
+            path (str): Snapshot file.
+
+        Raises:
+            ValueError: If the file is a snapshot of another version.
+
+        Returns:
+            Materializer: The restored store.
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {state.get('version')}")
+        materializer = cls(state["columns"], state["key"])
+        materializer.offsets = state["offsets"]
+        materializer.events = state["events"]
+        materializer.tables = {name: TableState.from_state(table) for name, table in state["tables"].items()}
+        return materializer
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Materialize the current state of the captured tables")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("-s", "--snapshot_file", default="state.snapshot", help="Snapshot to resume from and write")
+    parser.add_argument("--snapshot_interval", type=float, default=60.0, help="Seconds between snapshots")
+    parser.add_argument("--max_records", type=int, default=5_000)
+    parser.add_argument("--idle_timeout_ms", type=int, default=10_000, help="Stop after this long without records")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if os.path.exists(args.snapshot_file):
+        materializer = Materializer.restore(args.snapshot_file)
+        print(f"restored {args.snapshot_file} in {time.perf_counter() - start:.2f}s: "
+              + ", ".join(f"{name} {len(table)} rows" for name, table in materializer.tables.items()))
+    else:
+        materializer = Materializer()
+    consumer = ChangeEventConsumer(
+        args.topics, args.bootstrap_servers, max_records=args.max_records,
+        start_offsets=materializer.next_offsets())
+    last_snapshot = time.monotonic()
+    try:
+        for batches in consumer.batches(args.idle_timeout_ms):
+            for batch in batches.values():
+                materializer.apply(batch)
+            if time.monotonic() - last_snapshot >= args.snapshot_interval:
+                materializer.snapshot(args.snapshot_file)
+                last_snapshot = time.monotonic()
+    finally:
+        consumer.close()
+        materializer.snapshot(args.snapshot_file)
+    print(f"{materializer.events} events applied ({materializer.skipped} already applied), "
+          + ", ".join(f"{name} {len(table)} rows" for name, table in materializer.tables.items()))
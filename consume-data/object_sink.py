@@ -0,0 +1,305 @@
+import collections
+import datetime
+import io
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from change_events import ChangeEventConsumer, decode_records
+from compaction import hour_prefix, to_table
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from object_store import PART_SIZE
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+Partition = Tuple[str, int]
+
+
+class OpenFile:
+    """Change events of one partition and hour waiting to be written as one file."""
+
+    def __init__(
+            self,
+            hour: int,
+            start_offset: int,
+            opened: float) -> None:
+        """
+        Start an empty file.
+
+        Args:
+            hour (int): Hour of the records' timestamps, in hours since the epoch.
+            start_offset (int): Offset of the first record.
+            opened (float): Clock time the first record arrived.
+        """
+        self.hour = hour
+        self.start_offset = start_offset
+        self.opened = opened
+        self.next_offset = start_offset
+        self.tables: List[pa.Table] = []
+        self.rows = 0
+        self.bytes = 0
+        self.first_timestamp: Optional[int] = None
+
+
+class ObjectSink:
+    """
+    Writes change events from Kafka to an object store as compressed Parquet files.
+
+    Each partition's events go to a file of their own, named like the S3
+    sink's objects after the partition and the offset of its first record,
+    under Hive-style `date=`/`hour=` prefixes as in `compaction.hour_prefix`.
+    A file is rolled when its records reach `max_bytes`, when its first record
+    is `max_age_s` old, or when the records move to the next hour, so file size
+    and freshness are set separately rather than through a record count.
+
+    Rolled files are uploaded by a thread pool while consuming continues,
+    large ones in multipart parts uploaded in parallel. A partition's offset
+    is committed only once all of its files up to that offset are uploaded,
+    so after a crash or rebalance events are written again rather than lost.
+    """
+
+    def __init__(
+            self,
+            consumer: ChangeEventConsumer,
+            store: Any,
+            output: str = "sink/",
+            max_bytes: Optional[int] = 64 * 1024 * 1024,
+            max_age_s: Optional[float] = 300.0,
+            compression: str = "zstd",
+            upload_workers: int = 4,
+            part_size: int = PART_SIZE,
+            max_pending: int = 16,
+            clock: Callable[[], float] = time.time) -> None:
+        """
+        Set up a sink.
+
+        Args:
+            consumer (ChangeEventConsumer): Consumer of the topics, with a group_id to commit to.
+            store (Any): Store to write to, e.g. `object_store.S3ObjectStore`.
+            output (str): Prefix of all files. Defaults to 'sink/'.
+            max_bytes (Optional[int]): Roll a file once its records hold this many bytes of keys and
+                values. Defaults to 64 MiB; None to roll by age only.
+            max_age_s (Optional[float]): Roll a file this many seconds after its first record arrived.
+                Defaults to 300; None to roll by size only.
+            compression (str): Parquet compression codec. Defaults to 'zstd'.
+            upload_workers (int): Files uploaded at the same time. Defaults to 4.
+            part_size (int): Bytes per multipart upload part. Defaults to 8 MiB.
+            max_pending (int): Rolled files waiting for upload before consuming pauses. Defaults to 16.
+            clock (Callable[[], float]): Current time in seconds. Defaults to time.time.
+
+        Raises:
+            ValueError: If neither max_bytes nor max_age_s is set.
+        """
+        if max_bytes is None and max_age_s is None:
+            raise ValueError("Set max_bytes, max_age_s or both, or files would never be rolled")
+        self.consumer = consumer
+        self.store = store
+        self.output = output
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.compression = compression
+        self.part_size = part_size
+        self.max_pending = max_pending
+        self.clock = clock
+        self.files: Dict[Partition, OpenFile] = {}
+        self.uploads: Dict[Partition, Deque[Tuple[Future, int]]] = collections.defaultdict(collections.deque)
+        self.pool = ThreadPoolExecutor(upload_workers)
+        self.stats = {"records": 0, "rows": 0, "files": 0, "bytes_in": 0, "bytes_out": 0, "max_freshness_s": 0.0}
+
+    def _hour(
+            self,
+            record: Any) -> int:
+        """Hours since the epoch of a record's timestamp, or of the clock if it has none."""
+        timestamp = getattr(record, "timestamp", None)
+        return timestamp // 3_600_000 if timestamp is not None and timestamp >= 0 else int(self.clock() // 3_600)
+
+    def _upload(
+            self,
+            key: str,
+            tables: List[pa.Table],
+            first_timestamp: Optional[int]) -> Dict[str, Any]:
+        """Write a file's events as Parquet and upload it; runs on the upload pool."""
+        buffer = io.BytesIO()
+        pq.write_table(pa.concat_tables(tables, promote_options="default"), buffer, compression=self.compression)
+        self.store.put_multipart(key, buffer.getvalue(), self.part_size)
+        freshness = self.clock() - first_timestamp / 1000 if first_timestamp is not None else 0.0
+        return {"key": key, "bytes": buffer.tell(), "freshness_s": freshness}
+
+    def _roll(
+            self,
+            partition: Partition) -> None:
+        """Close a partition's open file and queue its upload."""
+        file = self.files.pop(partition)
+        if file.rows:
+            hour = datetime.datetime(1970, 1, 1) + datetime.timedelta(hours=file.hour)
+            key = f"{hour_prefix(self.output, partition[0], hour)}{partition[1]:010d}-{file.start_offset:020d}.parquet"
+            future = self.pool.submit(self._upload, key, file.tables, file.first_timestamp)
+        else:  # only tombstones: nothing to write, but their offsets can be committed in turn
+            future = Future()
+            future.set_result(None)
+        self.uploads[partition].append((future, file.next_offset))
+
+    def _append(
+            self,
+            topic: str,
+            partition: int,
+            records: List[Any]) -> None:
+        """Add one partition's records to its open files, rolling them on size and hour."""
+        start = 0
+        while start < len(records):
+            file = self.files.get((topic, partition))
+            hour = self._hour(records[start])
+            if file is not None and file.hour != hour:
+                self._roll((topic, partition))
+                file = None
+            if file is None:
+                file = self.files[(topic, partition)] = OpenFile(hour, records[start].offset, self.clock())
+            end, size = start, 0
+            while end < len(records) and self._hour(records[end]) == hour and \
+                    (self.max_bytes is None or file.bytes + size < self.max_bytes):
+                size += len(records[end].value or b"") + len(records[end].key or b"")
+                end += 1
+            file.bytes += size
+            batch = decode_records(self.consumer.decoder, topic, records[start:end])
+            if len(batch):
+                file.tables.append(to_table(batch))
+                file.rows += len(batch)
+                self.stats["rows"] += len(batch)
+                stamped = batch.kafka_ts_ms[batch.kafka_ts_ms >= 0]
+                if len(stamped) and file.first_timestamp is None:
+                    file.first_timestamp = int(stamped.min())
+            file.next_offset = records[end - 1].offset + 1
+            self.stats["records"] += end - start
+            self.stats["bytes_in"] += size
+            if self.max_bytes is not None and file.bytes >= self.max_bytes:
+                self._roll((topic, partition))
+            start = end
+
+    def _commit(
+            self,
+            block: bool = False) -> None:
+        """Commit the offsets of partitions whose uploads are done, in order; raise if an upload failed."""
+        assigned = self.consumer.assignment()
+        offsets = {}
+        for partition, uploads in self.uploads.items():
+            while uploads and (block or uploads[0][0].done()):
+                future, next_offset = uploads.popleft()
+                result = future.result()
+                if result is not None:
+                    self.stats["files"] += 1
+                    self.stats["bytes_out"] += result["bytes"]
+                    self.stats["max_freshness_s"] = max(self.stats["max_freshness_s"], result["freshness_s"])
+                if partition in assigned:
+                    offsets[partition] = next_offset
+        if offsets:
+            self.consumer.commit(offsets)
+
+    def step(
+            self,
+            timeout_ms: int = 1_000) -> int:
+        """
+        Poll once, add the records to open files, roll and upload what is due and commit what is uploaded.
+
+        Args:
+            timeout_ms (int): How long to wait for records. Defaults to 1,000.
+
+        Returns:
+            int: Number of records polled.
+
+        Raises:
+            Exception: Whatever an upload raised; offsets after the failed file are not committed.
+        """
+        while sum(len(uploads) for uploads in self.uploads.values()) >= self.max_pending:
+            wait([uploads[0][0] for uploads in self.uploads.values() if uploads], return_when=FIRST_COMPLETED)
+            self._commit()
+        if self.max_age_s is not None:
+            timeout_ms = min(timeout_ms, int(self.max_age_s * 1000))
+        polled = self.consumer.poll_records(timeout_ms)
+        assigned = self.consumer.assignment()
+        for partition in [partition for partition in self.files if partition not in assigned]:
+            del self.files[partition]  # revoked: the new owner reads these records again
+        for topic, records in polled.items():
+            by_partition: Dict[int, List[Any]] = collections.defaultdict(list)
+            for record in records:
+                by_partition[record.partition].append(record)
+            for partition, partition_records in by_partition.items():
+                self._append(topic, partition, partition_records)
+        if self.max_age_s is not None:
+            now = self.clock()
+            for partition in [partition for partition, file in self.files.items()
+                              if now - file.opened >= self.max_age_s]:
+                self._roll(partition)
+        self._commit()
+        return sum(len(records) for records in polled.values())
+
+    def flush(self) -> None:
+        """
+        Roll every open file, wait for all uploads and commit.
+
+        Returns:
+            None
+        """
+        for partition in list(self.files):
+            self._roll(partition)
+        self._commit(block=True)
+
+    def run(
+            self,
+            idle_timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Consume until stopped, or until no records arrive for `idle_timeout_ms`, then flush.
+
+        Args:
+            idle_timeout_ms (Optional[int]): Stop after an empty poll of this length. Defaults to None
+                (run until interrupted).
+
+        Returns:
+            Dict[str, Any]: Records and rows consumed, files written, bytes in and out, and the
+                largest delay from a record's timestamp to its file being uploaded.
+        """
+        try:
+            while self.step(idle_timeout_ms if idle_timeout_ms is not None else 1_000) or idle_timeout_ms is None:
+                pass
+            self.flush()
+        except KeyboardInterrupt:
+            self.flush()
+        finally:
+            self.pool.shutdown()
+        return dict(self.stats)
+
+
+if __name__ == "__main__":
+    import argparse
+    from object_store import open_store
+
+    parser = argparse.ArgumentParser(description="Write Debezium topics to the object store as Parquet files")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("-g", "--group_id", default="object-sink", help="Consumer group to commit offsets to")
+    parser.add_argument("--converter", choices=["json", "avro"], default="json", help="Converter the connector uses")
+    parser.add_argument(
+        "--schema_registry", default="http://schema-registry:8081", help="Registry URL for --converter avro")
+    parser.add_argument("--bucket", help="Bucket to write to; defaults to $AWS_BUCKET_NAME")
+    parser.add_argument("--endpoint", default="http://minio:9000")
+    parser.add_argument("--directory", help="Write to a local directory instead")
+    parser.add_argument("-o", "--output", default="sink/", help="Prefix to write the files under")
+    parser.add_argument("--max_mb", type=float, default=64, help="Roll files at this many MB of records; 0 for never")
+    parser.add_argument("--max_age_s", type=float, default=300, help="Roll files this old; 0 for never")
+    parser.add_argument("--compression", choices=["zstd", "snappy", "gzip", "none"], default="zstd")
+    parser.add_argument("--upload_workers", type=int, default=4, help="Files uploaded at the same time")
+    parser.add_argument("--idle_timeout_ms", type=int, help="Stop after this long without records")
+    args = parser.parse_args()
+
+    decoder = None
+    if args.converter == "avro":
+        from avro_events import AvroDecoder, HttpSchemaRegistry
+        decoder = AvroDecoder(HttpSchemaRegistry(args.schema_registry))
+    consumer = ChangeEventConsumer(args.topics, args.bootstrap_servers, args.group_id, decoder=decoder)
+    sink = ObjectSink(consumer, open_store(args.directory, args.bucket, args.endpoint), args.output,
+                      int(args.max_mb * 1024 * 1024) or None, args.max_age_s or None, args.compression,
+                      args.upload_workers)
+    try:
+        stats = sink.run(args.idle_timeout_ms)
+    finally:
+        consumer.close()
+    print(f"{stats['records']} records, {stats['bytes_in']:,} bytes -> {stats['files']} files, "
+          f"{stats['bytes_out']:,} bytes; at most {stats['max_freshness_s']:.1f} s from event to upload")
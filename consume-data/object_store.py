@@ -0,0 +1,509 @@
+import datetime
+import hashlib
+import hmac
+import http.client
+import io
+import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+ObjectInfo = namedtuple("ObjectInfo", ["key", "size"])
+
+S3_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+PART_SIZE = 8 * 1024 * 1024  # S3 requires multipart upload parts, except the last, to be 5 MiB or more
+
+
+class S3ObjectStore:
+    """
+    Minimal client for one bucket of an S3-compatible store such as MinIO.
+
+    Uses path-style URLs and signs requests with AWS Signature Version 4 when
+    credentials are given; without them requests are anonymous, which the
+    docker-compose bucket allows. Connections are kept alive and shared
+    between threads through a pool, so many small requests in parallel do
+    not each pay for a new connection.
+    """
+
+    def __init__(
+            self,
+            bucket: str,
+            endpoint: str = "http://minio:9000",
+            access_key: Optional[str] = None,
+            secret_key: Optional[str] = None,
+            region: str = "us-east-1",
+            timeout: float = 60.0) -> None:
+        """
+        Point at a bucket.
+
+        Args:
+            bucket (str): Name of the bucket.
+            endpoint (str): Base URL of the store. Defaults to 'http://minio:9000'.
+            access_key (Optional[str]): Access key id. Defaults to None (anonymous).
+            secret_key (Optional[str]): Secret access key. Defaults to None (anonymous).
+            region (str): Region to sign for. Defaults to 'us-east-1'.
+            timeout (float): Seconds to wait on the network. Defaults to 60.
+        """
+        self.bucket = bucket
+        self.endpoint = endpoint.rstrip("/")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _request(
+            self,
+            method: str,
+            key: str = "",
+            query: Optional[Dict[str, str]] = None,
+            data: bytes = b"") -> urllib.request.Request:
+        """Build a request for a key of the bucket, signed if there are credentials."""
+        path = "/" + urllib.parse.quote(self.bucket, safe="") + "/" + urllib.parse.quote(key, safe="/~")
+        query_string = "&".join(f"{urllib.parse.quote(name, safe='~')}={urllib.parse.quote(value, safe='~')}"
+                                for name, value in sorted((query or {}).items()))
+        url = self.endpoint + path + ("?" + query_string if query_string else "")
+        request = urllib.request.Request(url, data=data if method in ("PUT", "POST") else None, method=method)
+        if self.access_key is None or self.secret_key is None:
+            return request
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date, day = now.strftime("%Y%m%dT%H%M%SZ"), now.strftime("%Y%m%d")
+        payload_hash = hashlib.sha256(data).hexdigest()
+        headers = {"host": urllib.parse.urlsplit(self.endpoint).netloc, "x-amz-content-sha256": payload_hash,
+                   "x-amz-date": amz_date}
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join([
+            method, path, query_string, "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+            signed_headers, payload_hash])
+        scope = f"{day}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()])
+        signing_key = ("AWS4" + self.secret_key).encode()
+        for part in (day, self.region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        request.add_header("x-amz-content-sha256", payload_hash)
+        request.add_header("x-amz-date", amz_date)
+        request.add_header("Authorization", f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                            f"SignedHeaders={signed_headers}, Signature={signature}")
+        return request
+
+    def _connection(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """Take an idle connection from the pool, or open one; also say whether it was reused."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+            self.connections_opened += 1
+        url = urllib.parse.urlsplit(self.endpoint)
+        kind = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        return kind(url.hostname, url.port, timeout=self.timeout), False
+
+    def _release(
+            self,
+            connection: http.client.HTTPConnection,
+            response: http.client.HTTPResponse) -> None:
+        """Give a connection back to the pool if its response was read to the end, else close it."""
+        if response.isclosed() and not response.will_close:
+            with self._lock:
+                self._idle.append(connection)
+        else:
+            response.close()
+            connection.close()
+
+    def _send(
+            self,
+            method: str,
+            key: str = "",
+            query: Optional[Dict[str, str]] = None,
+            data: bytes = b"") -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """Send a request over a pooled connection and return it with the unread response."""
+        request = self._request(method, key, query, data)
+        url = urllib.parse.urlsplit(request.full_url)
+        target = url.path + ("?" + url.query if url.query else "")
+        while True:
+            connection, reused = self._connection()
+            try:
+                connection.request(method, target, body=data if method in ("PUT", "POST") else None,
+                                   headers=dict(request.header_items()))
+                response = connection.getresponse()
+                break
+            except (ConnectionError, http.client.BadStatusLine):
+                connection.close()
+                if not reused:  # a reused connection may have been closed by the server while idle
+                    raise
+        if response.status >= 300:
+            body = response.read()
+            self._release(connection, response)
+            raise urllib.error.HTTPError(request.full_url, response.status, response.reason, response.headers,
+                                         io.BytesIO(body))
+        return connection, response
+
+    def _call(
+            self,
+            method: str,
+            key: str = "",
+            query: Optional[Dict[str, str]] = None,
+            data: bytes = b"") -> bytes:
+        """Send a request and return the whole response body."""
+        connection, response = self._send(method, key, query, data)
+        try:
+            return response.read()
+        finally:
+            self._release(connection, response)
+
+    def list(
+            self,
+            prefix: str = "",
+            start_after: Optional[str] = None) -> Iterator[ObjectInfo]:
+        """
+        List the objects whose keys start with a prefix.
+
+        Args:
+            prefix (str): Key prefix. Defaults to '' (all objects).
+            start_after (Optional[str]): Only list keys that sort after this one. Defaults to None.
+
+        Yields:
+            ObjectInfo: Key and size of each object, in key order.
+        """
+        query = {"list-type": "2", "prefix": prefix}
+        if start_after is not None:
+            query["start-after"] = start_after
+        while True:
+            root = ElementTree.fromstring(self._call("GET", query=query))
+            for item in root.iter(f"{S3_NAMESPACE}Contents"):
+                yield ObjectInfo(item.findtext(f"{S3_NAMESPACE}Key"), int(item.findtext(f"{S3_NAMESPACE}Size")))
+            token = root.findtext(f"{S3_NAMESPACE}NextContinuationToken")
+            if root.findtext(f"{S3_NAMESPACE}IsTruncated") != "true" or not token:
+                return
+            query = {**query, "continuation-token": token}
+
+    def get(
+            self,
+            key: str) -> bytes:
+        """
+        Fetch an object.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            bytes: Its content.
+
+        Raises:
+            FileNotFoundError: If there is no such object.
+        """
+        try:
+            return self._call("GET", key)
+        except urllib.error.HTTPError as error:
+            if error.code == 404:
+                raise FileNotFoundError(key) from error
+            raise
+
+    def open(
+            self,
+            key: str) -> BinaryIO:
+        """
+        Stream an object; close the stream when done with it.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            BinaryIO: Its content, read from the network as it is consumed.
+
+        Raises:
+            FileNotFoundError: If there is no such object.
+        """
+        try:
+            connection, response = self._send("GET", key)
+        except urllib.error.HTTPError as error:
+            if error.code == 404:
+                raise FileNotFoundError(key) from error
+            raise
+        return io.BufferedReader(_PooledBody(self, connection, response), 256 * 1024)
+
+    def put(
+            self,
+            key: str,
+            data: bytes) -> None:
+        """
+        Store an object, replacing any object with the same key.
+
+        Args:
+            key (str): Key of the object.
+            data (bytes): Its content.
+
+        Returns:
+            None
+        """
+        self._call("PUT", key, data=data)
+
+    def put_multipart(
+            self,
+            key: str,
+            data: bytes,
+            part_size: int = PART_SIZE,
+            workers: int = 4) -> None:
+        """
+        Store an object in parts uploaded in parallel; objects of one part are stored with `put`.
+
+        The upload is aborted if any part fails, so no parts are left behind.
+
+        Args:
+            key (str): Key of the object.
+            data (bytes): Its content.
+            part_size (int): Bytes per part; at least 5 MiB for S3. Defaults to 8 MiB.
+            workers (int): Parts uploaded at the same time. Defaults to 4.
+
+        Returns:
+            None
+
+        Raises:
+            OSError: If the store rejects the completed upload.
+        """
+        if len(data) <= part_size:
+            self.put(key, data)
+            return
+        upload_id = ElementTree.fromstring(self._call("POST", key, {"uploads": ""})).findtext(
+            f"{S3_NAMESPACE}UploadId")
+
+        def upload(number: int) -> str:
+            start = (number - 1) * part_size
+            connection, response = self._send("PUT", key, {"partNumber": str(number), "uploadId": upload_id},
+                                              data[start:start + part_size])
+            try:
+                response.read()
+                return response.getheader("ETag")
+            finally:
+                self._release(connection, response)
+
+        try:
+            with ThreadPoolExecutor(workers) as pool:
+                etags = list(pool.map(upload, range(1, -(-len(data) // part_size) + 1)))
+            parts = "".join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                            for number, etag in enumerate(etags, 1))
+            result = ElementTree.fromstring(self._call(
+                "POST", key, {"uploadId": upload_id},
+                f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode()))
+            if result.tag == "Error":  # S3 may report a failed completion with status 200
+                raise OSError(f"Completing the upload of {key} failed: {result.findtext('Message')}")
+        except BaseException:
+            try:
+                self._call("DELETE", key, {"uploadId": upload_id})
+            except (OSError, http.client.HTTPException):
+                pass  # keep the original error; the store can expire the upload
+            raise
+
+    def delete(
+            self,
+            key: str) -> None:
+        """
+        Remove an object; removing a missing object is not an error.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            None
+        """
+        self._call("DELETE", key)
+
+
+class _PooledBody(io.RawIOBase):
+    """Body of a streamed response, whose connection goes back to the pool once it is closed."""
+
+    def __init__(
+            self,
+            store: S3ObjectStore,
+            connection: http.client.HTTPConnection,
+            response: http.client.HTTPResponse) -> None:
+        self.store = store
+        self.connection = connection
+        self.response = response
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self.response.readinto(buffer)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.store._release(self.connection, self.response)
+        super().close()
+
+
+class LocalObjectStore:
+    """
+    Object store stand-in backed by a directory, with keys as relative paths.
+
+    Leading slashes of keys and prefixes are ignored, as in a file system.
+    Used by tests, and to replay or write archives without a running store.
+    """
+
+    def __init__(
+            self,
+            directory: str) -> None:
+        """
+        Open or create a store directory.
+
+        Args:
+            directory (str): Directory holding the objects; created if missing.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(
+            self,
+            key: str) -> str:
+        """File that holds an object."""
+        return os.path.join(self.directory, *key.strip("/").split("/"))
+
+    def list(
+            self,
+            prefix: str = "",
+            start_after: Optional[str] = None) -> Iterator[ObjectInfo]:
+        """
+        List the objects whose keys start with a prefix.
+
+        Args:
+            prefix (str): Key prefix. Defaults to '' (all objects).
+            start_after (Optional[str]): Only list keys that sort after this one. Defaults to None.
+
+        Yields:
+            ObjectInfo: Key and size of each object, in key order.
+        """
+        prefix = prefix.lstrip("/")
+        start_after = start_after.lstrip("/") if start_after is not None else None
+        keys = []
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                if key.startswith(prefix) and not name.endswith(".tmp") and (start_after is None or key > start_after):
+                    keys.append((key, os.path.getsize(path)))
+        for key, size in sorted(keys):
+            yield ObjectInfo(key, size)
+
+    def get(
+            self,
+            key: str) -> bytes:
+        """
+        Read an object.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            bytes: Its content.
+
+        Raises:
+            FileNotFoundError: If there is no such object.
+        """
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def open(
+            self,
+            key: str) -> BinaryIO:
+        """
+        Stream an object; close the stream when done with it.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            BinaryIO: Its content.
+
+        Raises:
+            FileNotFoundError: If there is no such object.
+        """
+        return open(self._path(key), "rb")
+
+    def put(
+            self,
+            key: str,
+            data: bytes) -> None:
+        """
+        Store an object atomically, replacing any object with the same key.
+
+        Args:
+            key (str): Key of the object.
+            data (bytes): Its content.
+
+        Returns:
+            None
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def put_multipart(
+            self,
+            key: str,
+            data: bytes,
+            part_size: int = PART_SIZE,
+            workers: int = 4) -> None:
+        """
+        Store an object atomically; a file needs no parts, so this is `put`.
+
+        Args:
+            key (str): Key of the object.
+            data (bytes): Its content.
+            part_size (int): Ignored. Defaults to 8 MiB.
+            workers (int): Ignored. Defaults to 4.
+
+        Returns:
+            None
+        """
+        self.put(key, data)
+
+    def delete(
+            self,
+            key: str) -> None:
+        """
+        Remove an object; removing a missing object is not an error.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            None
+        """
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def open_store(
+        directory: Optional[str] = None,
+        bucket: Optional[str] = None,
+        endpoint: str = "http://minio:9000") -> Union[LocalObjectStore, S3ObjectStore]:
+    """
+    Open the sink's bucket, or a local directory standing in for it.
+
+    Credentials are read from AWS_KEY_ID and AWS_SECRET_KEY, as in .env.
+
+    Args:
+        directory (Optional[str]): Use this directory instead of a bucket. Defaults to None.
+        bucket (Optional[str]): Name of the bucket. Defaults to None ($AWS_BUCKET_NAME, else 'commerce').
+        endpoint (str): Base URL of the store. Defaults to 'http://minio:9000'.
+
+    Returns:
+        Union[LocalObjectStore, S3ObjectStore]: The store.
+    """
+    if directory:
+        return LocalObjectStore(directory)
+    return S3ObjectStore(bucket or os.getenv("AWS_BUCKET_NAME", "commerce"), endpoint,
+                         os.getenv("AWS_KEY_ID"), os.getenv("AWS_SECRET_KEY"))
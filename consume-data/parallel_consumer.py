@@ -0,0 +1,294 @@
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+import zlib
+import numpy as np
+from change_events import ChangeBatch, ChangeEventConsumer, EnvelopeDecoder, decode_records
+from collections import namedtuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# The parts of a Kafka record a worker needs; smaller to pickle than a ConsumerRecord
+Message = namedtuple("Message", ["partition", "offset", "timestamp", "key", "value"])
+
+Handler = Callable[[str, ChangeBatch], Any]
+
+
+class WorkerError(RuntimeError):
+    """A worker failed on its share of a batch, so the batch was not committed."""
+
+
+def route(
+        message: Any,
+        workers: int) -> int:
+    """
+    Pick the worker for a message.
+
+    Debezium keys each message with the row's primary key, so hashing the raw
+    key bytes sends every change of a row to the same worker without decoding
+    anything. Messages without a key are routed by partition.
+
+    Args:
+        message (Any): A record with key and partition attributes.
+        workers (int): Number of workers.
+
+    Returns:
+        int: Index of the worker.
+    """
+    if message.key is None:
+        return message.partition % workers
+    return zlib.crc32(message.key) % workers
+
+
+def _work(
+        worker_id: int,
+        handler: Handler,
+        decoder: Optional[Any],
+        tasks: Any,
+        results: Any) -> None:
+    """
+    Worker process loop: decode each share of a batch and pass it to the handler.
+
+    Args:
+        worker_id (int): Index of this worker.
+        handler (Handler): This worker's copy of the handler.
+        decoder (Optional[Any]): Decoder for message values; None for an EnvelopeDecoder.
+        tasks (Any): Queue of (sequence number, messages by topic); None to stop.
+        results (Any): Queue for (sequence number, worker id, events, handler results, error).
+
+    Returns:
+        None
+    """
+    decoder = decoder if decoder is not None else EnvelopeDecoder()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, shares = task
+        try:
+            events, outputs = 0, []
+            for topic, messages in shares.items():
+                batch = decode_records(decoder, topic, messages)
+                events += len(batch)
+                outputs.append(handler(topic, batch))
+            results.put((seq, worker_id, events, outputs, None))
+        except Exception:
+            results.put((seq, worker_id, 0, None, traceback.format_exc()))
+    close = getattr(handler, "close", None)
+    if close is not None:
+        close()
+
+
+class ParallelConsumer:
+    """
+    Spreads the change events of each polled batch over a pool of worker processes.
+
+    Events are routed by primary key (see `route`), so all changes of a row
+    are handled by the same worker in offset order, while different rows are
+    handled in parallel. Each worker decodes its own share, so decoding scales
+    with the workers too. Offsets are committed only once every worker has
+    finished its share of a batch; if one fails, nothing is committed and the
+    batch is delivered again after a restart (at-least-once).
+
+    Scaling across partitions works the usual Kafka way: run one
+    ParallelConsumer per machine with the same group id. Rebalances happen
+    inside `poll`, after the previous batch was committed.
+    """
+
+    def __init__(
+            self,
+            consumer: ChangeEventConsumer,
+            handler: Handler,
+            workers: Optional[int] = None,
+            decoder: Optional[Any] = None,
+            start_method: str = "spawn") -> None:
+        """
+        Start the worker processes.
+
+        Args:
+            consumer (ChangeEventConsumer): Source of the batches, or anything with
+                `poll_records(timeout_ms)`, `commit()` and a `group_id` attribute.
+            handler (Handler): Called as handler(topic, batch) in the workers. It must be
+                picklable; every worker gets its own copy, so it may keep per-key state.
+                If it has a `close()` method, that is called when its worker stops.
+            workers (Optional[int]): Number of worker processes. Defaults to None (one per CPU).
+            decoder (Optional[Any]): Decoder the workers use, e.g. an `avro_events.AvroDecoder`.
+                Defaults to None (EnvelopeDecoder).
+            start_method (str): multiprocessing start method. Defaults to 'spawn', which is
+                safe with the consumer's background threads.
+        """
+        self.consumer = consumer
+        self.workers = workers or os.cpu_count() or 1
+        self.seq = 0
+        self.events = 0
+        self.batches = 0
+        context = multiprocessing.get_context(start_method)
+        self.results = context.Queue()
+        self.tasks = [context.Queue() for _ in range(self.workers)]
+        self.processes = [
+            context.Process(
+                target=_work, args=(i, handler, decoder, self.tasks[i], self.results),
+                name=f"change-worker-{i}", daemon=True)
+            for i in range(self.workers)]
+        for process in self.processes:
+            process.start()
+
+    def process(
+            self,
+            records: Dict[str, Sequence[Any]]) -> List[Any]:
+        """
+        Process one batch of records and wait until every worker is done with it.
+
+        Args:
+            records (Dict[str, Sequence[Any]]): Raw records by topic, in partition and offset
+                order, as returned by `ChangeEventConsumer.poll_records`.
+
+        Raises:
+            WorkerError: If a worker's handler raised or a worker died.
+
+        Returns:
+            List[Any]: The handler results, by worker and then by topic.
+        """
+        shares: List[Dict[str, List[Message]]] = [{} for _ in range(self.workers)]
+        for topic, topic_records in records.items():
+            for record in topic_records:
+                message = Message(record.partition, record.offset, record.timestamp, record.key, record.value)
+                shares[route(message, self.workers)].setdefault(topic, []).append(message)
+
+        self.seq += 1
+        busy = [i for i, share in enumerate(shares) if share]
+        for i in busy:
+            self.tasks[i].put((self.seq, shares[i]))
+
+        outputs: Dict[int, List[Any]] = {}
+        errors = []
+        while len(outputs) + len(errors) < len(busy):
+            seq, worker_id, events, output, error = self._result(busy)
+            if seq != self.seq:
+                continue  # left by a batch that failed before all its workers answered
+            if error is not None:
+                errors.append(f"worker {worker_id}: {error}")
+            else:
+                outputs[worker_id] = output
+                self.events += events
+        if errors:
+            raise WorkerError("\n".join(errors))
+        self.batches += 1
+        return [output for i in sorted(outputs) for output in outputs[i]]
+
+    def _result(
+            self,
+            busy: List[int]) -> Tuple[int, int, int, Optional[List[Any]], Optional[str]]:
+        """
+        Wait for the next worker result, failing if a busy worker died.
+
+        Args:
+            busy (List[int]): Workers that were given a share of the current batch.
+
+        Raises:
+            WorkerError: If one of them exited.
+
+        Returns:
+            Tuple[int, int, int, Optional[List[Any]], Optional[str]]: Sequence number, worker id,
+                events, handler results and error.
+        """
+        while True:
+            try:
+                return self.results.get(timeout=1.0)
+            except queue.Empty:
+                for i in busy:
+                    if not self.processes[i].is_alive():
+                        raise WorkerError(f"worker {i} exited with code {self.processes[i].exitcode}")
+
+    def run(
+            self,
+            idle_timeout_ms: int = 1_000,
+            on_batch: Optional[Callable[[List[Any]], None]] = None) -> int:
+        """
+        Poll, process and commit batches until no records arrive for `idle_timeout_ms`.
+
+        Args:
+            idle_timeout_ms (int): Stop after an empty poll of this length. Defaults to 1,000.
+            on_batch (Optional[Callable[[List[Any]], None]]): Called with the handler results
+                of each batch, after its offsets were committed. Defaults to None.
+
+        Raises:
+            WorkerError: If a batch failed; its offsets are not committed.
+
+        Returns:
+            int: Number of events processed.
+        """
+        while True:
+            records = self.consumer.poll_records(idle_timeout_ms)
+            if not records:
+                return self.events
+            outputs = self.process(records)
+            if self.consumer.group_id is not None:
+                self.consumer.commit()
+            if on_batch is not None:
+                on_batch(outputs)
+
+    def close(self) -> None:
+        """
+        Stop the workers, letting them finish what they were given.
+
+        Returns:
+            None
+        """
+        for tasks in self.tasks:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+
+class OpCounter:
+    """Handler that counts the events of each batch by operation."""
+
+    def __call__(
+            self,
+            topic: str,
+            batch: ChangeBatch) -> Dict[str, Any]:
+        """
+        Count one batch.
+
+        Args:
+            topic (str): Topic of the batch.
+            batch (ChangeBatch): The decoded events.
+
+        Returns:
+            Dict[str, Any]: The topic, process id and event count per operation.
+        """
+        ops, counts = np.unique(batch.op, return_counts=True)
+        return {"topic": topic, "pid": os.getpid(), "ops": {str(op): int(n) for op, n in zip(ops, counts)}}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Consume Debezium topics with a pool of worker processes")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("-b", "--bootstrap_servers", nargs="+", default=["kafka:9092"])
+    parser.add_argument("-g", "--group_id", help="Consumer group to commit offsets to")
+    parser.add_argument("-w", "--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--max_records", type=int, default=5_000)
+    parser.add_argument("--idle_timeout_ms", type=int, default=10_000, help="Stop after this long without records")
+    args = parser.parse_args()
+
+    def report(outputs: List[Dict[str, Any]]) -> None:
+        for output in outputs:
+            print(f"{output['topic']} [worker pid {output['pid']}]: {output['ops']}")
+
+    consumer = ChangeEventConsumer(args.topics, args.bootstrap_servers, args.group_id, args.max_records)
+    runtime = ParallelConsumer(consumer, OpCounter(), args.workers)
+    start = time.perf_counter()
+    try:
+        events = runtime.run(args.idle_timeout_ms, report)
+    finally:
+        runtime.close()
+        consumer.close()
+    print(f"{events} events in {runtime.batches} batches on {runtime.workers} workers, "
+          f"{events / (time.perf_counter() - start):,.0f} events/sec")
@@ -0,0 +1,312 @@
+import datetime
+import hashlib
+import io
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from collections import defaultdict
+from compaction import MANIFEST, read_manifest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+INDEX = "_lsn_index.json"
+STATE = "_state.json"
+
+# Change order within a key, newest first; rows without an lsn sort last
+NEWEST_FIRST = [("lsn", "descending"), ("partition", "descending"), ("offset", "descending")]
+
+
+def build_index(
+        store: Any,
+        topic: str,
+        output: str = "compacted/",
+        workers: int = 8) -> Dict[str, Any]:
+    """
+    Return the LSN and timestamp ranges of every compacted file of a topic.
+
+    The hour manifests written by `compaction.compact_hour` are the source of
+    truth; the index caches them in one small object per topic. One listing
+    of the topic's compacted files tells which hours changed since the index
+    was written, because part files are named after the sources they hold:
+    only those hours' manifests are read again.
+
+    Args:
+        store (Any): Object store holding the compacted files.
+        topic (str): The topic.
+        output (str): Prefix of all compacted output. Defaults to 'compacted/'.
+        workers (int): Manifests fetched in parallel. Defaults to 8.
+
+    Returns:
+        Dict[str, Any]: The topic and, per hour prefix, the hour and its files, each with its full key,
+            row count and min/max lsn and source timestamp.
+    """
+    root = f"{output}{topic}/"
+    try:
+        cached = json.loads(store.get(root + INDEX))
+    except FileNotFoundError:
+        cached = {"topic": topic, "hours": {}}
+
+    listed: Dict[str, Set[str]] = defaultdict(set)
+    prefixes = []
+    for info in store.list(root):
+        prefix, name = info.key.rsplit("/", 1)
+        if name == MANIFEST:
+            prefixes.append(prefix + "/")
+        elif name.endswith(".parquet"):
+            listed[prefix + "/"].add(info.key)
+
+    hours = {prefix: cached["hours"][prefix] for prefix in prefixes
+             if prefix in cached["hours"] and {file["key"] for file in cached["hours"][prefix]["files"]}
+             == listed[prefix]}
+    changed = [prefix for prefix in prefixes if prefix not in hours]
+    with ThreadPoolExecutor(workers) as pool:
+        for prefix, manifest in zip(changed, pool.map(lambda prefix: read_manifest(store, prefix), changed)):
+            if manifest is not None:
+                hours[prefix] = {"hour": manifest["hour"],
+                                 "files": [{**file, "key": prefix + file["key"]} for file in manifest["files"]]}
+    index = {"topic": topic, "hours": dict(sorted(hours.items()))}
+    if index != cached:
+        store.put(root + INDEX, json.dumps(index).encode())
+    return index
+
+
+def latest(
+        events: pa.Table,
+        key: str = "id") -> pa.Table:
+    """
+    Keep the newest change of each key, in lsn, partition and offset order.
+
+    Deletes are kept, so that merging the result with older changes again
+    cannot bring a deleted row back; see `current_rows` for the live rows.
+
+    Args:
+        events (pa.Table): Flattened change events, as written by `compaction.flatten`.
+        key (str): Primary key column. Defaults to 'id'.
+
+    Returns:
+        pa.Table: One change per key, sorted by key.
+    """
+    keys = pc.coalesce(events.column(f"after_{key}"), events.column(f"before_{key}"))
+    events = events.append_column("_key", keys).filter(pc.is_valid(keys))
+    events = events.sort_by([("_key", "ascending")] + NEWEST_FIRST)
+    keys = events.column("_key").to_numpy()
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return events.filter(pa.array(first)).select(events.column_names[:-1])
+
+
+def current_rows(
+        changes: pa.Table) -> pa.Table:
+    """
+    Turn the newest change per key into table rows.
+
+    Args:
+        changes (pa.Table): Output of `latest`.
+
+    Returns:
+        pa.Table: The after_ columns of the non-delete changes without their prefix, plus _lsn and
+            _source_ts_ms of the change that wrote each row.
+    """
+    live = changes.filter(pc.not_equal(changes.column("op"), "d"))
+    columns = {name[len("after_"):]: live.column(name) for name in live.column_names if name.startswith("after_")}
+    return pa.table({**columns, "_lsn": live.column("lsn"), "_source_ts_ms": live.column("source_ts_ms")})
+
+
+def read_files(
+        store: Any,
+        keys: Sequence[str],
+        workers: int = 8) -> Optional[pa.Table]:
+    """
+    Read Parquet files in parallel into one table, widening schemas that differ.
+
+    Args:
+        store (Any): Object store holding the files.
+        keys (Sequence[str]): Keys of the files.
+        workers (int): Files fetched in parallel. Defaults to 8.
+
+    Returns:
+        Optional[pa.Table]: Their rows, or None if there are no files.
+    """
+    if not keys:
+        return None
+    with ThreadPoolExecutor(workers) as pool:
+        tables = list(pool.map(lambda key: pq.read_table(io.BytesIO(store.get(key))), keys))
+    return pa.concat_tables(tables, promote_options="default")
+
+
+class StateTable:
+    """
+    Current and past state of one table, merged on read from its compacted change events.
+
+    The current state is kept next to the compacted files as a Parquet file
+    holding the newest change per key, deletes included, and a `_state.json`
+    naming it and the compacted files already merged. A refresh merges only
+    the files that are new since; an hour that was recompacted because of
+    late objects has new file names and is merged again, which is safe as
+    merging is idempotent. Late changes may carry lower LSNs than ones
+    already merged, so progress is tracked by file rather than by LSN.
+    """
+
+    def __init__(
+            self,
+            store: Any,
+            topic: str,
+            output: str = "compacted/",
+            key: str = "id",
+            workers: int = 8) -> None:
+        """
+        Point at a topic's compacted change events.
+
+        Args:
+            store (Any): Object store holding the compacted files.
+            topic (str): The topic.
+            output (str): Prefix of all compacted output. Defaults to 'compacted/'.
+            key (str): Primary key column. Defaults to 'id'.
+            workers (int): Files fetched in parallel. Defaults to 8.
+        """
+        self.store = store
+        self.topic = topic
+        self.output = output
+        self.key = key
+        self.workers = workers
+        self.prefix = f"{output}_state/{topic}/"
+
+    def files(self) -> List[Dict[str, Any]]:
+        """
+        List the compacted files of the topic, from its index.
+
+        Returns:
+            List[Dict[str, Any]]: Key, rows and min/max lsn and source timestamp of each file.
+        """
+        index = build_index(self.store, self.topic, self.output, self.workers)
+        return [file for hour in index["hours"].values() for file in hour["files"]]
+
+    def state(self) -> Optional[Dict[str, Any]]:
+        """
+        Read the description of the stored current state.
+
+        Returns:
+            Optional[Dict[str, Any]]: The state's data file, merged files, row counts and highest lsn,
+                or None if it was never built.
+        """
+        try:
+            return json.loads(self.store.get(self.prefix + STATE))
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> Dict[str, Any]:
+        """
+        Merge the compacted files that are new since the last refresh into the current state.
+
+        Returns:
+            Dict[str, Any]: The new state description, with the number of files merged this time.
+        """
+        files = self.files()
+        state = self.state()
+        merged = set(state["files"]) if state is not None else set()
+        new = [file["key"] for file in files if file["key"] not in merged]
+        if not new:
+            return {**(state or {"files": [], "rows": 0, "keys": 0, "lsn": None}), "merged": 0}
+
+        tables = [read_files(self.store, new, self.workers)]
+        if state is not None:
+            tables.insert(0, pq.read_table(io.BytesIO(self.store.get(self.prefix + state["data"]))))
+        changes = latest(pa.concat_tables(tables, promote_options="default"), self.key)
+
+        current = {file["key"] for file in files}
+        keys = sorted((merged & current) | set(new))
+        version = hashlib.sha1("\n".join(keys).encode()).hexdigest()[:8]
+        data = f"state-{version}.parquet"
+        buffer = io.BytesIO()
+        pq.write_table(changes, buffer, compression="zstd")
+        self.store.put(self.prefix + data, buffer.getvalue())
+        updated = {
+            "topic": self.topic,
+            "data": data,
+            "files": keys,
+            "keys": len(changes),
+            "rows": len(changes.filter(pc.not_equal(changes.column("op"), "d"))),
+            "lsn": pc.max(changes.column("lsn")).as_py(),
+            "refreshed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        }
+        self.store.put(self.prefix + STATE, json.dumps(updated, indent=2).encode())
+        if state is not None and state["data"] != data:
+            self.store.delete(self.prefix + state["data"])
+        return {**updated, "merged": len(new)}
+
+    def current(self) -> pa.Table:
+        """
+        Return the table's rows as of the last refresh.
+
+        Returns:
+            pa.Table: One row per live key; empty if the state was never built.
+        """
+        state = self.state()
+        if state is None:
+            return pa.table({})
+        return current_rows(pq.read_table(io.BytesIO(self.store.get(self.prefix + state["data"]))))
+
+    def as_of(
+            self,
+            lsn: Optional[int] = None,
+            ts_ms: Optional[int] = None) -> pa.Table:
+        """
+        Return the table's rows as they were at an lsn or a source timestamp.
+
+        Only the compacted files whose changes start at or before that point
+        are read, using the index.
+
+        Args:
+            lsn (Optional[int]): Include changes up to this lsn. Defaults to None (no limit).
+            ts_ms (Optional[int]): Include changes committed up to this time, in epoch milliseconds.
+                Defaults to None (no limit).
+
+        Returns:
+            pa.Table: One row per key live at that point.
+        """
+        keys = [file["key"] for file in self.files()
+                if (lsn is None or file["min_lsn"] is None or file["min_lsn"] <= lsn)
+                and (ts_ms is None or file.get("min_ts_ms") is None or file["min_ts_ms"] <= ts_ms)]
+        events = read_files(self.store, keys, self.workers)
+        if events is None:
+            return pa.table({})
+        if lsn is not None:
+            events = events.filter(pc.less_equal(events.column("lsn"), lsn))
+        if ts_ms is not None:
+            events = events.filter(pc.less_equal(events.column("source_ts_ms"), ts_ms))
+        return current_rows(latest(events, self.key))
+
+
+if __name__ == "__main__":
+    import argparse
+    from object_store import open_store
+
+    parser = argparse.ArgumentParser(description="Build current or past table state from the compacted archive")
+    parser.add_argument(
+        "-t", "--topics", nargs="+", default=["debezium.commerce.users", "debezium.commerce.products"])
+    parser.add_argument("--bucket", help="Bucket to read; defaults to $AWS_BUCKET_NAME")
+    parser.add_argument("--endpoint", default="http://minio:9000")
+    parser.add_argument("--directory", help="Read a local copy of the bucket instead")
+    parser.add_argument("-o", "--output", default="compacted/", help="Prefix the compacted files are under")
+    parser.add_argument("--as_of_lsn", type=int, help="Show the state at this lsn instead of refreshing")
+    parser.add_argument("--as_of", type=datetime.datetime.fromisoformat,
+                        help="Show the state at this time (UTC), e.g. 2024-01-31T13:30, instead of refreshing")
+    parser.add_argument("--parquet", help="Write the rows to this local Parquet file, with the topic appended")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Files fetched in parallel")
+    args = parser.parse_args()
+
+    store = open_store(args.directory, args.bucket, args.endpoint)
+    as_of_ms = int(args.as_of.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000) if args.as_of else None
+    for topic in args.topics:
+        table = StateTable(store, topic, args.output, workers=args.workers)
+        if args.as_of_lsn is None and as_of_ms is None:
+            state = table.refresh()
+            print(f"{topic}: merged {state['merged']} new files, {state['rows']} rows, up to lsn {state['lsn']}")
+            rows = table.current() if args.parquet else None
+        else:
+            rows = table.as_of(args.as_of_lsn, as_of_ms)
+            print(f"{topic}: {len(rows)} rows")
+        if args.parquet:
+            pq.write_table(rows, f"{args.parquet}.{topic}.parquet")
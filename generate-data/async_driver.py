@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+import psycopg
+from typing import Optional, Tuple
+from user_product_data import (
+    POSTGRES_DB,
+    POSTGRES_HOSTNAME,
+    POSTGRES_PASSWORD,
+    POSTGRES_USER,
+    SCHEMA,
+    fake,
+    generate_product_batch,
+    generate_user_batch,
+    shard_ranges,
+    use_value_pools,
+)
+
+INSERT_USER = f"INSERT INTO {SCHEMA}.users (id, username, email_address) VALUES (%s, %s, %s)"
+INSERT_PRODUCT = f"INSERT INTO {SCHEMA}.products (id, name, description, price) VALUES (%s, %s, %s, %s)"
+UPDATE_USER = f"UPDATE {SCHEMA}.users SET username = %s WHERE id = %s"
+UPDATE_PRODUCT = f"UPDATE {SCHEMA}.products SET name = %s WHERE id = %s"
+DELETE_USER = f"DELETE FROM {SCHEMA}.users WHERE id = %s"
+DELETE_PRODUCT = f"DELETE FROM {SCHEMA}.products WHERE id = %s"
+
+
+async def connect_async() -> psycopg.AsyncConnection:
+    """
+    Open an autocommit async connection to the source database.
+
+    Returns:
+        psycopg.AsyncConnection: A new database connection.
+    """
+    return await psycopg.AsyncConnection.connect(
+        dbname=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        host=POSTGRES_HOSTNAME,
+        autocommit=True)
+
+
+async def run_shard_pipelined(
+        conn: psycopg.AsyncConnection,
+        shard: Tuple[int, int],
+        pipeline_depth: int = 500,
+        should_update: Optional[bool] = False,
+        should_delete: Optional[bool] = False) -> int:
+    """
+    Run the insert/update/delete workload for one shard in pipeline mode.
+
+    Statements are queued without waiting for their results and the pipeline
+    is synchronised once every `pipeline_depth` records. Every statement or
+    statement pair commits on its own, exactly as `gen_user_product_data`
+    does, so Debezium sees the same transaction shape.
+
+    Args:
+        conn (psycopg.AsyncConnection): An autocommit connection owned by this shard.
+        shard (Tuple[int, int]): (first_id, num_records) of the shard.
+        pipeline_depth (int): Records queued per pipeline sync. Defaults to 500.
+        should_update (Optional[bool]): Set to True to force the update. Defaults to False.
+        should_delete (Optional[bool]): Set to True to force the delete. Defaults to False.
+
+    Returns:
+        int: Number of statements executed.
+    """
+    first_id, num_records = shard
+    end_id = first_id + num_records
+    statements = 0
+
+    for start in range(first_id, end_id, pipeline_depth):
+        ids = range(start, min(start + pipeline_depth, end_id))
+        users = generate_user_batch(ids)
+        products = generate_product_batch(ids)
+
+        async with conn.pipeline():
+            async with conn.cursor() as cur:
+                for user, product in zip(users, products):
+                    id = user["id"]
+                    await cur.execute(INSERT_USER, (id, user["username"], user["email_address"]))
+                    await cur.execute(
+                        INSERT_PRODUCT,
+                        (id, product["name"], product["description"], product["price"]))
+                    statements += 2
+                    if should_update or random.randint(1, 100) >= 90:
+                        async with conn.transaction():
+                            await cur.execute(UPDATE_USER, (fake.user_name(), id))
+                            await cur.execute(UPDATE_PRODUCT, (fake.name(), id))
+                        statements += 2
+                    if should_delete or random.randint(1, 100) >= 95:
+                        async with conn.transaction():
+                            await cur.execute(DELETE_USER, (id,))
+                            await cur.execute(DELETE_PRODUCT, (id,))
+                        statements += 2
+    return statements
+
+
+async def gen_user_product_data_async(
+        num_records: int,
+        connections: int = 4,
+        pipeline_depth: int = 500,
+        should_update: Optional[bool] = False,
+        should_delete: Optional[bool] = False) -> Tuple[int, float]:
+    """
+    Generate records over a small set of pipelined async connections.
+
+    The ids 1..num_records are split into one disjoint shard per connection,
+    so all statements for an id go through the same connection in order.
+
+    Args:
+        num_records (int): Number of records to generate.
+        connections (int): Number of concurrent connections. Defaults to 4.
+        pipeline_depth (int): Records queued per pipeline sync. Defaults to 500.
+        should_update (Optional[bool]): Set to True to force the update. Defaults to False.
+        should_delete (Optional[bool]): Set to True to force the delete. Defaults to False.
+
+    Returns:
+        Tuple[int, float]: Statements executed and elapsed seconds.
+    """
+    shards = shard_ranges(num_records, connections)
+    conns = await asyncio.gather(*(connect_async() for _ in shards))
+    start = time.perf_counter()
+    try:
+        counts = await asyncio.gather(*(
+            run_shard_pipelined(conn, shard, pipeline_depth, should_update, should_delete)
+            for conn, shard in zip(conns, shards)
+        ))
+    finally:
+        for conn in conns:
+            await conn.close()
+    return sum(counts), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pipelined asyncio workload driver")
+    parser.add_argument("-n", "--num_records", type=int, default=100_000)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--pipeline_depth", type=int, default=500)
+    parser.add_argument("-e", "--engine", choices=["faker", "pool"], default="faker")
+    parser.add_argument("--pool_size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    if args.engine == "pool":
+        use_value_pools(args.pool_size)
+
+    statements, elapsed = asyncio.run(
+        gen_user_product_data_async(args.num_records, args.connections, args.pipeline_depth))
+    print(f"{statements} statements over {args.connections} connections: "
+          f"{statements / elapsed:,.0f} statements/sec")
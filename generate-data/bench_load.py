@@ -0,0 +1,112 @@
+import time
+import psycopg2
+from typing import Optional
+from user_product_data import (
+    POSTGRES_DB,
+    POSTGRES_HOSTNAME,
+    POSTGRES_PASSWORD,
+    POSTGRES_USER,
+    SCHEMA,
+    ValuePools,
+    gen_user_product_data,
+    gen_user_product_data_bulk,
+    generate_product_batch,
+    generate_user_batch,
+    use_value_pools,
+)
+
+
+def truncate_tables(conn: str) -> None:
+    """
+    Empty the users and products tables so every run starts from id 1.
+
+    Args:
+        conn (str): The database connection.
+
+    Returns:
+        None
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {SCHEMA}.users, {SCHEMA}.products")
+    conn.commit()
+
+
+def bench_generation(
+        num_records: int,
+        pools: Optional[ValuePools] = None) -> float:
+    """
+    Time row generation alone, without touching the database.
+
+    Args:
+        num_records (int): Number of user and product records to generate.
+        pools (Optional[ValuePools]): Value pools to sample from, or None for Faker.
+
+    Returns:
+        float: Generated rows (users + products) per second.
+    """
+    ids = range(1, num_records + 1)
+    start = time.perf_counter()
+    if pools is not None:
+        pools.users(ids)
+        pools.products(ids)
+    else:
+        generate_user_batch(ids)
+        generate_product_batch(ids)
+    elapsed = time.perf_counter() - start
+    return 2 * num_records / elapsed
+
+
+def bench(
+        conn: str,
+        mode: str,
+        num_records: int,
+        chunk_size: int) -> float:
+    """
+    Time one generator run and return the insert throughput.
+
+    Args:
+        conn (str): The database connection.
+        mode (str): 'row' or 'bulk'.
+        num_records (int): Number of records to generate.
+        chunk_size (int): Records per COPY chunk in bulk mode.
+
+    Returns:
+        float: Inserted rows (users + products) per second.
+    """
+    truncate_tables(conn)
+    start = time.perf_counter()
+    if mode == "bulk":
+        gen_user_product_data_bulk(conn, num_records, chunk_size)
+    else:
+        gen_user_product_data(conn, num_records)
+    elapsed = time.perf_counter() - start
+    return 2 * num_records / elapsed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compare per-row and COPY-based load throughput. "
+                    "Truncates the users and products tables before each run."
+    )
+    parser.add_argument("-n", "--num_records", type=int, default=20_000)
+    parser.add_argument("-c", "--chunk_size", type=int, default=10_000)
+    parser.add_argument("-e", "--engine", choices=["faker", "pool"], default="faker")
+    parser.add_argument("--pool_size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    faker_rate = bench_generation(args.num_records)
+    pool_rate = bench_generation(args.num_records, ValuePools(args.pool_size))
+    print(f"generate only: faker {faker_rate:,.0f} rows/sec, pool {pool_rate:,.0f} rows/sec")
+    if args.engine == "pool":
+        use_value_pools(args.pool_size)
+
+    with psycopg2.connect(
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        host=POSTGRES_HOSTNAME) as conn:
+        for mode in ("row", "bulk"):
+            rate = bench(conn, mode, args.num_records, args.chunk_size)
+            print(f"{mode:>5}: {args.num_records} records, {rate:,.0f} rows/sec")
@@ -0,0 +1,277 @@
+import threading
+import time
+import gen_metrics
+import psycopg2
+from psycopg2.extensions import connection
+from psycopg2.pool import PoolError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Errors that may mean the session is gone; `connection_lost` tells them apart from problems with the statement
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# SQLSTATE of a deadlock, retried on the same connection
+DEADLOCK_DETECTED = "40P01"
+
+
+def connection_lost(
+        conn: Optional[connection],
+        error: psycopg2.Error) -> bool:
+    """
+    Tell whether an error means the session is gone, as opposed to a problem with the statement.
+
+    OperationalError also covers deadlocks, cancelled queries and a full disk, which
+    leave the session usable. Only a closed connection, an SQLSTATE of class 08
+    (connection exception) or 57P01 (admin shutdown) count as lost.
+
+    Args:
+        conn (Optional[connection]): The connection the error came from, None if it could not be opened.
+        error (psycopg2.Error): The error.
+
+    Returns:
+        bool: True if the work should be retried on a fresh connection.
+    """
+    if conn is None or conn.closed or isinstance(error, psycopg2.InterfaceError):
+        return True
+    code = error.pgcode or ""
+    return code.startswith("08") or code == "57P01"
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of health-checked database connections.
+
+    `run` executes a unit of work on a pooled connection. If the connection
+    drops, it is discarded and the work is retried on a fresh one with
+    exponential backoff, so a database restart or a network blip costs one
+    batch instead of the whole run. The time from a failure to the next
+    working connection is accumulated as the reconnect cost. A unit of work
+    picked as a deadlock victim is rolled back and retried on the same
+    connection, and counted as a deadlock rather than a reconnect.
+    """
+
+    def __init__(
+            self,
+            connect: Callable[[], connection],
+            size: int = 1,
+            health_check_interval: float = 0.0,
+            max_retries: int = 10,
+            backoff: float = 0.5,
+            max_backoff: float = 30.0) -> None:
+        """
+        Create an empty pool; connections are opened on demand.
+
+        Args:
+            connect (Callable[[], connection]): Opens a new connection.
+            size (int): Maximum number of open connections, shared by all threads using the pool. Defaults to 1.
+            health_check_interval (float): Check connections that have been idle at least
+                this many seconds with SELECT 1 before handing them out. Defaults to 0.0 (always).
+            max_retries (int): Retries of a failed unit of work before giving up. Defaults to 10.
+            backoff (float): Seconds to wait before the first retry, doubled on every further retry. Defaults to 0.5.
+            max_backoff (float): Upper bound for the wait between retries. Defaults to 30.0.
+        """
+        self.connect = connect
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reconnects = 0
+        self.reconnect_seconds = 0.0
+        self.retries = 0
+        self.deadlocks = 0
+        self._idle: List[Tuple[connection, float]] = []
+        self._open = 0
+        self._available = threading.Condition()
+
+    def _healthy(
+            self,
+            conn: connection) -> bool:
+        """
+        Check that a connection can still run a query.
+
+        Args:
+            conn (connection): An idle connection.
+
+        Returns:
+            bool: True if SELECT 1 succeeded.
+        """
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def acquire(
+            self,
+            timeout: Optional[float] = None) -> connection:
+        """
+        Take a healthy connection from the pool, opening one if there is room.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait for a connection when all are in use.
+                Defaults to None (wait forever).
+
+        Raises:
+            PoolError: If no connection became available within the timeout.
+            psycopg2.OperationalError: If a new connection could not be opened.
+
+        Returns:
+            connection: A connection for the caller's exclusive use until `release`.
+        """
+        while True:
+            with self._available:
+                while not self._idle and self._open >= self.size:
+                    if not self._available.wait(timeout):
+                        raise PoolError("connection pool exhausted")
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                else:
+                    conn, released_at = None, 0.0
+                    self._open += 1
+
+            if conn is None:
+                try:
+                    return self.connect()
+                except Exception:
+                    self._forget()
+                    raise
+            idle = time.monotonic() - released_at
+            if not conn.closed and (idle < self.health_check_interval or self._healthy(conn)):
+                return conn
+            self.release(conn, broken=True)
+
+    def release(
+            self,
+            conn: connection,
+            broken: bool = False) -> None:
+        """
+        Return a connection to the pool, or close it if it is broken.
+
+        Args:
+            conn (connection): A connection obtained from `acquire`.
+            broken (bool): Discard the connection instead of reusing it. Defaults to False.
+
+        Returns:
+            None
+        """
+        if broken or conn.closed:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+            self._forget()
+            return
+        with self._available:
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def _forget(self) -> None:
+        """Free the slot of a connection that was closed or never opened."""
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def run(
+            self,
+            work: Callable[[connection], Any],
+            on_retry: Optional[Callable[[connection], None]] = None) -> Any:
+        """
+        Run a unit of work, retrying it if the connection drops or it is picked as a deadlock victim.
+
+        A lost connection is replaced by a fresh one; after a deadlock the work is
+        rolled back and retried on the same connection. Any other error is raised as is.
+
+        Args:
+            work (Callable[[connection], Any]): Does the work on the given connection.
+            on_retry (Optional[Callable[[connection], None]]): Called on the connection before
+                a retry, e.g. to clear what the failed attempt may have committed. Defaults to None.
+
+        Raises:
+            psycopg2.OperationalError: If the work still fails after `max_retries` retries.
+
+        Returns:
+            Any: Whatever `work` returned.
+        """
+        attempt = 0
+        failed_at = None
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    conn = self.acquire()
+                if failed_at is not None:
+                    self._reconnected(time.perf_counter() - failed_at)
+                    failed_at = None
+                if attempt and on_retry is not None:
+                    on_retry(conn)
+                result = work(conn)
+            except CONNECTION_ERRORS as e:
+                lost = connection_lost(conn, e)
+                if attempt >= self.max_retries or not (lost or e.pgcode == DEADLOCK_DETECTED):
+                    if conn is not None:
+                        self.release(conn, broken=True)
+                    raise
+                if lost:
+                    if conn is not None:
+                        self.release(conn, broken=True)
+                    conn = None
+                    if failed_at is None:
+                        failed_at = time.perf_counter()
+                else:
+                    conn.rollback()
+                    self._deadlocked()
+                time.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+                attempt += 1
+                self.retries += 1
+                continue
+            except Exception:
+                if conn is not None:
+                    self.release(conn, broken=True)
+                raise
+            self.release(conn)
+            return result
+
+    def _reconnected(
+            self,
+            seconds: float) -> None:
+        """Account for one recovery from a dropped connection."""
+        self.reconnects += 1
+        self.reconnect_seconds += seconds
+        if gen_metrics.active is not None:
+            gen_metrics.active.reconnects += 1
+            gen_metrics.active.reconnect_seconds += seconds
+
+    def _deadlocked(self) -> None:
+        """Account for one unit of work rolled back as a deadlock victim."""
+        self.deadlocks += 1
+        if gen_metrics.active is not None:
+            gen_metrics.active.deadlocks += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Summarise the pool's recoveries.
+
+        Returns:
+            Dict[str, float]: Open connections, retries, reconnects, seconds spent reconnecting and deadlocks.
+        """
+        return {
+            "open": self._open,
+            "retries": self.retries,
+            "reconnects": self.reconnects,
+            "reconnect_seconds": self.reconnect_seconds,
+            "deadlocks": self.deadlocks,
+        }
+
+    def close(self) -> None:
+        """
+        Close all idle connections.
+
+        Returns:
+            None
+        """
+        with self._available:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self.release(conn, broken=True)
@@ -1,9 +1,24 @@
+import csv
+import io
+import json
+import multiprocessing
 import random
+import threading
+import time
+from contextlib import contextmanager
 from faker import Faker
 import os
 import psycopg2
-from psycopg2.extensions import cursor
-from typing import Dict, Any, Optional
+from psycopg2.extensions import connection, cursor
+from psycopg2.extras import execute_values
+from conn_pool import ConnectionPool
+from gen_metrics import TimedConnection, collect_metrics, profile_run, shard_path, timed
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the value-pool engine
+    np = None
 
 Faker.seed(42)
 fake = Faker()
@@ -14,7 +29,482 @@ POSTGRES_HOSTNAME = os.getenv("POSTGRES_HOST")
 POSTGRES_DB = os.getenv("POSTGRES_DB")
 SCHEMA = os.getenv("DB_SCHEMA")
 
+USER_COLUMNS = ("id", "username", "email_address")
+PRODUCT_COLUMNS = ("id", "name", "description", "price")
+
+# Independent hash streams per kind of per-record decision
+STREAM_USER = 1
+STREAM_PRODUCT = 2
+STREAM_UPDATE_VALUES = 3
+STREAM_UPDATE = 4
+STREAM_UPDATE_TARGET = 5
+STREAM_UPDATE_HOT = 6
+STREAM_DELETE = 7
+STREAM_DELETE_TARGET = 8
+STREAM_DELETE_HOT = 9
+STREAM_POOL = 16  # + column index
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_GOLDEN64 = 0x9E3779B97F4A7C15
+
+
+def _mix64(
+        x: int) -> int:
+    """SplitMix64 finaliser: a cheap, well-distributed 64-bit hash."""
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+def record_seed(
+        seed: int,
+        id: int,
+        stream: int) -> int:
+    """
+    Derive the 64-bit seed of one decision stream for one record.
+
+    It depends only on its arguments, so any record can be regenerated
+    without generating the ones before it.
+
+    Args:
+        seed (int): The run's seed.
+        id (int): The record's ID.
+        stream (int): One of the STREAM_* constants.
+
+    Returns:
+        int: The derived seed.
+    """
+    base = _mix64((seed + stream * _GOLDEN64) & _MASK64)
+    return _mix64((base + id * _GOLDEN64) & _MASK64)
+
+def record_uniforms(
+        seed: int,
+        ids: "np.ndarray",
+        stream: int) -> "np.ndarray":
+    """
+    Vectorised `record_seed`, mapped to uniform floats in [0, 1).
+
+    Args:
+        seed (int): The run's seed.
+        ids (np.ndarray): The records' IDs.
+        stream (int): One of the STREAM_* constants.
+
+    Returns:
+        np.ndarray: One float per id.
+    """
+    return (record_hashes(seed, ids, stream) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+def record_hashes(
+        seed: int,
+        ids: "np.ndarray",
+        stream: int) -> "np.ndarray":
+    """
+    Vectorised `record_seed`.
+
+    Args:
+        seed (int): The run's seed.
+        ids (np.ndarray): The records' IDs.
+        stream (int): One of the STREAM_* constants.
+
+    Returns:
+        np.ndarray: One uint64 hash per id, equal to record_seed(seed, id, stream).
+    """
+    x = np.uint64(_mix64((seed + stream * _GOLDEN64) & _MASK64)) + \
+        np.asarray(ids, dtype=np.uint64) * np.uint64(_GOLDEN64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+generation_seed: Optional[int] = None
+
+def use_seed(
+        seed: Optional[int]) -> None:
+    """
+    Make every generated value a pure function of (seed, id).
+
+    Faker is re-seeded per record and stream, and value pools and workload
+    profiles index by hash instead of drawing from a sequential RNG, so
+    shards, resumed runs and verifiers all regenerate identical data.
+
+    Args:
+        seed (Optional[int]): The run's seed, or None for sequential generation.
+
+    Returns:
+        None
+    """
+    global generation_seed
+    generation_seed = seed
+
+def _seek(
+        id: int,
+        stream: int) -> None:
+    """Position Faker for one stream of one record when a seed is in use."""
+    if generation_seed is not None:
+        fake.seed_instance(record_seed(generation_seed, id, stream))
+
+
+class ValuePools:
+    """
+    Pre-generated Faker values that rows are assembled from by index sampling.
+
+    Each pool is built once and stored as a fixed-width NumPy string array, so
+    generating a batch of rows is one vectorised gather per column instead of
+    several Faker calls per row. Prices are drawn directly with NumPy. When
+    seekable, the value picked for each record is a hash of (seed, id).
+    """
+
+    def __init__(
+            self,
+            size: int = 10_000,
+            seed: int = 42,
+            seekable: bool = False) -> None:
+        """
+        Build the value pools.
+
+        Args:
+            size (int): Number of values in each pool. Defaults to 10,000.
+            seed (int): Seed for the pool contents and the sampler. Defaults to 42.
+            seekable (bool): Pick values by hashing (seed, id) instead of sampling. Defaults to False.
+        """
+        if np is None:
+            raise ImportError("The value-pool engine requires numpy")
+        pool_fake = Faker()
+        pool_fake.seed_instance(seed)
+        self.size = size
+        self.usernames = np.array([pool_fake.user_name() for _ in range(size)])
+        self.emails = np.array([pool_fake.email() for _ in range(size)])
+        self.names = np.array([pool_fake.name() for _ in range(size)])
+        self.descriptions = np.array([pool_fake.text() for _ in range(size)])
+        self.seed = seed
+        self.seekable = seekable
+        self.rng = np.random.default_rng(seed)
+
+    def _indices(
+            self,
+            ids: Sequence[int],
+            column: int,
+            high: int) -> "np.ndarray":
+        """Pick one index in [0, high) per id, by hash when seekable."""
+        if self.seekable:
+            return record_hashes(self.seed, ids, STREAM_POOL + column) % np.uint64(high)
+        return self.rng.integers(0, high, len(ids))
+
+    def _sample(
+            self,
+            pool: "np.ndarray",
+            ids: Sequence[int],
+            column: int) -> List[str]:
+        """Draw one value from a pool for each id."""
+        return pool[self._indices(ids, column, self.size)].tolist()
+
+    def users(
+            self,
+            ids: Sequence[int]) -> List[Dict[str, Any]]:
+        """
+        Assemble user rows for the given ids.
+
+        Args:
+            ids (Sequence[int]): The users' IDs.
+
+        Returns:
+            List[Dict[str, Any]]: One user dictionary per id.
+        """
+        return [
+            {"id": id, "username": username, "email_address": email}
+            for id, username, email in zip(
+                ids, self._sample(self.usernames, ids, 0), self._sample(self.emails, ids, 1))
+        ]
+
+    def products(
+            self,
+            ids: Sequence[int]) -> List[Dict[str, Any]]:
+        """
+        Assemble product rows for the given ids.
+
+        Args:
+            ids (Sequence[int]): The products' IDs.
+
+        Returns:
+            List[Dict[str, Any]]: One product dictionary per id.
+        """
+        prices = np.round((self._indices(ids, 4, 999_999) + 1) / 100.0, 2).tolist()
+        return [
+            {"id": id, "name": name, "description": description, "price": price}
+            for id, name, description, price in zip(
+                ids, self._sample(self.names, ids, 2), self._sample(self.descriptions, ids, 3), prices)
+        ]
+
+
+value_pools: Optional[ValuePools] = None
+
+def use_value_pools(
+        size: int = 10_000,
+        seed: int = 42) -> None:
+    """
+    Switch row generation to the value-pool engine.
+
+    If `use_seed` has been called, the pools are built from that seed instead
+    and are seekable.
+
+    Args:
+        size (int): Number of values in each pool. Defaults to 10,000.
+        seed (int): Seed for the pools. Defaults to 42.
+
+    Returns:
+        None
+    """
+    global value_pools
+    if generation_seed is not None:
+        value_pools = ValuePools(size, generation_seed, seekable=True)
+    else:
+        value_pools = ValuePools(size, seed)
+
+
+class WorkloadProfile:
+    """
+    Insert/update/delete mix and the skew of update and delete targets.
+
+    For every inserted id, an update is issued with probability
+    `update_ratio` and a delete with probability `delete_ratio`. The target
+    of an update is chosen by `target`, and that of a delete by
+    `delete_target`:
+
+    - 'same': the id just inserted (the generator's default behaviour).
+    - 'uniform': any id from 1 up to the one just inserted.
+    - 'zipf': power-law (discrete Pareto) distributed with exponent `zipf_s`,
+      so the oldest ids are the hottest keys.
+    - 'hotspot': with probability `hot_weight`, one of the oldest
+      `hot_fraction` of ids; otherwise uniform.
+
+    Deletes default to 'same'. Aiming them with the same skew as updates
+    would delete the hot keys early on, and later updates to them would
+    change no rows and emit no change events.
+
+    Decisions are drawn for a whole batch of ids at once with NumPy. A
+    seekable profile derives them from (seed, id) alone, so the decisions for
+    any id can be recomputed on their own with `decide`.
+    """
+
+    TARGETS = ("same", "uniform", "zipf", "hotspot")
+
+    def __init__(
+            self,
+            update_ratio: float = 0.10,
+            delete_ratio: float = 0.05,
+            target: str = "same",
+            delete_target: str = "same",
+            zipf_s: float = 1.2,
+            hot_fraction: float = 0.01,
+            hot_weight: float = 0.9,
+            seed: int = 42,
+            seekable: bool = False) -> None:
+        """
+        Create a workload profile.
+
+        Args:
+            update_ratio (float): Updates per inserted id. Defaults to 0.10.
+            delete_ratio (float): Deletes per inserted id. Defaults to 0.05.
+            target (str): Update target, one of 'same', 'uniform', 'zipf' or 'hotspot'. Defaults to 'same'.
+            delete_target (str): Delete target, one of the same choices. Defaults to 'same'.
+            zipf_s (float): Zipf exponent, must be > 1. Defaults to 1.2.
+            hot_fraction (float): Fraction of the oldest ids that are hot. Defaults to 0.01.
+            hot_weight (float): Probability that a target is hot. Defaults to 0.9.
+            seed (int): Seed for the decision sampler. Defaults to 42.
+            seekable (bool): Derive decisions from (seed, id) instead of a sequential RNG. Defaults to False.
+        """
+        if np is None:
+            raise ImportError("Workload profiles require numpy")
+        for name, value in (("target", target), ("delete_target", delete_target)):
+            if value not in self.TARGETS:
+                raise ValueError(f"{name} must be one of {self.TARGETS}, got {value!r}")
+        if "zipf" in (target, delete_target) and zipf_s <= 1:
+            raise ValueError("zipf_s must be greater than 1")
+        self.update_ratio = update_ratio
+        self.delete_ratio = delete_ratio
+        self.target = target
+        self.delete_target = delete_target
+        self.zipf_s = zipf_s
+        self.hot_fraction = hot_fraction
+        self.hot_weight = hot_weight
+        self.seekable = seekable
+        self.reseed(seed)
+
+    @classmethod
+    def from_file(
+            cls,
+            path: str,
+            **overrides: Any) -> "WorkloadProfile":
+        """
+        Load a profile from a JSON file of constructor arguments.
+
+        Args:
+            path (str): Path to the JSON file.
+            **overrides (Any): Arguments that take precedence over the file, e.g. from the CLI.
+
+        Returns:
+            WorkloadProfile: The loaded profile.
+        """
+        with open(path) as f:
+            settings = json.load(f)
+        settings.update(overrides)
+        return cls(**settings)
+
+    def reseed(
+            self,
+            seed: int) -> None:
+        """
+        Reset the decision sampler, e.g. in a worker process.
+
+        Args:
+            seed (int): The new seed.
+
+        Returns:
+            None
+        """
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+    def _uniforms(
+            self,
+            ids: "np.ndarray",
+            stream: int) -> "np.ndarray":
+        """One uniform float in [0, 1) per id, by hash when seekable."""
+        if self.seekable:
+            return record_uniforms(self.seed, ids, stream)
+        return self.rng.random(len(ids))
+
+    def _targets(
+            self,
+            ids: "np.ndarray",
+            target: str,
+            target_stream: int,
+            hot_stream: int) -> "np.ndarray":
+        """Pick one target id at or below each of `ids`, distributed as `target`."""
+        if target == "same":
+            return ids
+        u = self._uniforms(ids, target_stream)
+        if target == "uniform":
+            return 1 + (u * ids).astype(np.int64)
+        if target == "zipf":
+            rank = np.minimum(np.floor((1.0 - u) ** (-1.0 / (self.zipf_s - 1.0))), 2.0 ** 62)
+            return (rank.astype(np.int64) - 1) % ids + 1
+        hot_span = np.maximum((ids * self.hot_fraction).astype(np.int64), 1)
+        hot = self._uniforms(ids, hot_stream) < self.hot_weight
+        return 1 + (u * np.where(hot, hot_span, ids)).astype(np.int64)
+
+    def plan(
+            self,
+            ids: range) -> Tuple[List[int], List[int]]:
+        """
+        Decide the updates and deletes that follow a batch of inserts.
+
+        Args:
+            ids (range): The ids inserted in this batch, in order.
+
+        Returns:
+            Tuple[List[int], List[int]]: For each inserted id, the id to update
+                and the id to delete afterwards, or 0 for none.
+        """
+        inserted = np.arange(ids.start, ids.stop, dtype=np.int64)
+        updates = np.where(
+            self._uniforms(inserted, STREAM_UPDATE) < self.update_ratio,
+            self._targets(inserted, self.target, STREAM_UPDATE_TARGET, STREAM_UPDATE_HOT), 0)
+        deletes = np.where(
+            self._uniforms(inserted, STREAM_DELETE) < self.delete_ratio,
+            self._targets(inserted, self.delete_target, STREAM_DELETE_TARGET, STREAM_DELETE_HOT), 0)
+        return updates.tolist(), deletes.tolist()
+
+    def decide(
+            self,
+            id: int) -> Tuple[int, int]:
+        """
+        Recompute the update and delete that follow the insert of one id.
+
+        Only meaningful for a seekable profile, whose decisions don't depend
+        on the ids planned before.
+
+        Args:
+            id (int): The inserted id.
+
+        Returns:
+            Tuple[int, int]: The id updated and the id deleted afterwards, or 0 for none.
+        """
+        updates, deletes = self.plan(range(id, id + 1))
+        return updates[0], deletes[0]
+
+
+class ProgressJournal:
+    """
+    Small on-disk record of how far a generator run has got.
+
+    Holds the next id still to be generated. It is rewritten atomically
+    after every committed batch, so a crash leaves either the old or the new
+    checkpoint, never a torn file.
+    """
+
+    def __init__(
+            self,
+            path: str) -> None:
+        """
+        Create a journal backed by a JSON file.
+
+        Args:
+            path (str): Location of the journal file.
+        """
+        self.path = path
+
+    @classmethod
+    def for_shard(
+            cls,
+            directory: str,
+            first_id: int,
+            num_records: int) -> "ProgressJournal":
+        """
+        Return the journal for one id range inside a journal directory.
+
+        Args:
+            directory (str): Directory holding one journal per id range.
+            first_id (int): First id of the range.
+            num_records (int): Number of ids in the range.
+
+        Returns:
+            ProgressJournal: The range's journal.
+        """
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f"{first_id}-{first_id + num_records - 1}.json"))
+
+    def load(self) -> Optional[int]:
+        """
+        Read the last checkpoint.
+
+        Returns:
+            Optional[int]: The next id to generate, or None if there is no journal yet.
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)["next_id"]
+        except FileNotFoundError:
+            return None
 
+    def save(
+            self,
+            next_id: int) -> None:
+        """
+        Record that every id below next_id has been generated.
+
+        Args:
+            next_id (int): The next id to generate.
+
+        Returns:
+            None
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"next_id": next_id}, f)
+        os.replace(tmp_path, self.path)
+
+
+@timed("generate")
 def generate_user_data(
         id: int) -> Dict[str, Any]:
     """
@@ -26,12 +516,16 @@ def generate_user_data(
     Returns:
         Dict[str, Any]: A dictionary containing user data.
     """
+    if value_pools is not None:
+        return value_pools.users([id])[0]
+    _seek(id, STREAM_USER)
     return {
         "id": id,
         "username": fake.user_name(),
         "email_address": fake.email(),
     }
 
+@timed("generate")
 def generate_product_data(
         id: int) -> Dict[str, Any]:
     """
@@ -43,6 +537,9 @@ def generate_product_data(
     Returns:
         Dict[str, Any]: A dictionary containing product data.
     """
+    if value_pools is not None:
+        return value_pools.products([id])[0]
+    _seek(id, STREAM_PRODUCT)
     return {
         "id": id,
         "name": fake.name(),
@@ -50,6 +547,38 @@ def generate_product_data(
         "price": round(fake.random_int(min=1, max=999_999) / 100.0, 2),
     }
 
+@timed("generate")
+def generate_user_batch(
+        ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """
+    Generate user data for a batch of ids, vectorised when value pools are in use.
+
+    Args:
+        ids (Sequence[int]): The users' IDs.
+
+    Returns:
+        List[Dict[str, Any]]: One user dictionary per id.
+    """
+    if value_pools is not None:
+        return value_pools.users(ids)
+    return [generate_user_data(id) for id in ids]
+
+@timed("generate")
+def generate_product_batch(
+        ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """
+    Generate product data for a batch of ids, vectorised when value pools are in use.
+
+    Args:
+        ids (Sequence[int]): The products' IDs.
+
+    Returns:
+        List[Dict[str, Any]]: One product dictionary per id.
+    """
+    if value_pools is not None:
+        return value_pools.products(ids)
+    return [generate_product_data(id) for id in ids]
+
 def insert_user_data(
         conn: str, 
         cur: cursor, 
@@ -128,8 +657,7 @@ def update_records(
     """
     try:
         if should_update or random.randint(1, 100) >= 90:
-            new_username = fake.user_name()
-            new_name = fake.name()
+            new_username, new_name = _draw_update_values()
 
             cur.execute(
                 f"UPDATE {SCHEMA}.users SET username = %s WHERE id = %s",
@@ -181,19 +709,310 @@ def delete_records(
         conn.commit()
 
 
+def _to_csv_buffer(
+        rows: Iterable[Dict[str, Any]],
+        columns: Iterable[str]) -> io.StringIO:
+    """
+    Serialise rows into an in-memory CSV buffer suitable for COPY FROM STDIN.
+
+    Args:
+        rows (Iterable[Dict[str, Any]]): Rows to serialise.
+        columns (Iterable[str]): Column names, in COPY order.
+
+    Returns:
+        io.StringIO: The buffer, rewound to the start.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    return buffer
+
+def copy_user_data(
+        conn: str,
+        cur: cursor,
+        users: List[Dict[str, Any]]) -> None:
+    """
+    Bulk load user data into the database with COPY FROM STDIN.
+
+    Args:
+        conn (str): The database connection.
+        cur (cursor): The database cursor.
+        users (List[Dict[str, Any]]): User data to be loaded.
+
+    Returns:
+        None
+    """
+    try:
+        cur.copy_expert(
+            f"COPY {SCHEMA}.users ({', '.join(USER_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            _to_csv_buffer(users, USER_COLUMNS)
+        )
+    except psycopg2.Error as e:
+        conn.rollback()  # A failed COPY aborts the whole chunk
+        raise e
+    else:
+        conn.commit()
+
+def copy_product_data(
+        conn: str,
+        cur: cursor,
+        products: List[Dict[str, Any]]) -> None:
+    """
+    Bulk load product data into the database with COPY FROM STDIN.
+
+    Args:
+        conn (str): The database connection.
+        cur (cursor): The database cursor.
+        products (List[Dict[str, Any]]): Product data to be loaded.
+
+    Returns:
+        None
+    """
+    try:
+        cur.copy_expert(
+            f"COPY {SCHEMA}.products ({', '.join(PRODUCT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            _to_csv_buffer(products, PRODUCT_COLUMNS)
+        )
+    except psycopg2.Error as e:
+        conn.rollback()  # A failed COPY aborts the whole chunk
+        raise e
+    else:
+        conn.commit()
+
+@timed("generate")
+def updated_values(
+        source_id: int) -> Tuple[str, str]:
+    """
+    Generate the new username and product name for an update.
+
+    Draws from Faker in the same order as `update_records`. With a seed in
+    use, the values depend only on the id whose insert triggered the update.
+
+    Args:
+        source_id (int): Id of the inserted record that triggered the update.
+
+    Returns:
+        Tuple[str, str]: The new username and product name.
+    """
+    _seek(source_id, STREAM_UPDATE_VALUES)
+    return _draw_update_values()
+
+@timed("generate")
+def _draw_update_values() -> Tuple[str, str]:
+    """Draw a new username and product name from Faker."""
+    return fake.user_name(), fake.name()
+
+def update_rounds(
+        ids: Sequence[int],
+        values: Sequence[Tuple[str, str]]) -> List[List[Tuple[int, Tuple[str, str]]]]:
+    """
+    Split a batch of updates into rounds that each update an id at most once.
+
+    An UPDATE ... FROM (VALUES ...) changes a row only once however many
+    values match it, so repeated updates of a hot key must go in separate
+    statements. The n-th update of every id goes in the n-th round.
+
+    Args:
+        ids (Sequence[int]): Ids to update, in order, possibly repeated.
+        values (Sequence[Tuple[str, str]]): The new username and product name for each id.
+
+    Returns:
+        List[List[Tuple[int, Tuple[str, str]]]]: (id, values) pairs per round, in order.
+    """
+    rounds: List[List[Tuple[int, Tuple[str, str]]]] = []
+    seen: Dict[int, int] = {}
+    for id, value in zip(ids, values):
+        n = seen.get(id, 0)
+        seen[id] = n + 1
+        if n == len(rounds):
+            rounds.append([])
+        rounds[n].append((id, value))
+    return rounds
+
+def lock_records(
+        cur: cursor,
+        ids: Sequence[int]) -> None:
+    """
+    Lock the user and product rows of a batch in id order.
+
+    Concurrent batches that share hot keys would otherwise lock them in the
+    order of their VALUES lists and deadlock. Taking every lock up front, users
+    before products and each table in id order, gives all writers the same order.
+
+    Args:
+        cur (cursor): The database cursor, inside the batch's transaction.
+        ids (Sequence[int]): Ids of the user and product records, possibly repeated.
+
+    Returns:
+        None
+    """
+    ordered = sorted(set(ids))
+    for table in ("users", "products"):
+        cur.execute(f"SELECT id FROM {SCHEMA}.{table} WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (ordered,))
+
+def update_records_batch(
+        conn: str,
+        cur: cursor,
+        ids: List[int],
+        source_ids: Optional[List[int]] = None) -> None:
+    """
+    Update a batch of user and product records in a single transaction.
+
+    The rows are locked in id order first, see `lock_records`. Each id gets a freshly generated username and product name, as in
+    `update_records`. An id may appear several times: every occurrence is
+    applied by its own statement, in order, so each one is a separate row
+    change and the last one decides the final values.
+
+    Args:
+        conn (str): The database connection.
+        cur (cursor): The database cursor.
+        ids (List[int]): Ids of the user and product records to update, possibly repeated.
+        source_ids (Optional[List[int]]): For each id, the inserted id that triggered
+            its update. Defaults to the ids themselves.
+
+    Returns:
+        None
+    """
+    if not ids:
+        return
+    values = [updated_values(source_id) for source_id in (source_ids or ids)]
+    try:
+        lock_records(cur, ids)
+        for rows in update_rounds(ids, values):
+            execute_values(
+                cur,
+                f"UPDATE {SCHEMA}.users AS u SET username = v.username "
+                f"FROM (VALUES %s) AS v (id, username) WHERE u.id = v.id",
+                [(id, username) for id, (username, _) in rows]
+            )
+            execute_values(
+                cur,
+                f"UPDATE {SCHEMA}.products AS p SET name = v.name "
+                f"FROM (VALUES %s) AS v (id, name) WHERE p.id = v.id",
+                [(id, name) for id, (_, name) in rows]
+            )
+    except psycopg2.IntegrityError as e:
+        conn.rollback()
+        raise e
+    else:
+        conn.commit()
+
+def delete_records_batch(
+        conn: str,
+        cur: cursor,
+        ids: List[int]) -> None:
+    """
+    Delete a batch of user and product records in a single transaction.
+
+    The rows are locked in id order first, see `lock_records`.
+
+    Args:
+        conn (str): The database connection.
+        cur (cursor): The database cursor.
+        ids (List[int]): Ids of the user and product records to delete.
+
+    Returns:
+        None
+    """
+    if not ids:
+        return
+    try:
+        lock_records(cur, ids)
+        cur.execute(f"DELETE FROM {SCHEMA}.users WHERE id = ANY(%s)", (ids,))
+        cur.execute(f"DELETE FROM {SCHEMA}.products WHERE id = ANY(%s)", (ids,))
+    except Exception as e:
+        conn.rollback()
+        raise e
+    else:
+        conn.commit()
+
+
+def gen_user_product_data_bulk(
+        conn: str,
+        num_records: int,
+        chunk_size: int = 10_000,
+        should_update: Optional[bool] = False,
+        should_delete: Optional[bool] = False,
+        first_id: int = 1,
+        profile: Optional[WorkloadProfile] = None,
+        journal: Optional[ProgressJournal] = None) -> None:
+    """
+    Generate user and product data and load it with COPY in chunks.
+
+    Each chunk of ids is streamed into both tables with COPY FROM STDIN, then
+    the chunk's updates and deletes are applied as one batch each. The update
+    and delete probabilities match `gen_user_product_data`. With a profile,
+    a key targeted several times in one chunk is updated that many times,
+    in the order of the inserts that triggered the updates.
+
+    Args:
+        conn (str): The database connection.
+        num_records (int): Number of records to generate.
+        chunk_size (int): Number of ids loaded per COPY. Defaults to 10,000.
+        should_update (Optional[bool]): Set to True to force the update. Defaults to False.
+        should_delete (Optional[bool]): Set to True to force the delete. Defaults to False.
+        first_id (int): Id of the first generated record. Defaults to 1.
+        profile (Optional[WorkloadProfile]): Update/delete mix and targets. Defaults to None.
+        journal (Optional[ProgressJournal]): Checkpointed after every chunk. Defaults to None.
+
+    Returns:
+        None
+    """
+    cur = conn.cursor()
+    end_id = first_id + num_records
+    if profile is None and generation_seed is not None:
+        profile = _seeded_profile(should_update, should_delete)
+
+    for start in range(first_id, end_id, chunk_size):
+        ids = range(start, min(start + chunk_size, end_id))
+        users = generate_user_batch(ids)
+        products = generate_product_batch(ids)
+
+        copy_user_data(conn, cur, users)
+        copy_product_data(conn, cur, products)
+
+        if profile is not None:
+            updates, deletes = profile.plan(ids)
+            update_ids = [target for target in updates if target]
+            source_ids = [id for id, target in zip(ids, updates) if target]
+            delete_ids = sorted({id for id in deletes if id})
+        else:
+            update_ids = [id for id in ids if should_update or random.randint(1, 100) >= 90]
+            source_ids = None
+            delete_ids = [id for id in ids if should_delete or random.randint(1, 100) >= 95]
+        update_records_batch(conn, cur, update_ids, source_ids)
+        delete_records_batch(conn, cur, delete_ids)
+        if journal is not None:
+            journal.save(ids.stop)
+
+
 def gen_user_product_data(
         conn: str,
         num_records: int,
         should_update: Optional[bool] = False,
-        should_delete: Optional[bool] = False) -> None: 
+        should_delete: Optional[bool] = False,
+        first_id: int = 1,
+        profile: Optional[WorkloadProfile] = None,
+        journal: Optional[ProgressJournal] = None,
+        checkpoint_every: int = 1_000) -> None:
     """
     Generate user and product data, and interact with the database.
 
+    Without a profile, each inserted record is itself updated with 10% and
+    deleted with 5% probability. A profile sets these ratios and which older
+    records the updates and deletes hit.
+
     Args:
         conn (str): The database connection. 
         num_records (int): Number of records to generate.
         should_update (Optional[bool]): Set to True to force the update. Defaults to False.
         should_delete (Optional[bool]): Set to True to force the delete. Defaults to False.
+        first_id (int): Id of the first generated record. Defaults to 1.
+        profile (Optional[WorkloadProfile]): Update/delete mix and targets. Defaults to None.
+        journal (Optional[ProgressJournal]): Progress journal to checkpoint. Defaults to None.
+        checkpoint_every (int): Records between journal checkpoints. Defaults to 1,000.
 
 
     Returns:
@@ -202,7 +1021,14 @@ def gen_user_product_data(
    
     cur = conn.cursor()
 
-    for id in range(1, num_records + 1):
+    if profile is None and generation_seed is not None:
+        profile = _seeded_profile(should_update, should_delete)
+    if profile is not None:
+        _gen_user_product_data_profiled(
+            conn, cur, num_records, first_id, profile, journal, checkpoint_every)
+        return
+
+    for id in range(first_id, first_id + num_records):
         user_data = generate_user_data(id)
         product_data = generate_product_data(id)
         # user_product_data[id] = {"user": user_data, "product": product_data}
@@ -215,6 +1041,443 @@ def gen_user_product_data(
         update_records(conn, cur, user_data, product_data, should_update)
         delete_records(conn, cur, user_data, product_data, should_delete)
 
+        if journal is not None and (id - first_id + 1) % checkpoint_every == 0:
+            journal.save(id + 1)
+
+    if journal is not None:
+        journal.save(first_id + num_records)
+
+def _seeded_profile(
+        should_update: Optional[bool],
+        should_delete: Optional[bool]) -> WorkloadProfile:
+    """
+    Seekable profile equivalent to the default per-row update/delete draws.
+
+    Args:
+        should_update (Optional[bool]): Force every update.
+        should_delete (Optional[bool]): Force every delete.
+
+    Returns:
+        WorkloadProfile: A 'same'-target profile keyed on the generation seed.
+    """
+    return WorkloadProfile(
+        update_ratio=1.0 if should_update else 0.10,
+        delete_ratio=1.0 if should_delete else 0.05,
+        seed=generation_seed,
+        seekable=True)
+
+def _gen_user_product_data_profiled(
+        conn: str,
+        cur: cursor,
+        num_records: int,
+        first_id: int,
+        profile: WorkloadProfile,
+        journal: Optional[ProgressJournal] = None,
+        plan_size: int = 10_000) -> None:
+    """
+    Row-at-a-time generation with updates and deletes planned by a profile.
+
+    Args:
+        conn (str): The database connection.
+        cur (cursor): The database cursor.
+        num_records (int): Number of records to generate.
+        first_id (int): Id of the first generated record.
+        profile (WorkloadProfile): Update/delete mix and targets.
+        journal (Optional[ProgressJournal]): Checkpointed after every planned batch. Defaults to None.
+        plan_size (int): Number of ids planned per batch. Defaults to 10,000.
+
+    Returns:
+        None
+    """
+    end_id = first_id + num_records
+    for start in range(first_id, end_id, plan_size):
+        ids = range(start, min(start + plan_size, end_id))
+        updates, deletes = profile.plan(ids)
+        for id, update_id, delete_id in zip(ids, updates, deletes):
+            insert_user_data(conn, cur, generate_user_data(id))
+            insert_product_data(conn, cur, generate_product_data(id))
+            if update_id:
+                target = {"id": update_id}
+                _seek(id, STREAM_UPDATE_VALUES)
+                update_records(conn, cur, target, target, should_update=True)
+            if delete_id:
+                target = {"id": delete_id}
+                delete_records(conn, cur, target, target, should_delete=True)
+        if journal is not None:
+            journal.save(ids.stop)
+
+
+def connect(
+        timed: bool = True) -> connection:
+    """
+    Open a connection to the source database using the environment settings.
+
+    Statements, commits and rollbacks on it are reported to the metrics
+    being collected, if any (see `gen_metrics.collect_metrics`).
+
+    Args:
+        timed (bool): Report to the metrics; turn off for side traffic such as heartbeats. Defaults to True.
+
+    Returns:
+        connection: A new database connection.
+    """
+    return psycopg2.connect(
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        host=POSTGRES_HOSTNAME,
+        connection_factory=TimedConnection if timed else None)
+
+def resume_point(
+        conn: str,
+        first_id: int,
+        num_records: int,
+        journal: Optional[ProgressJournal] = None,
+        chunk_size: int = 1) -> int:
+    """
+    Find the first id of a range that a previous run may not have finished.
+
+    A crash can leave the batch holding the highest id in either table
+    half-written (e.g. a user without its product), so the range resumes at
+    the start of that batch. The journal's checkpoint wins when it is further
+    along, since the newest records may already have been deleted again.
+
+    Args:
+        conn (str): The database connection.
+        first_id (int): First id of the range.
+        num_records (int): Number of ids in the range.
+        journal (Optional[ProgressJournal]): The range's progress journal. Defaults to None.
+        chunk_size (int): Records the previous run committed together. Defaults to 1.
+
+    Returns:
+        int: The id to continue from; first_id + num_records if the range is complete.
+    """
+    last_id = first_id + num_records - 1
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT GREATEST("
+            f"(SELECT MAX(id) FROM {SCHEMA}.users WHERE id BETWEEN %(first)s AND %(last)s), "
+            f"(SELECT MAX(id) FROM {SCHEMA}.products WHERE id BETWEEN %(first)s AND %(last)s))",
+            {"first": first_id, "last": last_id}
+        )
+        max_id = cur.fetchone()[0]
+    conn.commit()
+    checkpoint = journal.load() if journal is not None else None
+    next_id = first_id if checkpoint is None else checkpoint
+    if max_id is not None and max_id >= next_id:
+        next_id = first_id + (max_id - first_id) // chunk_size * chunk_size
+        if checkpoint is not None:
+            next_id = max(next_id, checkpoint)
+    return min(next_id, last_id + 1)
+
+def clear_records(
+        conn: str,
+        first_id: int,
+        last_id: int) -> None:
+    """
+    Delete any user and product records with ids in first_id..last_id.
+
+    Used before regenerating a possibly half-written tail of a range.
+
+    Args:
+        conn (str): The database connection.
+        first_id (int): First id to delete.
+        last_id (int): Last id to delete.
+
+    Returns:
+        None
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {SCHEMA}.users WHERE id BETWEEN %s AND %s", (first_id, last_id))
+        cur.execute(f"DELETE FROM {SCHEMA}.products WHERE id BETWEEN %s AND %s", (first_id, last_id))
+    conn.commit()
+
+def send_heartbeat(
+        conn: str,
+        heartbeat_id: int = 1) -> int:
+    """
+    Stamp the heartbeat row with the current time.
+
+    Every heartbeat is a change event on the heartbeat topic, so replication
+    lag can be measured even while users and products are idle.
+
+    Args:
+        conn (str): The database connection.
+        heartbeat_id (int): Row to update; give every generator its own. Defaults to 1.
+
+    Returns:
+        int: The time written, in epoch milliseconds.
+    """
+    ts_ms = int(time.time() * 1000)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.heartbeat (id, ts_ms) VALUES (%s, %s) "
+            f"ON CONFLICT (id) DO UPDATE SET ts_ms = EXCLUDED.ts_ms",
+            (heartbeat_id, ts_ms)
+        )
+    conn.commit()
+    return ts_ms
+
+@contextmanager
+def heartbeats(
+        interval: Optional[float],
+        heartbeat_id: int = 1) -> Iterator[None]:
+    """
+    Send a heartbeat every `interval` seconds while the enclosed code runs.
+
+    Heartbeats go over their own connection, which is not counted in the
+    generator metrics. A failed heartbeat is reported and skipped. Does
+    nothing if interval is None.
+
+    Args:
+        interval (Optional[float]): Seconds between heartbeats.
+        heartbeat_id (int): Heartbeat row of this generator. Defaults to 1.
+
+    Yields:
+        None
+    """
+    if interval is None:
+        yield
+        return
+    pool = ConnectionPool(lambda: connect(timed=False), max_retries=2)
+    stop = threading.Event()
+
+    def beat() -> None:
+        while True:
+            try:
+                pool.run(lambda conn: send_heartbeat(conn, heartbeat_id))
+            except psycopg2.Error as error:
+                print(f"Heartbeat failed: {error}")
+            if stop.wait(interval):
+                break
+
+    sender = threading.Thread(target=beat, daemon=True)
+    sender.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sender.join()
+        pool.close()
+
+def shard_ranges(
+        num_records: int,
+        workers: int) -> List[Tuple[int, int]]:
+    """
+    Split the ids 1..num_records into disjoint, contiguous shards.
+
+    Args:
+        num_records (int): Number of records to generate.
+        workers (int): Number of shards.
+
+    Returns:
+        List[Tuple[int, int]]: (first_id, num_records) for every non-empty shard.
+    """
+    size, remainder = divmod(num_records, workers)
+    shards = []
+    first_id = 1
+    for shard in range(workers):
+        count = size + (1 if shard < remainder else 0)
+        if count:
+            shards.append((first_id, count))
+        first_id += count
+    return shards
+
+def gen_user_product_data_pooled(
+        pool: ConnectionPool,
+        num_records: int,
+        mode: str = "row",
+        chunk_size: int = 10_000,
+        first_id: int = 1,
+        profile: Optional[WorkloadProfile] = None,
+        journal: Optional[ProgressJournal] = None,
+        batch_size: int = 1_000) -> None:
+    """
+    Generate records batch by batch on pooled connections, surviving dropped connections.
+
+    Each batch (a COPY chunk in bulk mode, `batch_size` records in row mode)
+    is one unit of work for `ConnectionPool.run`. If the connection drops
+    mid-batch, whatever the batch committed is cleared and the batch is
+    generated again on a fresh connection.
+
+    Args:
+        pool (ConnectionPool): Pool to take connections from.
+        num_records (int): Number of records to generate.
+        mode (str): 'row' or 'bulk'. Defaults to 'row'.
+        chunk_size (int): Records per COPY chunk in bulk mode. Defaults to 10,000.
+        first_id (int): Id of the first generated record. Defaults to 1.
+        profile (Optional[WorkloadProfile]): Update/delete mix and targets. Defaults to None.
+        journal (Optional[ProgressJournal]): Checkpointed after every batch. Defaults to None.
+        batch_size (int): Records per unit of work in row mode. Defaults to 1,000.
+
+    Returns:
+        None
+    """
+    if mode == "bulk":
+        batch_size = chunk_size
+    end_id = first_id + num_records
+    for start in range(first_id, end_id, batch_size):
+        ids = range(start, min(start + batch_size, end_id))
+
+        def work(conn: connection) -> None:
+            if mode == "bulk":
+                gen_user_product_data_bulk(
+                    conn, len(ids), chunk_size, first_id=ids.start, profile=profile, journal=journal)
+            else:
+                gen_user_product_data(
+                    conn, len(ids), first_id=ids.start, profile=profile, journal=journal)
+
+        pool.run(work, on_retry=lambda conn: clear_records(conn, ids.start, ids.stop - 1))
+
+def generate_range(
+        pool: ConnectionPool,
+        first_id: int,
+        num_records: int,
+        mode: str = "row",
+        chunk_size: int = 10_000,
+        profile: Optional[WorkloadProfile] = None,
+        resume: bool = False,
+        journal_dir: Optional[str] = None) -> int:
+    """
+    Generate the ids first_id..first_id + num_records - 1, optionally resuming.
+
+    Args:
+        pool (ConnectionPool): Pool to take connections from.
+        first_id (int): First id of the range.
+        num_records (int): Number of ids in the range.
+        mode (str): 'row' or 'bulk'. Defaults to 'row'.
+        chunk_size (int): Records per COPY chunk in bulk mode. Defaults to 10,000.
+        profile (Optional[WorkloadProfile]): Update/delete mix and targets. Defaults to None.
+        resume (bool): Skip the ids that a previous run already generated. Defaults to False.
+        journal_dir (Optional[str]): Directory for the range's progress journal. Defaults to None.
+
+    Returns:
+        int: Number of records generated.
+    """
+    journal = ProgressJournal.for_shard(journal_dir, first_id, num_records) if journal_dir else None
+    if resume:
+        def rewind(conn: connection) -> int:
+            next_id = resume_point(
+                conn, first_id, num_records, journal, chunk_size if mode == "bulk" else 1)
+            clear_records(conn, next_id, first_id + num_records - 1)
+            return next_id
+
+        next_id = pool.run(rewind)
+        num_records -= next_id - first_id
+        first_id = next_id
+    gen_user_product_data_pooled(
+        pool, num_records, mode, chunk_size, first_id=first_id, profile=profile, journal=journal)
+    return num_records
+
+def _run_shard(
+        shard: Tuple[int, int],
+        mode: str,
+        chunk_size: int,
+        pool_size: int = 0,
+        profile: Optional[WorkloadProfile] = None,
+        resume: bool = False,
+        journal_dir: Optional[str] = None,
+        seed: Optional[int] = None,
+        metrics_file: Optional[str] = None,
+        metrics_interval: float = 5.0,
+        profile_dir: Optional[str] = None,
+        pool_options: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Generate one shard of records on a dedicated connection.
+
+    Runs in a worker process. Without a seed, Faker, random and the value
+    pools are reseeded from the shard's first id so that workers don't
+    produce identical values. With a seed, every record is derived from
+    (seed, id) and the result is the same however the ids are sharded.
+
+    Args:
+        shard (Tuple[int, int]): (first_id, num_records) of the shard.
+        mode (str): 'row' or 'bulk'.
+        chunk_size (int): Records per COPY chunk in bulk mode.
+        pool_size (int): Size of the value pools, or 0 to use Faker directly.
+        profile (Optional[WorkloadProfile]): Update/delete mix and targets.
+        resume (bool): Skip the ids that a previous run already generated.
+        journal_dir (Optional[str]): Directory for the shard's progress journal.
+        seed (Optional[int]): Seed for seekable generation, see `use_seed`.
+        metrics_file (Optional[str]): Metrics file; the shard writes its own copy tagged with its first id.
+        metrics_interval (float): Seconds between metrics file updates.
+        profile_dir (Optional[str]): Directory for the shard's cProfile and tracemalloc reports.
+        pool_options (Optional[Dict[str, Any]]): Keyword arguments for the shard's `ConnectionPool`.
+
+    Returns:
+        int: Number of records generated.
+    """
+    first_id, num_records = shard
+    use_seed(seed)
+    if seed is None:
+        fake.seed_instance(first_id)
+        random.seed(first_id)
+        if profile is not None:
+            profile.reseed(first_id)
+    if pool_size:
+        use_value_pools(pool_size, first_id)
+    labels = {"shard": str(first_id)}
+    with collect_metrics(shard_path(metrics_file, first_id), metrics_interval, labels), \
+            profile_run(profile_dir, first_id):
+        pool = ConnectionPool(connect, **(pool_options or {}))
+        try:
+            return generate_range(
+                pool, first_id, num_records, mode, chunk_size, profile, resume, journal_dir)
+        finally:
+            pool.close()
+
+def gen_user_product_data_parallel(
+        num_records: int,
+        workers: int,
+        mode: str = "row",
+        chunk_size: int = 10_000,
+        pool_size: int = 0,
+        profile: Optional[WorkloadProfile] = None,
+        resume: bool = False,
+        journal_dir: Optional[str] = None,
+        seed: Optional[int] = None,
+        metrics_file: Optional[str] = None,
+        metrics_interval: float = 5.0,
+        profile_dir: Optional[str] = None,
+        pool_options: Optional[Dict[str, Any]] = None) -> float:
+    """
+    Generate records with several processes, each with its own connection.
+
+    The ids 1..num_records are split into one disjoint shard per worker.
+
+    Args:
+        num_records (int): Number of records to generate.
+        workers (int): Number of worker processes.
+        mode (str): 'row' or 'bulk'. Defaults to 'row'.
+        chunk_size (int): Records per COPY chunk in bulk mode. Defaults to 10,000.
+        pool_size (int): Size of the value pools, or 0 to use Faker directly. Defaults to 0.
+        profile (Optional[WorkloadProfile]): Update/delete mix and targets. Defaults to None.
+        resume (bool): Let every shard skip ids generated by a previous run. Defaults to False.
+        journal_dir (Optional[str]): Directory for per-shard progress journals. Defaults to None.
+        seed (Optional[int]): Seed for seekable generation, see `use_seed`. Defaults to None.
+        metrics_file (Optional[str]): Metrics file, written once per worker. Defaults to None.
+        metrics_interval (float): Seconds between metrics file updates. Defaults to 5.0.
+        profile_dir (Optional[str]): Directory for per-worker profiling reports. Defaults to None.
+        pool_options (Optional[Dict[str, Any]]): Keyword arguments for each worker's `ConnectionPool`.
+            Defaults to None.
+
+    Returns:
+        float: Combined throughput in inserted rows (users + products) per second, or 0 if there is nothing to
+            generate.
+    """
+    shards = shard_ranges(num_records, workers)
+    if not shards:
+        return 0.0
+    start = time.perf_counter()
+    with multiprocessing.Pool(len(shards)) as pool:
+        generated = pool.starmap(_run_shard, [
+            (shard, mode, chunk_size, pool_size, profile, resume, journal_dir, seed,
+             metrics_file, metrics_interval, profile_dir, pool_options)
+            for shard in shards
+        ])
+    elapsed = time.perf_counter() - start
+    return 2 * sum(generated) / elapsed
+
 
 if __name__ == "__main__":
     import argparse
@@ -227,11 +1490,162 @@ if __name__ == "__main__":
         help="Number of records to generate",
         default=100_000,
     )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=["row", "bulk"],
+        help="'row' inserts and commits one row at a time, 'bulk' loads chunks with COPY",
+        default="row",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk_size",
+        type=int,
+        help="Number of records per COPY chunk in bulk mode",
+        default=10_000,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of processes, each generating a disjoint shard of ids on its own connection",
+        default=1,
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=["faker", "pool"],
+        help="'faker' calls Faker per row, 'pool' samples from pre-generated value pools",
+        default="faker",
+    )
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        help="Number of values in each pool for the 'pool' engine",
+        default=10_000,
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        help="JSON file of WorkloadProfile settings; the options below override it",
+    )
+    parser.add_argument("--update_ratio", type=float, help="Updates per inserted record")
+    parser.add_argument("--delete_ratio", type=float, help="Deletes per inserted record")
+    parser.add_argument(
+        "--target",
+        choices=WorkloadProfile.TARGETS,
+        help="Which ids updates hit",
+    )
+    parser.add_argument(
+        "--delete_target",
+        choices=WorkloadProfile.TARGETS,
+        help="Which ids deletes hit",
+    )
+    parser.add_argument("--zipf_s", type=float, help="Zipf exponent for the 'zipf' target")
+    parser.add_argument("--hot_fraction", type=float, help="Fraction of ids that are hot for the 'hotspot' target")
+    parser.add_argument("--hot_weight", type=float, help="Share of updates and deletes that hit hot ids")
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help="Continue after the ids that a previous run already generated",
+    )
+    parser.add_argument(
+        "-j",
+        "--journal_dir",
+        help="Directory for progress journals that make --resume exact after deletes",
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        help="Derive every record and update/delete decision from (seed, id), "
+             "so runs are reproducible however they are sharded or resumed",
+    )
+    parser.add_argument(
+        "--metrics_file",
+        help="Keep rows/sec, time split and rollback counts in this file during the run: "
+             "JSON if it ends in .json, Prometheus text otherwise. Workers write one file each",
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        help="Seconds between metrics file updates",
+        default=5.0,
+    )
+    parser.add_argument(
+        "--profile_dir",
+        help="Run under cProfile and tracemalloc and write their reports to this directory at exit",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        help="Times a batch is retried on a fresh connection after the connection drops",
+        default=10,
+    )
+    parser.add_argument(
+        "--heartbeat_interval",
+        type=float,
+        help="Stamp the heartbeat row every this many seconds during the run; "
+             "with -n 0, keep sending heartbeats until interrupted",
+    )
+    parser.add_argument(
+        "--heartbeat_id",
+        type=int,
+        help="Heartbeat row of this generator",
+        default=1,
+    )
+    parser.add_argument(
+        "--health_check_interval",
+        type=float,
+        help="Check a pooled connection with SELECT 1 before a batch if it has been idle this many seconds",
+        default=0.0,
+    )
     args = parser.parse_args()
     num_records = args.num_records
-    with psycopg2.connect(
-        database=POSTGRES_DB, 
-        user=POSTGRES_USER, 
-        password=POSTGRES_PASSWORD, 
-        host=POSTGRES_HOSTNAME) as conn:
-        gen_user_product_data(conn,num_records)
+    pool_size = args.pool_size if args.engine == "pool" else 0
+
+    overrides = {
+        name: getattr(args, name)
+        for name in ("update_ratio", "delete_ratio", "target", "delete_target", "zipf_s", "hot_fraction", "hot_weight")
+        if getattr(args, name) is not None
+    }
+    if args.seed is not None:
+        overrides.update(seed=args.seed, seekable=True)
+    profile = None
+    if args.profile:
+        profile = WorkloadProfile.from_file(args.profile, **overrides)
+    elif set(overrides) - {"seed", "seekable"}:
+        profile = WorkloadProfile(**overrides)
+
+    pool_options = {"max_retries": args.retries, "health_check_interval": args.health_check_interval}
+
+    with heartbeats(args.heartbeat_interval, args.heartbeat_id):
+        if not num_records and args.heartbeat_interval:
+            print(f"Sending a heartbeat every {args.heartbeat_interval}s, press Ctrl+C to stop")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        elif args.workers > 1:
+            rate = gen_user_product_data_parallel(
+                num_records, args.workers, args.mode, args.chunk_size, pool_size, profile,
+                args.resume, args.journal_dir, args.seed,
+                args.metrics_file, args.metrics_interval, args.profile_dir, pool_options)
+            print(f"{num_records} records with {args.workers} workers: {rate:,.0f} rows/sec")
+        else:
+            use_seed(args.seed)
+            if pool_size:
+                use_value_pools(pool_size)
+            with collect_metrics(args.metrics_file, args.metrics_interval) as metrics, \
+                    profile_run(args.profile_dir):
+                pool = ConnectionPool(connect, **pool_options)
+                try:
+                    generated = generate_range(
+                        pool, 1, num_records, args.mode, args.chunk_size, profile, args.resume, args.journal_dir)
+                finally:
+                    pool.close()
+                print(metrics.summary())
+            if args.resume:
+                print(f"Resumed: generated the last {generated} of {num_records} records")
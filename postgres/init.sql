@@ -18,6 +18,12 @@ CREATE TABLE IF NOT EXISTS products (
    price REAL NOT NULL
 );
 
+-- heartbeat rows written by the generator, for measuring replication lag while tables are idle
+CREATE TABLE IF NOT EXISTS heartbeat (
+   id int PRIMARY KEY,
+   ts_ms bigint NOT NULL
+);
+
 ALTER TABLE users REPLICA IDENTITY FULL;
 
 ALTER TABLE products REPLICA IDENTITY FULL;
@@ -0,0 +1,368 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR, connection, cursor
+from typing import Any, Callable, Dict, Iterator, Optional
+
+PHASES = ("generate", "execute", "commit")
+OPERATIONS = ("insert", "update", "delete", "other")
+
+# The metrics of the current process, or None when nothing is being measured
+active: Optional["GeneratorMetrics"] = None
+
+
+class GeneratorMetrics:
+    """
+    Counters and phase timers for one generator process.
+
+    Time is split into generating values (Faker or value pools), executing
+    SQL and committing, so a load test can tell whether the generator or the
+    database is the bottleneck. Rows are counted from each statement's
+    rowcount, by statement type.
+    """
+
+    def __init__(
+            self,
+            labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        Create zeroed metrics.
+
+        Args:
+            labels (Optional[Dict[str, str]]): Labels added to every Prometheus sample. Defaults to None.
+        """
+        self.labels = labels or {}
+        self.start = time.perf_counter()
+        self.seconds = {phase: 0.0 for phase in PHASES}
+        self.rows = {operation: 0 for operation in OPERATIONS}
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.reconnects = 0
+        self.reconnect_seconds = 0.0
+        self.deadlocks = 0
+        self.depth = 0
+
+    def record_statement(
+            self,
+            sql: Any,
+            rowcount: int,
+            seconds: float) -> None:
+        """
+        Account for one executed statement.
+
+        Args:
+            sql (Any): The statement, as str or bytes.
+            rowcount (int): Rows it affected, or -1 if unknown.
+            seconds (float): Time it took.
+
+        Returns:
+            None
+        """
+        verb = sql[:16].split(None, 1)[0]
+        if isinstance(verb, bytes):
+            verb = verb.decode()
+        verb = verb.lower()
+        operation = "insert" if verb in ("insert", "copy") else verb if verb in self.rows else "other"
+        self.rows[operation] += max(rowcount, 0)
+        self.statements += 1
+        self.seconds["execute"] += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return the current values.
+
+        Returns:
+            Dict[str, Any]: Elapsed time, inserted rows per second, per-phase
+                seconds, per-operation rows and the statement, commit and rollback counts.
+        """
+        elapsed = time.perf_counter() - self.start
+        return {
+            "labels": dict(self.labels),
+            "elapsed_seconds": elapsed,
+            "insert_rows_per_second": self.rows["insert"] / elapsed if elapsed else 0.0,
+            "seconds": dict(self.seconds),
+            "rows": dict(self.rows),
+            "statements": self.statements,
+            "commits": self.commits,
+            "rollbacks": self.rollbacks,
+            "reconnects": self.reconnects,
+            "reconnect_seconds": self.reconnect_seconds,
+            "deadlocks": self.deadlocks,
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        Render the current values in the Prometheus text exposition format.
+
+        Returns:
+            str: One HELP/TYPE block per metric.
+        """
+        values = self.snapshot()
+
+        def sample(name: str, value: float, **labels: str) -> str:
+            labels = {**self.labels, **labels}
+            text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            return f"{name}{{{text}}} {value}" if text else f"{name} {value}"
+
+        lines = [
+            "# HELP datagen_phase_seconds_total Seconds spent generating values, executing SQL and committing.",
+            "# TYPE datagen_phase_seconds_total counter",
+        ]
+        lines += [sample("datagen_phase_seconds_total", seconds, phase=phase)
+                  for phase, seconds in values["seconds"].items()]
+        lines += [
+            "# HELP datagen_rows_total Rows affected, by statement type.",
+            "# TYPE datagen_rows_total counter",
+        ]
+        lines += [sample("datagen_rows_total", rows, op=operation)
+                  for operation, rows in values["rows"].items()]
+        for name, kind, description in (
+                ("statements", "counter", "Statements executed."),
+                ("commits", "counter", "Transactions committed."),
+                ("rollbacks", "counter", "Transactions rolled back after an error."),
+                ("reconnects", "counter", "Recoveries from a dropped database connection."),
+                ("reconnect_seconds", "counter", "Seconds from dropped connections to working replacements."),
+                ("deadlocks", "counter", "Units of work rolled back as deadlock victims and retried."),
+                ("elapsed_seconds", "gauge", "Seconds since the run started."),
+                ("insert_rows_per_second", "gauge", "Inserted rows per second since the run started.")):
+            metric = f"datagen_{name}_total" if kind == "counter" else f"datagen_{name}"
+            lines += [
+                f"# HELP {metric} {description}",
+                f"# TYPE {metric} {kind}",
+                sample(metric, values[name]),
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(
+            self,
+            path: str) -> None:
+        """
+        Atomically write the metrics to a file.
+
+        Files ending in .json get the snapshot as JSON, anything else gets the
+        Prometheus text format (e.g. a .prom file for node_exporter's textfile collector).
+
+        Args:
+            path (str): Destination file.
+
+        Returns:
+            None
+        """
+        if path.endswith(".json"):
+            text = json.dumps(self.snapshot(), indent=2)
+        else:
+            text = self.to_prometheus()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def summary(self) -> str:
+        """
+        One-line human-readable summary.
+
+        Returns:
+            str: Rows per second and the share of time in each phase.
+        """
+        values = self.snapshot()
+        elapsed = values["elapsed_seconds"]
+        shares = ", ".join(
+            f"{phase} {100 * seconds / elapsed:.0f}%" for phase, seconds in values["seconds"].items())
+        return (f"{values['rows']['insert']} rows inserted in {elapsed:.1f}s: "
+                f"{values['insert_rows_per_second']:,.0f} rows/sec ({shares}), "
+                f"{values['rollbacks']} rollbacks, {values['reconnects']} reconnects "
+                f"({values['reconnect_seconds']:.1f}s), {values['deadlocks']} deadlocks")
+
+
+def timed(
+        phase: str) -> Callable:
+    """
+    Decorator adding a function's run time to a phase of the active metrics.
+
+    Nested timed calls are only counted once, by the outermost one.
+
+    Args:
+        phase (str): One of PHASES.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = active
+            if metrics is None or metrics.depth:
+                return func(*args, **kwargs)
+            metrics.depth += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.seconds[phase] += time.perf_counter() - start
+                metrics.depth -= 1
+        return wrapper
+    return decorate
+
+
+class TimedCursor(cursor):
+    """Cursor that reports statement time and rowcounts to the active metrics."""
+
+    def execute(self, query, vars=None):
+        if active is None:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            active.record_statement(query, self.rowcount, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        if active is None:
+            return super().executemany(query, vars_list)
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            active.record_statement(query, self.rowcount, time.perf_counter() - start)
+
+    def copy_expert(self, sql, file, size=8192):
+        if active is None:
+            return super().copy_expert(sql, file, size)
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            active.record_statement(sql, self.rowcount, time.perf_counter() - start)
+
+
+class TimedConnection(connection):
+    """Connection whose cursors, commits and rollbacks report to the active metrics."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = TimedCursor
+
+    def commit(self):
+        if active is None:
+            return super().commit()
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            active.seconds["commit"] += time.perf_counter() - start
+            active.commits += 1
+
+    def rollback(self):
+        if active is not None and self.info.transaction_status == TRANSACTION_STATUS_INERROR:
+            active.rollbacks += 1
+        return super().rollback()
+
+
+def shard_path(
+        path: Optional[str],
+        tag: Any) -> Optional[str]:
+    """
+    Per-process variant of an output path, e.g. datagen.prom -> datagen-1001.prom.
+
+    Args:
+        path (Optional[str]): The path given on the command line, or None.
+        tag (Any): What tells the processes apart, e.g. the shard's first id.
+
+    Returns:
+        Optional[str]: The tagged path, or None if path is None.
+    """
+    if path is None:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}-{tag}{ext}"
+
+
+@contextmanager
+def collect_metrics(
+        path: Optional[str] = None,
+        interval: float = 5.0,
+        labels: Optional[Dict[str, str]] = None) -> Iterator[GeneratorMetrics]:
+    """
+    Measure the enclosed run, rewriting the metrics file every `interval` seconds.
+
+    Args:
+        path (Optional[str]): Metrics file, see `GeneratorMetrics.write`. Defaults to None (no file).
+        interval (float): Seconds between rewrites of the file. Defaults to 5.0.
+        labels (Optional[Dict[str, str]]): Labels added to every Prometheus sample. Defaults to None.
+
+    Yields:
+        GeneratorMetrics: The metrics being collected.
+    """
+    global active
+    metrics = GeneratorMetrics(labels)
+    active = metrics
+    stop = threading.Event()
+
+    def report() -> None:
+        while not stop.wait(interval):
+            metrics.write(path)
+
+    reporter = threading.Thread(target=report, daemon=True)
+    if path:
+        reporter.start()
+    try:
+        yield metrics
+    finally:
+        stop.set()
+        if path:
+            reporter.join()
+            metrics.write(path)
+        active = None
+
+
+@contextmanager
+def profile_run(
+        directory: Optional[str],
+        tag: Any = "main",
+        limit: int = 30) -> Iterator[None]:
+    """
+    Run the enclosed code under cProfile and tracemalloc and write reports at exit.
+
+    Writes datagen-<tag>.pstats (load with pstats or snakeviz), cprofile-<tag>.txt
+    (functions by cumulative time) and tracemalloc-<tag>.txt (allocation sites
+    still holding the most memory, plus the peak). Does nothing if directory is None.
+
+    Args:
+        directory (Optional[str]): Where to write the reports.
+        tag (Any): Distinguishes the reports of different processes. Defaults to 'main'.
+        limit (int): Entries per text report. Defaults to 30.
+
+    Yields:
+        None
+    """
+    if directory is None:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(os.path.join(directory, f"datagen-{tag}.pstats"))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(limit)
+        with open(os.path.join(directory, f"cprofile-{tag}.txt"), "w") as f:
+            f.write(text.getvalue())
+        with open(os.path.join(directory, f"tracemalloc-{tag}.txt"), "w") as f:
+            f.write(f"peak traced memory: {peak / 2**20:.1f} MiB\n")
+            for stat in snapshot.statistics("lineno")[:limit]:
+                f.write(f"{stat}\n")
@@ -0,0 +1,80 @@
+from consistency_check import PostgresRanges, ReplicaRanges, find_differences
+from envelopes import TABLE_COLUMNS
+from materializer import TableState
+import pytest
+import psycopg2
+import os
+
+TEST_POSTGRES_USER = os.getenv("TEST_POSTGRES_USER")
+TEST_POSTGRES_PASSWORD = os.getenv("TEST_POSTGRES_PASSWORD")
+TEST_POSTGRES_HOSTNAME = os.getenv("TEST_POSTGRES_HOST")
+TEST_POSTGRES_DB = os.getenv("TEST_POSTGRES_DB")
+SCHEMA = os.getenv("DB_SCHEMA", "commerce")
+FIRST_ID = 900_001
+
+
+@pytest.fixture(scope="module")
+def db_connection():
+    """
+    Fixture to create a database connection with products 900001..901000 for testing.
+
+    The products are deleted again after the tests of this module.
+
+    Returns:
+        psycopg2.extensions.connection: The database connection.
+    """
+    conn = psycopg2.connect(
+        database=TEST_POSTGRES_DB,
+        user=TEST_POSTGRES_USER,
+        password=TEST_POSTGRES_PASSWORD,
+        host=TEST_POSTGRES_HOSTNAME
+    )
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.products (id, name, description, price) "
+            f"SELECT id, 'Product ' || id, CASE WHEN id %% 3 = 0 THEN 'about ' || id END, id / 7.0 "
+            f"FROM generate_series(%s, %s) AS id",
+            (FIRST_ID, FIRST_ID + 999))
+    conn.commit()
+    yield conn
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {SCHEMA}.products WHERE id >= %s", (FIRST_ID,))
+    conn.commit()
+    conn.close()
+
+
+def replica_of(conn) -> TableState:
+    """A TableState holding the current products, as a caught-up replica would."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT id, name, description, price FROM {SCHEMA}.products")
+        rows = cur.fetchall()
+    table = TableState(TABLE_COLUMNS["products"])
+    table.upsert([row[0] for row in rows], {
+        "name": [row[1] for row in rows],
+        "description": [row[2] for row in rows],
+        "price": [row[3] for row in rows],
+    })
+    return table
+
+
+def test_postgres_and_replica_hashes_agree(db_connection):
+    """
+    Test that hashes computed in SQL match those of the same rows in a replica, and differences are found.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection for testing.
+
+    Returns:
+        None
+    """
+    source = PostgresRanges(db_connection, "products", TABLE_COLUMNS["products"], SCHEMA)
+    replica = replica_of(db_connection)
+    assert find_differences(source, ReplicaRanges(replica)) == {"missing": [], "extra": [], "changed": []}
+
+    replica.delete([FIRST_ID + 10])
+    replica.upsert([FIRST_ID + 500], {"description": ["changed"]})
+    replica.upsert([FIRST_ID + 2_000], {"name": ["extra"], "price": [1.0]})
+    source.queries = 0
+    differences = find_differences(source, ReplicaRanges(replica), leaf_rows=32)
+    assert differences == {"missing": [FIRST_ID + 10], "extra": [FIRST_ID + 2_000], "changed": [FIRST_ID + 500]}
+    assert source.queries < 30
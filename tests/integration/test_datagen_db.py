@@ -1,5 +1,9 @@
 # Import the functions and constants needed for testing
 from user_product_data import *
+import user_product_data
+from async_driver import gen_user_product_data_async
+from rate_driver import RateSchedule, run_open_loop
+import asyncio
 import pytest
 import psycopg2
 import os
@@ -34,6 +38,39 @@ def db_connection():
     conn.close()
 
 
+@pytest.fixture
+def scratch_schema(db_connection, monkeypatch):
+    """
+    Fixture to point the generator at empty copies of the tables in a schema that is not captured.
+
+    Tests whose rows depend on timing or on a skewed profile write there, so that
+    test_kafka.py only counts the change events of the tests that write to SCHEMA.
+    The generator's worker processes inherit the settings, and connect to the test database.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection for testing.
+        monkeypatch (pytest.MonkeyPatch): Restores the generator's settings afterwards.
+
+    Yields:
+        str: Name of the schema, which is dropped after the test.
+    """
+    schema = f"{SCHEMA}_scratch"
+    cur = db_connection.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cur.execute(f"CREATE SCHEMA {schema}")
+    for table in ("users", "products"):
+        cur.execute(f"CREATE TABLE {schema}.{table} (LIKE {SCHEMA}.{table} INCLUDING ALL)")
+    db_connection.commit()
+    for name, value in (("SCHEMA", schema), ("POSTGRES_DB", TEST_POSTGRES_DB), ("POSTGRES_USER", TEST_POSTGRES_USER),
+                        ("POSTGRES_PASSWORD", TEST_POSTGRES_PASSWORD), ("POSTGRES_HOSTNAME", TEST_POSTGRES_HOSTNAME)):
+        monkeypatch.setattr(user_product_data, name, value)
+    yield schema
+    db_connection.rollback()
+    cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    db_connection.commit()
+    cur.close()
+
+
 @pytest.mark.parametrize("id", [random.randint(15, 35)])
 def test_insert_user_data(db_connection, id):
     """
@@ -222,3 +259,258 @@ def test_gen_user_product_data(db_connection, num_records):
     
     conn.rollback()  # Rollback the transaction to undo the insertions
     cur.close()
+
+
+def test_resume_point(db_connection, tmp_path):
+    """
+    Test finding where a previous generator run stopped.
+
+    A user committed without its product, as a crash can leave it, is
+    regenerated on resume. An empty range starts at its first id unless the
+    journal is further along.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection for testing.
+        tmp_path (pathlib.Path): Temporary directory provided by pytest.
+
+    Returns:
+        None
+    """
+    conn = db_connection
+    cur = conn.cursor()
+    insert_user_data(conn, cur, generate_user_data(800_103))
+    insert_user_data(conn, cur, generate_user_data(800_112))
+    insert_product_data(conn, cur, generate_product_data(800_112))
+    cur.close()
+    try:
+        assert resume_point(conn, 800_100, 15) == 800_112
+        # Bulk chunks of 10 ids starting at 800,100 are redone from the chunk start
+        assert resume_point(conn, 800_100, 15, chunk_size=10) == 800_110
+        assert resume_point(conn, 800_100, 10, chunk_size=10) == 800_100
+    finally:
+        clear_records(conn, 800_100, 800_114)
+
+    assert resume_point(conn, 900_000, 100) == 900_000
+
+    journal = ProgressJournal(str(tmp_path / "journal.json"))
+    journal.save(900_042)
+    assert resume_point(conn, 900_000, 100, journal) == 900_042
+
+    journal.save(900_100)
+    assert resume_point(conn, 900_000, 100, journal) == 900_100
+
+
+@pytest.mark.parametrize("num_records, chunk_size", [(10, 4)])
+def test_gen_user_product_data_bulk(db_connection, num_records, chunk_size):
+    """
+    Test the COPY-based bulk generation of user and product data.
+
+    Every record is loaded, updated and deleted in chunks, so the table counts
+    must be unchanged afterwards. A chunk size that does not divide
+    num_records exercises the final partial chunk.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection to be used for testing.
+        num_records (int): number of records for testing
+        chunk_size (int): number of records per COPY chunk
+
+    Returns:
+        None
+    """
+    conn = db_connection
+    cur = conn.cursor()
+    initial_user_count = get_user_count(cur)
+    initial_product_count = get_product_count(cur)
+
+    gen_user_product_data_bulk(conn, num_records, chunk_size, should_update=True, should_delete=True)
+
+    assert get_user_count(cur) == initial_user_count
+    assert get_product_count(cur) == initial_product_count
+
+    conn.rollback()
+    cur.close()
+
+
+def test_gen_user_product_data_bulk_hot_keys(db_connection, scratch_schema):
+    """
+    Test that bulk mode applies repeated updates of a hot key within one chunk.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection to be used for testing.
+        scratch_schema (str): Schema the generator writes to.
+
+    Returns:
+        None
+    """
+    conn = db_connection
+    cur = conn.cursor()
+    profile = WorkloadProfile(update_ratio=1.0, delete_ratio=0.0, target="zipf", zipf_s=1.5, seed=3)
+    ids = range(1_000, 1_050)
+    updates, _ = profile.plan(ids)
+    profile.reseed(3)
+    # The hot keys are the oldest ids, so make sure they exist
+    cur.execute(f"INSERT INTO {scratch_schema}.users SELECT id, 'hot', 'hot@example.com' "
+                f"FROM unnest(%s) AS id WHERE id < %s", (sorted(set(updates)), ids.start))
+    # Log every row update, as each one is a change event
+    cur.execute(f"CREATE TABLE {scratch_schema}.update_log (id int)")
+    cur.execute(f"CREATE FUNCTION {scratch_schema}.log_update() RETURNS trigger LANGUAGE plpgsql AS "
+                f"$$ BEGIN INSERT INTO {scratch_schema}.update_log VALUES (NEW.id); RETURN NEW; END $$")
+    cur.execute(f"CREATE TRIGGER log_update AFTER UPDATE ON {scratch_schema}.users "
+                f"FOR EACH ROW EXECUTE FUNCTION {scratch_schema}.log_update()")
+    conn.commit()
+
+    gen_user_product_data_bulk(conn, len(ids), chunk_size=len(ids), first_id=ids.start, profile=profile)
+
+    cur.execute(f"SELECT id, COUNT(*) FROM {scratch_schema}.update_log GROUP BY id")
+    logged = dict(cur.fetchall())
+    assert logged == {id: updates.count(id) for id in set(updates)}
+    assert max(logged.values()) > 1
+    cur.close()
+
+
+def test_gen_user_product_data_parallel_hot_keys(db_connection, scratch_schema):
+    """
+    Test that bulk workers whose updates and deletes hit the same hot keys do not deadlock.
+
+    Without retries, a deadlock between the workers fails the run.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection to be used for testing.
+        scratch_schema (str): Schema the generator writes to.
+
+    Returns:
+        None
+    """
+    profile = WorkloadProfile(update_ratio=0.5, delete_ratio=0.05, target="zipf", zipf_s=1.1,
+                              delete_target="zipf", seed=5)
+    gen_user_product_data_parallel(10_000, 2, mode="bulk", chunk_size=100, profile=profile,
+                                   pool_options={"max_retries": 0})
+
+    cur = db_connection.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {scratch_schema}.users WHERE id <= 10000")
+    assert cur.fetchone()[0] > 8_000
+    db_connection.rollback()
+    cur.close()
+
+
+@pytest.mark.parametrize("num_records, connections", [(10, 2)])
+def test_gen_user_product_data_async(db_connection, num_records, connections):
+    """
+    Test the pipelined async workload driver.
+
+    Every record is inserted, updated and deleted over several pipelined
+    connections, so the table counts must be unchanged afterwards.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection to be used for testing.
+        num_records (int): number of records for testing
+        connections (int): number of concurrent async connections
+
+    Returns:
+        None
+    """
+    conn = db_connection
+    cur = conn.cursor()
+    initial_user_count = get_user_count(cur)
+    initial_product_count = get_product_count(cur)
+
+    statements, _ = asyncio.run(gen_user_product_data_async(
+        num_records, connections, pipeline_depth=3, should_update=True, should_delete=True))
+
+    assert statements == 6 * num_records
+    assert get_user_count(cur) == initial_user_count
+    assert get_product_count(cur) == initial_product_count
+
+    conn.rollback()
+    cur.close()
+
+
+def test_run_open_loop(db_connection):
+    """
+    Test that the open-loop driver counts every operation it schedules once finished tasks are dropped.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection to be used for testing.
+
+    Returns:
+        None
+    """
+    conn = db_connection
+    cur = conn.cursor()
+    # Inserts continue from the max id, so start them above the ids whose change events test_kafka.py counts
+    cur.execute(f"INSERT INTO {SCHEMA}.users (id, username, email_address) VALUES (600000, 'open', 'open@example.com') "
+                f"ON CONFLICT (id) DO NOTHING RETURNING id")
+    added = [id for (id,) in cur.fetchall()]
+    cur.execute(f"SELECT MAX(id) FROM {SCHEMA}.users")
+    (max_id,) = cur.fetchone()
+    conn.commit()
+    try:
+        report = asyncio.run(run_open_loop(RateSchedule(200.0), 0.25, connections=2, update_ratio=0.0,
+                                           delete_ratio=0.0))
+
+        cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.users WHERE id > %s", (max_id,))
+        (inserted,) = cur.fetchone()
+        assert report["run"]["operations"] == report["insert"]["count"] == inserted > 0
+        assert report["insert"]["errors"] == 0
+    finally:
+        conn.rollback()
+        cur.execute(f"DELETE FROM {SCHEMA}.users WHERE id > %s OR id = ANY(%s)", (max_id, added))
+        cur.execute(f"DELETE FROM {SCHEMA}.products WHERE id > %s", (max_id,))
+        conn.commit()
+        cur.close()
+
+
+def test_connection_pool_reconnect(db_connection):
+    """
+    Test that ConnectionPool retries work on a new session after its backend is terminated.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection for testing.
+
+    Returns:
+        None
+    """
+    pool = ConnectionPool(lambda: psycopg2.connect(
+        database=TEST_POSTGRES_DB,
+        user=TEST_POSTGRES_USER,
+        password=TEST_POSTGRES_PASSWORD,
+        host=TEST_POSTGRES_HOSTNAME), backoff=0.0)
+    pids = []
+
+    def work(conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_backend_pid()")
+            pids.append(cur.fetchone()[0])
+            if len(pids) == 1:
+                cur.execute("SELECT pg_terminate_backend(pg_backend_pid())")
+        conn.commit()
+        return pids[-1]
+
+    try:
+        assert pool.run(work) == pids[1]
+    finally:
+        pool.close()
+    assert pids[0] != pids[1]
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_send_heartbeat(db_connection):
+    """
+    Test that send_heartbeat upserts one row per heartbeat id with the time it sent.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection for testing.
+
+    Returns:
+        None
+    """
+    first = send_heartbeat(db_connection, heartbeat_id=99)
+    time.sleep(0.01)
+    second = send_heartbeat(db_connection, heartbeat_id=99)
+    cur = db_connection.cursor()
+    cur.execute(f"SELECT ts_ms FROM {SCHEMA}.heartbeat WHERE id = 99")
+    assert cur.fetchall() == [(second,)]
+    assert second > first
+    cur.execute(f"DELETE FROM {SCHEMA}.heartbeat WHERE id = 99")
+    db_connection.commit()
+    cur.close()
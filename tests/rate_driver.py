@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import psycopg
+from typing import Dict, List, Optional, Set
+from async_driver import (
+    DELETE_PRODUCT,
+    DELETE_USER,
+    INSERT_PRODUCT,
+    INSERT_USER,
+    UPDATE_PRODUCT,
+    UPDATE_USER,
+    connect_async,
+)
+from user_product_data import (
+    SCHEMA,
+    fake,
+    generate_product_data,
+    generate_user_data,
+    use_value_pools,
+)
+
+OPERATIONS = ("insert", "update", "delete")
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with bounded relative error.
+
+    Values are recorded in microseconds into buckets whose width grows
+    geometrically, so memory stays small however long the run is and every
+    reported percentile is within `precision` of the true value.
+    """
+
+    def __init__(
+            self,
+            precision: float = 0.01) -> None:
+        """
+        Create an empty histogram.
+
+        Args:
+            precision (float): Relative width of each bucket. Defaults to 0.01 (1%).
+        """
+        self.log_base = math.log1p(precision)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.max_us = 0.0
+
+    def record(
+            self,
+            seconds: float) -> None:
+        """
+        Record one latency sample.
+
+        Args:
+            seconds (float): The latency in seconds.
+
+        Returns:
+            None
+        """
+        us = max(seconds * 1e6, 1.0)
+        index = int(math.log(us) / self.log_base)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.max_us = max(self.max_us, us)
+
+    def percentile(
+            self,
+            q: float) -> float:
+        """
+        Return the latency at quantile q, in milliseconds.
+
+        Args:
+            q (float): Quantile between 0 and 1, e.g. 0.99.
+
+        Returns:
+            float: The upper bound of the bucket containing the quantile, or 0.0 if empty.
+        """
+        if not self.count:
+            return 0.0
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(math.exp((index + 1) * self.log_base), self.max_us) / 1000.0
+        return self.max_us / 1000.0
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Summarise the histogram.
+
+        Returns:
+            Dict[str, float]: count and p50/p99/p999/max latencies in milliseconds.
+        """
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(0.50),
+            "p99_ms": self.percentile(0.99),
+            "p999_ms": self.percentile(0.999),
+            "max_ms": self.max_us / 1000.0,
+        }
+
+
+class RateSchedule:
+    """
+    Target operations per second as a function of time since the start.
+
+    The rate ramps linearly from `min_rate` up to `rate` over `ramp` seconds.
+    If `burst_rate` is set, the rate jumps to it for `burst_length` seconds at
+    the start of every `burst_every` seconds after the ramp.
+    """
+
+    def __init__(
+            self,
+            rate: float,
+            ramp: float = 0.0,
+            burst_rate: Optional[float] = None,
+            burst_every: float = 60.0,
+            burst_length: float = 5.0,
+            min_rate: float = 1.0) -> None:
+        """
+        Create a schedule.
+
+        Args:
+            rate (float): Steady-state operations per second.
+            ramp (float): Seconds to ramp up to `rate`. Defaults to 0.0.
+            burst_rate (Optional[float]): Operations per second during bursts. Defaults to None (no bursts).
+            burst_every (float): Seconds between the start of consecutive bursts. Defaults to 60.0.
+            burst_length (float): Length of each burst in seconds. Defaults to 5.0.
+            min_rate (float): Floor for the rate at the start of the ramp. Defaults to 1.0.
+        """
+        self.rate = rate
+        self.ramp = ramp
+        self.burst_rate = burst_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.min_rate = min_rate
+
+    def rate_at(
+            self,
+            elapsed: float) -> float:
+        """
+        Return the target rate at a point in the run.
+
+        Args:
+            elapsed (float): Seconds since the start of the run.
+
+        Returns:
+            float: Target operations per second.
+        """
+        if elapsed < self.ramp:
+            return max(self.rate * elapsed / self.ramp, self.min_rate)
+        if self.burst_rate is not None and (elapsed - self.ramp) % self.burst_every < self.burst_length:
+            return self.burst_rate
+        return self.rate
+
+
+def positive_float(value: str) -> float:
+    """
+    Parse a command line rate, which must be above zero.
+
+    Args:
+        value (str): The argument.
+
+    Returns:
+        float: The rate.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a number above zero.
+    """
+    try:
+        rate = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a number")
+    if not rate > 0:
+        raise argparse.ArgumentTypeError(f"{value} must be above zero")
+    return rate
+
+
+async def _execute(
+        pool: asyncio.Queue,
+        operation: str,
+        id: int,
+        intended: float,
+        histogram: LatencyHistogram,
+        errors: Dict[str, int]) -> None:
+    """
+    Run one operation on a pooled connection and record its latency.
+
+    Latency is measured from the time the operation was scheduled, not from
+    when a connection became free, so time spent queueing behind slow
+    commits is included.
+
+    Args:
+        pool (asyncio.Queue): Idle connections.
+        operation (str): 'insert', 'update' or 'delete'.
+        id (int): Id of the user and product to operate on.
+        intended (float): Event-loop time at which the operation was due.
+        histogram (LatencyHistogram): Histogram for this operation type.
+        errors (Dict[str, int]): Error counts per operation type.
+
+    Returns:
+        None
+    """
+    loop = asyncio.get_running_loop()
+    conn = await pool.get()
+    try:
+        async with conn.transaction():
+            if operation == "insert":
+                user = generate_user_data(id)
+                product = generate_product_data(id)
+                await conn.execute(INSERT_USER, (id, user["username"], user["email_address"]))
+                await conn.execute(
+                    INSERT_PRODUCT,
+                    (id, product["name"], product["description"], product["price"]))
+            elif operation == "update":
+                await conn.execute(UPDATE_USER, (fake.user_name(), id))
+                await conn.execute(UPDATE_PRODUCT, (fake.name(), id))
+            else:
+                await conn.execute(DELETE_USER, (id,))
+                await conn.execute(DELETE_PRODUCT, (id,))
+    except psycopg.Error:
+        errors[operation] += 1
+    finally:
+        pool.put_nowait(conn)
+    histogram.record(loop.time() - intended)
+
+
+async def run_open_loop(
+        schedule: RateSchedule,
+        duration: float,
+        connections: int = 8,
+        update_ratio: float = 0.10,
+        delete_ratio: float = 0.05) -> Dict[str, Dict[str, float]]:
+    """
+    Drive the database at a scheduled rate for a fixed duration.
+
+    Operations are issued at their scheduled times whether or not earlier
+    ones have finished (open loop), so a slow commit shows up as latency
+    instead of silently lowering the offered load. Inserts continue from the
+    table's current max id; updates and deletes pick a random earlier id.
+
+    Args:
+        schedule (RateSchedule): Target rate over time.
+        duration (float): Length of the run in seconds.
+        connections (int): Size of the connection pool. Defaults to 8.
+        update_ratio (float): Fraction of operations that are updates. Defaults to 0.10.
+        delete_ratio (float): Fraction of operations that are deletes. Defaults to 0.05.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Latency summary and error count per operation,
+            plus the offered and achieved rates under 'run'.
+    """
+    conns = await asyncio.gather(*(connect_async() for _ in range(connections)))
+    pool: asyncio.Queue = asyncio.Queue()
+    for conn in conns:
+        pool.put_nowait(conn)
+    cur = await conns[0].execute(f"SELECT COALESCE(MAX(id), 0) FROM {SCHEMA}.users")
+    next_id = (await cur.fetchone())[0] + 1
+
+    histograms = {operation: LatencyHistogram() for operation in OPERATIONS}
+    errors = {operation: 0 for operation in OPERATIONS}
+    in_flight: Set[asyncio.Task] = set()
+    failures: List[BaseException] = []
+    operations = 0
+
+    def finished(task: asyncio.Task) -> None:
+        in_flight.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    intended = start
+
+    try:
+        while intended - start < duration:
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            draw = random.random()
+            if draw < update_ratio and next_id > 1:
+                operation, id = "update", random.randint(1, next_id - 1)
+            elif draw < update_ratio + delete_ratio and next_id > 1:
+                operation, id = "delete", random.randint(1, next_id - 1)
+            else:
+                operation, id = "insert", next_id
+                next_id += 1
+            task = asyncio.create_task(_execute(pool, operation, id, intended, histograms[operation], errors))
+            in_flight.add(task)
+            task.add_done_callback(finished)
+            operations += 1
+            intended += 1.0 / schedule.rate_at(intended - start)
+        await asyncio.gather(*in_flight)
+        if failures:
+            raise failures[0]
+    finally:
+        for conn in conns:
+            await conn.close()
+
+    elapsed = loop.time() - start
+    report = {}
+    for operation in OPERATIONS:
+        report[operation] = histograms[operation].summary()
+        report[operation]["errors"] = errors[operation]
+    report["run"] = {
+        "operations": operations,
+        "offered_ops_per_sec": operations / duration,
+        "achieved_ops_per_sec": operations / elapsed,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop, rate-controlled workload driver")
+    parser.add_argument("-r", "--rate", type=positive_float, default=500.0, help="Target operations per second")
+    parser.add_argument("-d", "--duration", type=float, default=60.0, help="Run length in seconds")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Seconds to ramp up to --rate")
+    parser.add_argument("--burst_rate", type=positive_float, default=None, help="Operations per second during bursts")
+    parser.add_argument("--burst_every", type=float, default=60.0, help="Seconds between burst starts")
+    parser.add_argument("--burst_length", type=float, default=5.0, help="Length of each burst in seconds")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--update_ratio", type=float, default=0.10)
+    parser.add_argument("--delete_ratio", type=float, default=0.05)
+    parser.add_argument("-e", "--engine", choices=["faker", "pool"], default="faker")
+    parser.add_argument("--pool_size", type=int, default=10_000)
+    parser.add_argument("-o", "--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.engine == "pool":
+        use_value_pools(args.pool_size)
+    schedule = RateSchedule(args.rate, args.ramp, args.burst_rate, args.burst_every, args.burst_length)
+    report = asyncio.run(run_open_loop(
+        schedule, args.duration, args.connections, args.update_ratio, args.delete_ratio))
+
+    print(f"{'op':>7} {'count':>8} {'p50 ms':>9} {'p99 ms':>9} {'p999 ms':>9} {'max ms':>9} {'errors':>7}")
+    for operation in OPERATIONS:
+        row = report[operation]
+        print(f"{operation:>7} {row['count']:>8} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+              f"{row['p999_ms']:>9.2f} {row['max_ms']:>9.2f} {row['errors']:>7}")
+    print(f"offered {report['run']['offered_ops_per_sec']:,.0f} ops/sec, "
+          f"achieved {report['run']['achieved_ops_per_sec']:,.0f} ops/sec")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
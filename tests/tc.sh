@@ -2,6 +2,16 @@
 
 echo -e "\n"
 
+# CONVERTER=avro switches both connectors from JSON with an inline schema in every
+# message to Avro with schema ids from the test schema-registry service
+CONVERTER_CONFIG=""
+if [ "${CONVERTER}" == "avro" ]; then
+    CONVERTER_CONFIG='"key.converter": "io.confluent.connect.avro.AvroConverter",
+            "key.converter.schema.registry.url": "http://schema-registry:8081",
+            "value.converter": "io.confluent.connect.avro.AvroConverter",
+            "value.converter.schema.registry.url": "http://schema-registry:8081",'
+fi
+
 #setup PG-source
 echo -e "Setting up testing Postgres source...\n"
 
@@ -11,6 +21,7 @@ curl --include --request POST --header "Accept:application/json" \
     --data '{    
         "name": "test-pg-src-connector",
         "config": {
+            '"${CONVERTER_CONFIG}"'
             "connector.class": "io.debezium.connector.postgresql.PostgresConnector",
             "tasks.max": "1",
             "database.hostname": "'"${TEST_POSTGRES_USER}"'",
@@ -36,6 +47,7 @@ curl --include --request POST --header "Accept:application/json" \
     --data '{
         "name": "test-s3-sink",
         "config": {
+            '"${CONVERTER_CONFIG}"'
             "connector.class": "io.aiven.kafka.connect.s3.AivenKafkaConnectS3SinkConnector",
             "aws.access.key.id": "'"${TEST_AWS_KEY_ID}"'",
             "aws.secret.access.key": "'"${TEST_AWS_SECRET_KEY}"'",
@@ -44,9 +56,9 @@ curl --include --request POST --header "Accept:application/json" \
             "aws.s3.region": "us-east-1",
             "format.output.type": "jsonl",
             "topics": "test_debezium.commerce.users, test_debezium.commerce.products",
-            "file.compression.type": "none",
+            "file.compression.type": "zstd",
             "flush.size": "20",
-            "file.name.template": "/{{topic}}/{{timestamp:unit=yyyy}}-{{timestamp:unit=MM}}-{{timestamp:unit=dd}}/{{timestamp:unit=HH}}/{{partition:padding=true}}-{{start_offset:padding=true}}.json"
+            "file.name.template": "/{{topic}}/{{timestamp:unit=yyyy}}-{{timestamp:unit=MM}}-{{timestamp:unit=dd}}/{{timestamp:unit=HH}}/{{partition:padding=true}}-{{start_offset:padding=true}}.json.zst"
         }
     }'
 echo -e "\n"
\ No newline at end of file
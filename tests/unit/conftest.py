@@ -0,0 +1,140 @@
+import datetime
+import gzip
+import json
+import pytest
+import zstandard
+from envelopes import change_event
+from object_store import LocalObjectStore, ObjectInfo
+from typing import Any, Iterator, List, Optional, Sequence
+
+SUFFIXES = {"none": ".json", "gzip": ".json.gz", "zstd": ".json.zst"}
+
+
+class SinkArchive:
+    """Writes objects laid out as the S3 sink writes them, for the tests of the archive's readers."""
+
+    USERS = "debezium.commerce.users"
+    PRODUCTS = "debezium.commerce.products"
+    NOW = datetime.datetime(2024, 1, 31, 15, 10)  # compaction skips the hour this falls in
+
+    def write(
+            self,
+            store: Any,
+            topic: str,
+            hour: str,
+            offset: int,
+            values: Sequence[Any],
+            partition: int = 0,
+            codec: str = "none",
+            prefix: str = "/",
+            suffix: Optional[str] = None) -> str:
+        """
+        Write one object of JSON lines, one message per value.
+
+        Args:
+            store (Any): Store to write to.
+            topic (str): Topic of the messages.
+            hour (str): Directory of the hour, e.g. '2024-01-31/13'.
+            offset (int): Kafka offset of the first message.
+            values (Sequence[Any]): Message values.
+            partition (int): Kafka partition of the messages. Defaults to 0.
+            codec (str): 'none', 'gzip' or 'zstd'. Defaults to 'none'.
+            prefix (str): What the key starts with before the topic. Defaults to '/', as the sink writes.
+            suffix (Optional[str]): End of the key. Defaults to the one the sink uses for the codec.
+
+        Returns:
+            str: The object's key.
+        """
+        data = "\n".join(json.dumps({"value": value}) for value in values).encode()
+        if codec == "gzip":
+            data = gzip.compress(data)
+        elif codec == "zstd":
+            data = zstandard.ZstdCompressor().compress(data)
+        key = f"{prefix}{topic}/{hour}/{partition:010d}-{offset:020d}{suffix or SUFFIXES[codec]}"
+        store.put(key, data)
+        return key
+
+    def products(
+            self,
+            store: Any,
+            hour: str,
+            offset: int,
+            lsns: Sequence[int],
+            op: str = "c") -> str:
+        """
+        Write product changes on partition 0.
+
+        Args:
+            store (Any): Store to write to.
+            hour (str): Directory of the hour, e.g. '2024-01-31/13'.
+            offset (int): Kafka offset of the first change.
+            lsns (Sequence[int]): Lsn of each change; the product id is lsn % 10 and the commit time 1,000 + lsn.
+            op (str): Operation of every change, or one per change, e.g. 'ccud'. Defaults to 'c'.
+
+        Returns:
+            str: The object's key.
+        """
+        values = []
+        for change, lsn in zip(op * len(lsns) if len(op) == 1 else op, lsns):
+            row = {"id": lsn % 10, "name": f"Product {lsn}", "description": None, "price": lsn / 4}
+            before, after = (row, None) if change == "d" else (None, row)
+            values.append(change_event("products", change, before, after, lsn, lsn, 1_000 + lsn))
+        return self.write(store, self.PRODUCTS, hour, offset, values)
+
+    def users(
+            self,
+            store: Any,
+            hour: str,
+            ids: range,
+            partition: int = 0,
+            codec: str = "none") -> str:
+        """
+        Write user inserts, one per id from the offset ids[0] on.
+
+        Args:
+            store (Any): Store to write to.
+            hour (str): Directory of the hour, e.g. '2024-01-31/13'.
+            ids (range): Row ids, which double as lsns, commit times and offsets.
+            partition (int): Kafka partition of the records. Defaults to 0.
+            codec (str): 'none', 'gzip' or 'zstd'. Defaults to 'none'.
+
+        Returns:
+            str: The object's key.
+        """
+        values = [change_event("users", "c", None, {"id": id, "username": f"user{id}"}, id, id, id) for id in ids]
+        return self.write(store, self.USERS, hour, ids[0], values, partition, codec)
+
+
+@pytest.fixture
+def archive() -> SinkArchive:
+    """Writer of objects in the S3 sink's archive layout."""
+    return SinkArchive()
+
+
+class CountingStore(LocalObjectStore):
+    """Local store that counts the keys it lists and records the keys it reads."""
+
+    def __init__(self, directory: str) -> None:
+        super().__init__(directory)
+        self.listed = 0
+        self.read: List[str] = []
+
+    def list(self, prefix: str = "", start_after: Optional[str] = None) -> Iterator[ObjectInfo]:
+        for info in super().list(prefix, start_after):
+            self.listed += 1
+            yield info
+
+    def get(self, key: str) -> bytes:
+        self.read.append(key)
+        return super().get(key)
+
+    def reset(self) -> None:
+        """Forget the calls so far."""
+        self.listed = 0
+        self.read.clear()
+
+
+@pytest.fixture
+def store(tmp_path) -> CountingStore:
+    """Local store in the test's temporary directory that counts list and get calls."""
+    return CountingStore(str(tmp_path))
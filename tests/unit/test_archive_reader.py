@@ -0,0 +1,55 @@
+import pytest
+from archive_reader import ArchiveReader
+from archive_replay import list_archive
+from fake_s3 import FakeS3Server
+from object_store import S3ObjectStore
+
+
+def test_archive_reader_streams_in_order(tmp_path, archive) -> None:
+    """
+    Test that objects of every codec are read in order over few pooled connections.
+
+    Returns:
+        None
+    """
+    with FakeS3Server(str(tmp_path)) as server:
+        store = S3ObjectStore("commerce", server.endpoint)
+        for offset, count, codec in [(0, 5, "none"), (5, 3, "gzip"), (8, 7, "zstd"), (15, 0, "none")]:
+            # Every key ends in .json.zst, so the codec must be detected from the content
+            archive.write(store, archive.USERS, "2024-01-31/13", offset, [{"offset": offset + i} for i in range(count)],
+                          codec=codec, prefix="", suffix=".json.zst")
+        opened = store.connections_opened
+        objects = list_archive(store, [archive.USERS], prefix="")
+        assert [archived.start_offset for archived in objects] == [0, 5, 8, 15]
+        messages = list(ArchiveReader(store, workers=2, chunk_messages=2, chunks_ahead=1).messages(objects))
+        assert [offset for _, offset, _ in messages] == list(range(15))
+        assert [message["value"]["offset"] for _, _, message in messages] == list(range(15))
+        assert store.connections_opened - opened <= 2
+
+
+def test_archive_reader_stops_early_and_raises(tmp_path, archive) -> None:
+    """
+    Test that a reader stopped early returns promptly and fetch errors surface in order.
+
+    Returns:
+        None
+    """
+    with FakeS3Server(str(tmp_path)) as server:
+        store = S3ObjectStore("commerce", server.endpoint)
+        for offset in range(0, 2_000, 100):
+            offsets = [{"offset": offset + i} for i in range(100)]
+            archive.write(store, archive.USERS, "2024-01-31/13", offset, offsets, codec="zstd", prefix="")
+        objects = list_archive(store, [archive.USERS], prefix="")
+        reader = ArchiveReader(store, workers=4, chunk_messages=10, chunks_ahead=1)
+        messages = reader.messages(objects)
+        assert next(messages)[1] == 0
+        messages.close()
+
+        store.put(f"{archive.USERS}/2024-01-31/14/0000000000-{3_000:020d}.json", b"\x82SNAPPY\x00")
+        objects = list_archive(store, [archive.USERS], prefix="")
+        with pytest.raises(ValueError):
+            for _ in reader.messages(objects):
+                pass
+        store.delete(objects[0].key)
+        with pytest.raises(FileNotFoundError):
+            next(reader.messages(objects))
@@ -0,0 +1,102 @@
+import datetime
+import json
+import time
+from archive_replay import decode_object, list_archive, parse_key, replay
+from change_events import ChangeEventConsumer
+from fake_broker import FakeBroker
+from fake_s3 import FakeS3Server
+from object_store import LocalObjectStore, S3ObjectStore
+
+
+def test_list_archive_range_and_order(tmp_path, archive) -> None:
+    """
+    Test that only objects in the time range are listed, in hour, partition and offset order.
+
+    Returns:
+        None
+    """
+    store = LocalObjectStore(str(tmp_path))
+    archive.users(store, "2024-01-31/13", range(10, 20), partition=1)
+    archive.users(store, "2024-01-31/13", range(0, 10))
+    archive.users(store, "2024-01-31/12", range(100, 110))
+    archive.users(store, "2024-02-01/00", range(20, 30), codec="gzip")
+    archive.users(store, "2024-02-01/01", range(30, 40))
+
+    objects = list_archive(
+        store, [archive.USERS], datetime.datetime(2024, 1, 31, 13, 30), datetime.datetime(2024, 2, 1, 1))
+    assert [(o.hour.hour, o.partition, o.start_offset) for o in objects] == [(13, 0, 0), (13, 1, 10), (0, 0, 20)]
+    assert len(list_archive(store, [archive.USERS])) == 5
+    assert parse_key("/other/file.json") is None
+
+
+def test_replay_into_kafka(tmp_path, archive) -> None:
+    """
+    Test that replayed events keep their partition and order and come back in the connector's format.
+
+    Returns:
+        None
+    """
+    store = LocalObjectStore(str(tmp_path))
+    archive.users(store, "2024-01-31/13", range(0, 30))
+    archive.users(store, "2024-01-31/13", range(30, 50), partition=1)
+    archive.users(store, "2024-01-31/14", range(50, 60), codec="gzip")
+    broker = FakeBroker()
+    broker.create_topic(archive.USERS, 2)
+
+    stats = replay(store, list_archive(store, [archive.USERS]), broker.producer(), workers=2)
+    assert stats["objects"] == 3 and stats["events"] == 60
+
+    consumer = ChangeEventConsumer([archive.USERS], consumer_factory=broker.consumer)
+    lsns = {0: [], 1: []}
+    for batches in consumer.batches(0):
+        for partition, lsn in zip(batches[archive.USERS].partition.tolist(), batches[archive.USERS].lsn.tolist()):
+            lsns[partition].append(lsn)
+    assert consumer.decoder.full_parses == 1
+    consumer.close()
+    assert lsns == {0: list(range(0, 30)) + list(range(50, 60)), 1: list(range(30, 50))}
+
+
+def test_replay_rate_limit(tmp_path, archive) -> None:
+    """
+    Test that the rate limit spreads the events out.
+
+    Returns:
+        None
+    """
+    store = LocalObjectStore(str(tmp_path))
+    archive.users(store, "2024-01-31/13", range(0, 41))
+    start = time.perf_counter()
+    stats = replay(store, list_archive(store, [archive.USERS]), FakeBroker().producer(), rate=200)
+    assert stats["events"] == 41
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_decode_object_binary_and_keys(archive) -> None:
+    """
+    Test that base64 values and keys are decoded and missing keys are derived from the row.
+
+    Returns:
+        None
+    """
+    lines = [{"value": "AAAAAAE=", "key": "a2V5"}, {"value": {"before": {"id": 7}, "after": None}}]
+    records = decode_object("\n".join(json.dumps(line) for line in lines).encode(), archive.USERS, schemas=False)
+    assert records[0].value == b"\x00\x00\x00\x00\x01" and records[0].key == b"key"
+    assert json.loads(records[1].key) == {"id": 7}
+    assert json.loads(records[1].value) == {"before": {"id": 7}, "after": None}
+
+
+def test_s3_object_store(tmp_path) -> None:
+    """
+    Test that the S3 client signs its requests, follows listing pages and reads and writes objects.
+
+    Returns:
+        None
+    """
+    with FakeS3Server(str(tmp_path), page_size=1) as server:
+        store = S3ObjectStore("bucket", server.endpoint, "key", "secret")
+        store.put("a/1.json", b"one")
+        store.put("a/2.json", b"two")
+        assert [info.key for info in store.list("a/")] == ["a/1.json", "a/2.json"]
+        assert store.get("a/2.json") == b"two"
+        assert len(server.authorizations) == 5
+        assert all(header.startswith("AWS4-HMAC-SHA256 Credential=key/") for header in server.authorizations)
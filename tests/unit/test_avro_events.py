@@ -0,0 +1,65 @@
+import pytest
+from avro_events import AvroDecoder, FileSchemaRegistry, encode_avro
+from change_events import decode_records
+from collections import namedtuple
+from envelopes import change_event, envelope_avro_schema
+
+Record = namedtuple("Record", ["partition", "offset", "value"])
+TOPIC = "debezium.commerce.products"
+
+
+def product(id: int, price: float = 12.5) -> dict:
+    return {"id": id, "name": f"Product {id}", "description": None, "price": price}
+
+
+def test_file_schema_registry(tmp_path) -> None:
+    """
+    Test that FileSchemaRegistry assigns stable ids and rejects unknown ones.
+
+    Args:
+        tmp_path: Temporary directory fixture.
+
+    Returns:
+        None
+    """
+    registry = FileSchemaRegistry(str(tmp_path))
+    products = envelope_avro_schema("products")
+    users = envelope_avro_schema("users")
+    assert registry.register(products) == 1
+    assert registry.register(users) == 2
+    assert FileSchemaRegistry(str(tmp_path)).register(products) == 1
+    assert registry.schema(2) == users
+    with pytest.raises(KeyError):
+        registry.schema(3)
+
+
+def test_avro_decoder_caches_schemas(tmp_path) -> None:
+    """
+    Test that AvroDecoder round-trips payloads and asks the registry once per schema id.
+
+    Args:
+        tmp_path: Temporary directory fixture.
+
+    Returns:
+        None
+    """
+    registry = FileSchemaRegistry(str(tmp_path))
+    schema = envelope_avro_schema("products")
+    schema_id = registry.register(schema)
+    events = [
+        change_event("products", "c", None, product(1), lsn=10, tx_id=1, ts_ms=1000),
+        change_event("products", "u", product(1), product(1, 20.25), lsn=20, tx_id=2, ts_ms=2000),
+        change_event("products", "d", product(1, 20.25), None, lsn=30, tx_id=3, ts_ms=3000),
+    ]
+    records = [Record(0, offset, encode_avro(schema_id, schema, event)) for offset, event in enumerate(events)]
+    records.append(Record(0, 3, None))
+
+    decoder = AvroDecoder(registry)
+    assert [decoder.payload(TOPIC, record.value) for record in records] == events + [None]
+    batch = decode_records(decoder, TOPIC, records)
+    assert decoder.lookups == 1
+    assert list(batch.op) == ["c", "u", "d"]
+    assert batch.after["price"] == [12.5, 20.25, None]
+
+    with pytest.raises(ValueError):
+        decoder.payload(TOPIC, b"\x01" + records[0].value[1:])
@@ -0,0 +1,74 @@
+from collections import namedtuple
+from change_events import ChangeBatch, EnvelopeDecoder, decode_records
+from envelopes import change_event, encode_envelope
+
+Record = namedtuple("Record", ["partition", "offset", "value"])
+TOPIC = "debezium.commerce.users"
+
+
+def user(id: int, username: str = "alice") -> dict:
+    return {"id": id, "username": username, "email_address": f"{username}@example.com"}
+
+
+def test_decoder_parses_schema_once() -> None:
+    """
+    Test that EnvelopeDecoder parses the schema of a topic only once, and again after it changes.
+
+    Returns:
+        None
+    """
+    decoder = EnvelopeDecoder()
+    payloads = [change_event("users", "c", None, user(id), lsn=100 + id, tx_id=1, ts_ms=0) for id in range(5)]
+    for payload in payloads:
+        assert decoder.payload(TOPIC, encode_envelope("users", payload)) == payload
+    assert decoder.full_parses == 1
+    assert decoder.schemas[TOPIC]["name"] == "debezium.commerce.users.Envelope"
+
+    renamed = encode_envelope("users", payloads[0], prefix="other")
+    assert decoder.payload(TOPIC, renamed) == payloads[0]
+    assert decoder.full_parses == 2
+
+
+def test_decoder_without_schemas_and_tombstones() -> None:
+    """
+    Test payload-only messages (schemas.enable=false) and tombstones.
+
+    Returns:
+        None
+    """
+    decoder = EnvelopeDecoder()
+    payload = change_event("users", "d", user(1), None, lsn=7, tx_id=2, ts_ms=0)
+    assert decoder.payload(TOPIC, encode_envelope("users", payload, schemas=False)) == payload
+    assert decoder.payload(TOPIC, None) is None
+    assert TOPIC not in decoder.prefixes
+
+
+def test_decode_records_columnar() -> None:
+    """
+    Test that decode_records builds aligned op, metadata and row image columns.
+
+    Returns:
+        None
+    """
+    events = [
+        change_event("users", "c", None, user(1), lsn=10, tx_id=1, ts_ms=1000),
+        change_event("users", "u", user(1), user(1, "bob"), lsn=20, tx_id=2, ts_ms=2000),
+        None,
+        change_event("users", "d", user(1, "bob"), None, lsn=30, tx_id=3, ts_ms=3000),
+    ]
+    records = [
+        Record(0, offset, encode_envelope("users", event) if event else None)
+        for offset, event in enumerate(events)
+    ]
+    batch = decode_records(EnvelopeDecoder(), TOPIC, records)
+
+    assert isinstance(batch, ChangeBatch)
+    assert len(batch) == 3
+    assert list(batch.op) == ["c", "u", "d"]
+    assert list(batch.lsn) == [10, 20, 30]
+    assert list(batch.offset) == [0, 1, 3]
+    assert list(batch.source_ts_ms) == [1000, 2000, 3000]
+    assert batch.after["username"] == ["alice", "bob", None]
+    assert batch.before["username"] == [None, "alice", "bob"]
+    assert list(batch.lsn[batch.op == "d"]) == [30]
+    assert list(batch.rows("after"))[2] == {}
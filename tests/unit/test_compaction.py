@@ -0,0 +1,74 @@
+import datetime
+import io
+import json
+import pyarrow.parquet as pq
+from compaction import MANIFEST, compact, hour_prefix
+from object_store import LocalObjectStore
+
+
+def read_hour(
+        store: LocalObjectStore,
+        topic: str,
+        hour: datetime.datetime) -> tuple:
+    """
+    Read the manifest and the rows of a compacted hour.
+
+    Args:
+        store (LocalObjectStore): Store holding the output.
+        topic (str): The topic.
+        hour (datetime.datetime): The hour.
+
+    Returns:
+        tuple: The manifest and the rows of its files as a dict of columns.
+    """
+    prefix = hour_prefix("compacted/", topic, hour)
+    manifest = json.loads(store.get(prefix + MANIFEST))
+    tables = [pq.read_table(io.BytesIO(store.get(prefix + file["key"]))) for file in manifest["files"]]
+    rows = {name: sum((table.column(name).to_pylist() for table in tables), []) for name in tables[0].column_names}
+    return manifest, rows
+
+
+def test_compaction_sorts_and_flattens(tmp_path, archive) -> None:
+    """
+    Test that an hour's objects are merged into sorted, flattened Parquet files and the current hour is skipped.
+
+    Returns:
+        None
+    """
+    store = LocalObjectStore(str(tmp_path))
+    archive.products(store, "2024-01-31/13", 20, [25, 21, 23])
+    archive.products(store, "2024-01-31/13", 0, [12, 10, 14, 11])
+    archive.products(store, "2024-01-31/13", 30, [26], op="d")
+    archive.products(store, "2024-01-31/15", 40, [40])
+
+    manifests = compact(store, [archive.PRODUCTS], rows_per_file=5, now=archive.NOW)
+    assert [manifest["hour"] for manifest in manifests] == ["2024-01-31T13:00:00"]
+    manifest, rows = read_hour(store, archive.PRODUCTS, datetime.datetime(2024, 1, 31, 13))
+    assert manifest["rows"] == 8 and len(manifest["files"]) == 2
+    assert [(file["min_lsn"], file["max_lsn"]) for file in manifest["files"]] == [(10, 21), (23, 26)]
+    assert rows["lsn"] == [10, 11, 12, 14, 21, 23, 25, 26]
+    assert rows["offset"][:2] == [1, 3]
+    assert rows["op"][-1] == "d" and rows["after_id"][-1] is None and rows["before_id"][-1] == 6
+    assert rows["after_price"][0] == 2.5 and rows["kafka_ts_ms"][0] is None
+
+
+def test_compaction_is_incremental(tmp_path, archive) -> None:
+    """
+    Test that re-running skips compacted objects, folds late ones in and replaces the old files.
+
+    Returns:
+        None
+    """
+    store = LocalObjectStore(str(tmp_path))
+    archive.products(store, "2024-01-31/13", 0, [10, 11])
+    first = compact(store, [archive.PRODUCTS], now=archive.NOW, delete_sources=True)[0]
+    assert compact(store, [archive.PRODUCTS], now=archive.NOW) == []
+    assert not [info for info in store.list("/" + archive.PRODUCTS)]
+
+    archive.products(store, "2024-01-31/13", 2, [12])
+    second = compact(store, [archive.PRODUCTS], now=archive.NOW)[0]
+    assert len(second["sources"]) == 2 and second["rows"] == 3
+    manifest, rows = read_hour(store, archive.PRODUCTS, datetime.datetime(2024, 1, 31, 13))
+    assert rows["lsn"] == [10, 11, 12]
+    files = {info.key.rsplit("/", 1)[-1] for info in store.list("compacted/")}
+    assert files == {MANIFEST, second["files"][0]["key"]} and first["files"][0]["key"] not in files
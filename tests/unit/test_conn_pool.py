@@ -0,0 +1,162 @@
+import psycopg2
+import pytest
+from conn_pool import ConnectionPool
+from psycopg2.pool import PoolError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        if self.conn.dead:
+            self.conn.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def db_error(pgcode, message):
+    """An OperationalError carrying the SQLSTATE the server would have sent."""
+    return type("ServerError", (psycopg2.OperationalError,), {"pgcode": pgcode})(message)
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    return ConnectionPool(connect, backoff=0.0, **kwargs), opened
+
+
+def test_run_retries_on_fresh_connection() -> None:
+    """
+    Test that work failing with a connection error is retried on a new connection.
+
+    Returns:
+        None
+    """
+    pool, opened = make_pool()
+    cleared = []
+
+    def work(conn):
+        if len(opened) == 1:
+            raise db_error("57P01", "terminating connection due to administrator command")
+        return "done"
+
+    assert pool.run(work, on_retry=cleared.append) == "done"
+    assert len(opened) == 2
+    assert opened[0].closed
+    assert cleared == [opened[1]]
+    assert pool.stats()["reconnects"] == 1
+    assert pool.stats()["open"] == 1
+    assert pool.stats()["deadlocks"] == 0
+
+
+def test_run_retries_deadlock_on_same_connection() -> None:
+    """
+    Test that a deadlock victim is rolled back and retried on its connection, counted apart from reconnects.
+
+    Returns:
+        None
+    """
+    pool, opened = make_pool()
+    attempts = []
+
+    def work(conn):
+        attempts.append(conn)
+        if len(attempts) == 1:
+            raise db_error("40P01", "deadlock detected")
+        return "done"
+
+    assert pool.run(work) == "done"
+    assert attempts == [opened[0], opened[0]]
+    assert opened[0].rollbacks == 1
+    assert not opened[0].closed
+    assert pool.stats()["deadlocks"] == 1
+    assert pool.stats()["reconnects"] == 0
+
+
+def test_run_passes_statement_errors() -> None:
+    """
+    Test that operational errors which leave the session usable are raised without a retry.
+
+    Returns:
+        None
+    """
+    pool, opened = make_pool()
+    for error in (db_error("57014", "canceling statement due to statement timeout"),
+                  db_error("53100", "could not extend file: No space left on device")):
+
+        def work(conn):
+            raise error
+
+        with pytest.raises(psycopg2.OperationalError):
+            pool.run(work)
+    assert len(opened) == 2
+    assert pool.stats()["retries"] == 0
+
+
+def test_run_gives_up_and_passes_other_errors() -> None:
+    """
+    Test that retries are bounded and that other errors are not retried.
+
+    Returns:
+        None
+    """
+    pool, opened = make_pool(max_retries=2)
+
+    def dropped(conn):
+        raise psycopg2.InterfaceError("connection already closed")
+
+    with pytest.raises(psycopg2.InterfaceError):
+        pool.run(dropped)
+    assert len(opened) == 3
+
+    def duplicate(conn):
+        raise psycopg2.IntegrityError("duplicate key")
+
+    with pytest.raises(psycopg2.IntegrityError):
+        pool.run(duplicate)
+    assert len(opened) == 4
+    assert pool.stats()["open"] == 0
+
+
+def test_acquire_health_check_and_bound() -> None:
+    """
+    Test that dead idle connections are replaced and the pool size is enforced.
+
+    Returns:
+        None
+    """
+    pool, opened = make_pool(size=1)
+    conn = pool.acquire()
+    with pytest.raises(PoolError):
+        pool.acquire(timeout=0.01)
+
+    conn.dead = True
+    pool.release(conn)
+    assert pool.acquire() is opened[1]
+    assert opened[0].closed
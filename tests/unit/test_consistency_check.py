@@ -0,0 +1,83 @@
+import json
+from consistency_check import ReplicaRanges, archive_materializer, find_differences, row_hash
+from envelopes import TABLE_COLUMNS, change_event, encode_envelope
+from materializer import TableState
+from object_store import LocalObjectStore
+
+
+def products(ids) -> TableState:
+    table = TableState(TABLE_COLUMNS["products"])
+    ids = list(ids)
+    table.upsert(ids, {
+        "name": [f"Product {id}" for id in ids],
+        "description": [None if id % 3 else f"about {id}" for id in ids],
+        "price": [id / 4 for id in ids],
+    })
+    return table
+
+
+def test_row_hash_canonical_form() -> None:
+    """
+    Test that row hashes see NULLs and REAL rounding the way Postgres renders them.
+
+    Returns:
+        None
+    """
+    kinds = ["int32", "string", "float"]
+    assert row_hash([1, None, 12.99], kinds) != row_hash([1, "\\N ", 12.99], kinds)
+    assert row_hash([1, "a", 12.99], kinds) == row_hash([1, "a", 12.990000000001], kinds)
+    assert row_hash([1, "a", 1e6], kinds) == row_hash([1, "a", 1000000.0], kinds)
+    assert row_hash([1, "a", 1.0], kinds) != row_hash([1, "a", 2.0], kinds)
+
+
+def test_find_differences_drills_down() -> None:
+    """
+    Test that only differing ranges are drilled into and every kind of difference is found.
+
+    Returns:
+        None
+    """
+    source = products(range(1, 20_001))
+    replica = products(list(range(1, 10_000)) + list(range(10_001, 20_001)) + [20_500])
+    replica.upsert([15_555], {"price": [0.5]})
+
+    expected, actual = ReplicaRanges(source), ReplicaRanges(replica)
+    differences = find_differences(expected, actual, fanout=16, leaf_rows=64)
+    assert differences == {"missing": [10_000], "extra": [20_500], "changed": [15_555]}
+    assert expected.queries < 40
+
+    same = ReplicaRanges(products(range(1, 20_001)))
+    assert find_differences(ReplicaRanges(source), same) == {"missing": [], "extra": [], "changed": []}
+    assert same.queries == 1
+
+
+def test_archive_materializer(tmp_path, archive) -> None:
+    """
+    Test rebuilding a table from the S3 sink's objects, in offset order and across compressed objects.
+
+    Args:
+        tmp_path (pathlib.Path): Temporary directory provided by pytest.
+        archive (SinkArchive): Writer of sink objects.
+
+    Returns:
+        None
+    """
+    store = LocalObjectStore(str(tmp_path))
+    archive.products(store, "2024-01-31/13", 0, [11, 12, 13, 14, 15])
+    before = {"id": 2, "name": "Product 12", "description": None, "price": 3.0}
+    updated = change_event("products", "u", before, dict(before, price=9.5), 17, 17, 1_017)
+    # With its schema, as the JsonConverter writes it, and a tombstone
+    archive.write(store, archive.PRODUCTS, "2024-01-31/14", 5, [json.loads(encode_envelope("products", updated)), None],
+                  codec="zstd")
+    archive.products(store, "2024-01-31/14", 7, [13], op="d")
+
+    materializer = archive_materializer(store, [archive.PRODUCTS], workers=2, batch_size=2)
+    expected = products([])
+    expected.upsert([1, 2, 4, 5], {
+        "name": [f"Product {lsn}" for lsn in (11, 12, 14, 15)],
+        "description": [None] * 4,
+        "price": [2.75, 9.5, 3.5, 3.75],
+    })
+    differences = find_differences(ReplicaRanges(expected), ReplicaRanges(materializer.table("products")))
+    assert differences == {"missing": [], "extra": [], "changed": []}
+    assert materializer.offsets[(archive.PRODUCTS, 0)] == 7
@@ -1,4 +1,18 @@
-from user_product_data import generate_user_data, generate_product_data
+from user_product_data import (
+    ProgressJournal,
+    ValuePools,
+    WorkloadProfile,
+    generate_user_data,
+    generate_product_data,
+    gen_user_product_data_parallel,
+    record_hashes,
+    record_seed,
+    shard_ranges,
+    update_rounds,
+    use_seed,
+)
+import json
+import pytest
 from typing import Dict, Any
 
 def test_generate_user_data() -> None:
@@ -30,3 +44,214 @@ def test_generate_product_data() -> None:
     assert product_data["name"] != ""
     assert product_data["description"] != ""
     assert product_data["price"] > 0.0
+
+
+def test_shard_ranges() -> None:
+    """
+    Test that shard_ranges splits the id range into disjoint, covering shards.
+
+    Returns:
+        None
+    """
+    shards = shard_ranges(10, 3)
+    assert shards == [(1, 4), (5, 3), (8, 3)]
+
+    ids = [id for first_id, count in shards for id in range(first_id, first_id + count)]
+    assert ids == list(range(1, 11))
+
+    # More workers than records leaves no empty shards
+    assert shard_ranges(2, 4) == [(1, 1), (2, 1)]
+
+    # No records leaves no shards, and no worker pool is started
+    assert shard_ranges(0, 4) == []
+    assert gen_user_product_data_parallel(0, 4) == 0.0
+
+
+def test_value_pools() -> None:
+    """
+    Test that rows assembled from value pools match the shape of Faker rows.
+
+    Returns:
+        None
+    """
+    pools = ValuePools(size=50, seed=1)
+    users = pools.users([1, 2, 3])
+    products = pools.products([1, 2, 3])
+
+    assert [user["id"] for user in users] == [1, 2, 3]
+    assert [product["id"] for product in products] == [1, 2, 3]
+    assert users[0].keys() == generate_user_data(1).keys()
+    assert products[0].keys() == generate_product_data(1).keys()
+
+    for user in users:
+        assert isinstance(user["username"], str) and user["username"] != ""
+        assert isinstance(user["email_address"], str) and user["email_address"] != ""
+    for product in products:
+        assert isinstance(product["name"], str) and product["name"] != ""
+        assert product["description"] != ""
+        assert isinstance(product["price"], float) and product["price"] > 0.0
+
+
+@pytest.mark.parametrize("target", WorkloadProfile.TARGETS)
+def test_workload_profile_plan(target) -> None:
+    """
+    Test that planned updates and deletes only ever hit ids already inserted.
+
+    Args:
+        target (str): The profile's target distribution.
+
+    Returns:
+        None
+    """
+    profile = WorkloadProfile(update_ratio=0.5, delete_ratio=0.2, target=target, seed=7)
+    ids = range(101, 10_101)
+    updates, deletes = profile.plan(ids)
+
+    assert len(updates) == len(deletes) == len(ids)
+    for id, update_id, delete_id in zip(ids, updates, deletes):
+        assert 0 <= update_id <= id
+        assert 0 <= delete_id <= id
+        if target == "same":
+            assert update_id in (0, id)
+
+    assert abs(sum(1 for id in updates if id) / len(ids) - 0.5) < 0.05
+    assert abs(sum(1 for id in deletes if id) / len(ids) - 0.2) < 0.05
+
+
+def test_workload_profile_skew() -> None:
+    """
+    Test that the zipf and hotspot targets concentrate on the oldest ids.
+
+    Returns:
+        None
+    """
+    ids = range(1, 100_001)
+    zipf_updates, _ = WorkloadProfile(update_ratio=1.0, target="zipf", zipf_s=1.5).plan(ids)
+    assert sum(1 for id in zipf_updates if id <= 10) / len(ids) > 0.5
+
+    hotspot = WorkloadProfile(update_ratio=1.0, target="hotspot", hot_fraction=0.01, hot_weight=0.9)
+    hot_updates, _ = hotspot.plan(range(50_001, 100_001))
+    assert sum(1 for id in hot_updates if id <= 1_000) / 50_000 > 0.85
+
+
+@pytest.mark.parametrize("settings", [
+    {"update_ratio": 0.5, "delete_ratio": 0.01, "target": "zipf", "zipf_s": 1.1},  # profiles/hot_keys.json
+    {"update_ratio": 0.3, "delete_ratio": 0.02, "target": "hotspot", "hot_fraction": 0.001, "hot_weight": 0.95},
+])
+def test_workload_profile_updates_hit_live_rows(settings) -> None:
+    """
+    Test that the skewed updates of the shipped profiles mostly hit rows that are not yet deleted.
+
+    Args:
+        settings (Dict[str, Any]): Settings of generate-data/profiles/hot_keys.json and hotspot.json.
+
+    Returns:
+        None
+    """
+    profile = WorkloadProfile(**settings)
+    ids = range(1, 200_001)
+    updates, deletes = profile.plan(ids)
+    deleted = set()
+    hits = live = 0
+    for update_id, delete_id in zip(updates, deletes):
+        if update_id:
+            hits += 1
+            live += update_id not in deleted
+        if delete_id:
+            deleted.add(delete_id)
+    assert live / hits > 0.95
+
+
+def test_update_rounds() -> None:
+    """
+    Test that repeated updates of one id are split into rounds that keep their order.
+
+    Returns:
+        None
+    """
+    rounds = update_rounds([1, 2, 1, 3, 1], ["a", "b", "c", "d", "e"])
+    assert rounds == [[(1, "a"), (2, "b"), (3, "d")], [(1, "c")], [(1, "e")]]
+    assert update_rounds([], []) == []
+
+
+def test_workload_profile_from_file(tmp_path) -> None:
+    """
+    Test loading a profile from JSON with command-line overrides.
+
+    Args:
+        tmp_path (pathlib.Path): Temporary directory provided by pytest.
+
+    Returns:
+        None
+    """
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps({"update_ratio": 0.3, "target": "zipf"}))
+
+    profile = WorkloadProfile.from_file(str(path), update_ratio=0.6)
+    assert profile.update_ratio == 0.6
+    assert profile.delete_ratio == 0.05
+    assert profile.target == "zipf"
+
+    with pytest.raises(ValueError):
+        WorkloadProfile(target="nope")
+
+
+def test_progress_journal(tmp_path) -> None:
+    """
+    Test saving and loading ProgressJournal checkpoints.
+
+    Args:
+        tmp_path (pathlib.Path): Temporary directory provided by pytest.
+
+    Returns:
+        None
+    """
+    journal = ProgressJournal.for_shard(str(tmp_path / "progress"), 101, 100)
+    assert journal.path.endswith("101-200.json")
+    assert journal.load() is None
+
+    journal.save(151)
+    journal.save(176)
+    assert ProgressJournal(journal.path).load() == 176
+
+
+def test_record_seed_matches_vectorised_hashes() -> None:
+    """
+    Test that the scalar and NumPy record hashes agree.
+
+    Returns:
+        None
+    """
+    ids = [1, 2, 3, 10**9, 2**40]
+    hashes = record_hashes(42, ids, 5).tolist()
+    assert hashes == [record_seed(42, id, 5) for id in ids]
+    assert len(set(hashes)) == len(ids)
+    assert record_seed(42, 1, 5) != record_seed(42, 1, 6) != record_seed(43, 1, 5)
+
+
+def test_seeded_generation_is_seekable() -> None:
+    """
+    Test that with a seed, any record can be regenerated on its own.
+
+    Returns:
+        None
+    """
+    use_seed(7)
+    try:
+        first_pass = [generate_user_data(id) for id in range(1, 6)]
+        assert generate_user_data(4) == first_pass[3]
+        assert generate_product_data(3) == generate_product_data(3)
+        assert first_pass[0] != first_pass[1]
+    finally:
+        use_seed(None)
+
+    pools = ValuePools(size=100, seed=7, seekable=True)
+    assert pools.users([42])[0] == pools.users(range(40, 45))[2]
+    assert pools.products([42])[0] == pools.products(range(40, 45))[2]
+
+    profile = WorkloadProfile(update_ratio=0.5, delete_ratio=0.3, target="zipf", seed=7, seekable=True)
+    updates, deletes = profile.plan(range(1, 1_001))
+    assert profile.decide(777) == (updates[776], deletes[776])
+    # Planning other ids first does not shift later decisions
+    profile.plan(range(5_000, 6_000))
+    assert profile.plan(range(1, 1_001)) == (updates, deletes)
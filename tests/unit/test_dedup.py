@@ -0,0 +1,111 @@
+import numpy as np
+from change_events import ChangeBatch
+from dedup import BloomFilter, Deduplicator
+from envelopes import change_event
+
+TOPIC = "debezium.commerce.users"
+
+
+def make_batch(
+        lsns: list,
+        offset: int = 0) -> ChangeBatch:
+    """
+    Build a batch of updates with one event per lsn, on id lsn % 100.
+
+    Args:
+        lsns (list): Lsn of each event.
+        offset (int): Kafka offset of the first event. Defaults to 0.
+
+    Returns:
+        ChangeBatch: The batch.
+    """
+    payloads = [change_event("users", "u", None, {"id": lsn % 100, "username": f"user{lsn}"}, lsn, lsn, lsn)
+                for lsn in lsns]
+    return ChangeBatch.from_payloads(TOPIC, payloads, [0] * len(lsns), list(range(offset, offset + len(lsns))))
+
+
+def test_bloom_filter_membership() -> None:
+    """
+    Test that added items are always found and the false positive rate is near its target.
+
+    Returns:
+        None
+    """
+    bloom = BloomFilter(10_000, 0.01)
+    words = np.random.default_rng(0).integers(0, 2 ** 63, size=(20_000, 2), dtype=np.uint64)
+    h1, h2 = words[:, 0], words[:, 1] | np.uint64(1)
+    bloom.add(h1[:10_000], h2[:10_000])
+    assert bloom.contains(h1[:10_000], h2[:10_000]).all()
+    assert bloom.contains(h1[10_000:], h2[10_000:]).mean() < 0.02
+    assert abs(bloom.error_rate() - 0.01) < 0.005
+
+
+def test_dedup_drops_redeliveries() -> None:
+    """
+    Test that redelivered events are dropped, exactly within the window and by the filter beyond it.
+
+    Returns:
+        None
+    """
+    dedup = Deduplicator(capacity=10_000, error_rate=0.001, window=10)
+    first = make_batch(list(range(1, 51)))
+    assert len(dedup.filter(first)) == 50
+
+    # a redelivery from offset 40: the last 10 are in the window, the rest only in the filter
+    redelivered = dedup.filter(make_batch(list(range(31, 61)), offset=30))
+    assert redelivered.lsn.tolist() == list(range(51, 61))
+    assert redelivered.offset.tolist() == list(range(50, 60))
+    assert [row["username"] for row in redelivered.rows()] == [f"user{lsn}" for lsn in range(51, 61)]
+
+    stats = dedup.stats()
+    assert stats["events"] == 80
+    assert stats["exact_duplicates"] == 10
+    assert stats["probable_duplicates"] == 10
+    assert stats["duplicate_rate"] == 20 / 80
+
+
+def test_dedup_within_batch() -> None:
+    """
+    Test that a duplicate in the same batch is dropped even when the window is smaller than the batch.
+
+    Returns:
+        None
+    """
+    dedup = Deduplicator(capacity=1_000, window=1)
+    kept = dedup.filter(make_batch([1, 2, 3, 1, 2]))
+    assert kept.lsn.tolist() == [1, 2, 3]
+    assert dedup.stats()["exact_duplicates"] == 2
+
+
+def test_dedup_false_positive_rate() -> None:
+    """
+    Test that filter hits on events above the high-water lsn are passed on and counted as false positives.
+
+    Returns:
+        None
+    """
+    dedup = Deduplicator(capacity=100, error_rate=0.05, window=1)
+    for start in range(1, 2_001, 100):
+        batch = make_batch(list(range(start, start + 100)))
+        assert len(dedup.filter(batch)) == 100
+    stats = dedup.stats()
+    assert stats["false_positives"] > 0
+    assert stats["false_positive_rate"] < 0.2
+    assert stats["probable_duplicates"] == 0
+
+
+def test_dedup_bounded_memory() -> None:
+    """
+    Test that the filter rotates generations and keeps its memory fixed.
+
+    Returns:
+        None
+    """
+    dedup = Deduplicator(capacity=100, error_rate=0.01, window=5)
+    dedup.filter(make_batch(list(range(1, 101))))
+    full = dedup.stats()["bloom_bytes"]
+    for start in range(101, 1_001, 100):
+        dedup.filter(make_batch(list(range(start, start + 100))))
+    assert dedup.stats()["bloom_bytes"] == full
+    assert len(dedup.recent) == 5
+    assert dedup.current.count < 100 and dedup.previous.count == 100
@@ -0,0 +1,55 @@
+import duckdb
+import pyarrow as pa
+import pytest
+from duckdb_ingest import MANIFEST_TABLE, DuckDbIngester
+from envelopes import change_event
+from object_store import LocalObjectStore
+
+
+def test_duckdb_ingest_is_incremental(store, archive) -> None:
+    """
+    Test that each refresh loads only new objects, lists only recent hours, and late objects are picked up.
+
+    Returns:
+        None
+    """
+    for day in range(1, 29):
+        archive.users(store, f"2024-01-{day:02d}/10", range(day * 10, day * 10 + 10))
+    connection = duckdb.connect()
+    ingester = DuckDbIngester(connection, store)
+
+    stats = ingester.load(ingester.pending([archive.USERS]), workers=2, batch_objects=10)
+    assert stats["objects"] == 28 and stats["rows"] == 280
+    assert connection.execute("SELECT count(*), count(DISTINCT after_id) FROM users").fetchone() == (280, 280)
+    assert ingester.pending([archive.USERS]) == []
+
+    archive.users(store, "2024-01-28/09", range(500, 505))  # flushed late, within the lookback
+    archive.users(store, "2024-01-29/00", range(600, 610))
+    store.reset()
+    objects = ingester.pending([archive.USERS], lookback_hours=2)
+    assert store.listed == 3
+    assert [archived.start_offset for archived in objects] == [500, 600]
+    assert ingester.load(objects)["rows"] == 15
+    assert connection.execute("SELECT count(*) FROM users").fetchone() == (295,)
+    assert connection.execute(f"SELECT count(*), sum(rows) FROM {MANIFEST_TABLE}").fetchone() == (30, 295)
+
+
+def test_duckdb_ingest_rolls_back(tmp_path, archive) -> None:
+    """
+    Test that a failed batch loads neither rows nor manifest entries, so it is retried.
+
+    Returns:
+        None
+    """
+    store = LocalObjectStore(str(tmp_path))
+    archive.users(store, "2024-01-31/10", range(0, 10))
+    product = change_event("products", "c", None, {"id": "not a number", "name": "x", "price": 1.0}, 1, 1, 1)
+    archive.write(store, archive.PRODUCTS, "2024-01-31/10", 0, [product])
+    connection = duckdb.connect()
+    ingester = DuckDbIngester(connection, store)
+    with pytest.raises(pa.ArrowException):
+        ingester.load(ingester.pending([archive.USERS, archive.PRODUCTS]))
+    assert connection.execute(f"SELECT count(*) FROM {MANIFEST_TABLE}").fetchone() == (0,)
+    assert connection.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'users'").fetchone() \
+        == (0,)
+    assert len(ingester.pending([archive.USERS, archive.PRODUCTS])) == 2
@@ -0,0 +1,116 @@
+from change_events import ChangeEventConsumer
+from dedup import Deduplicator
+from fake_broker import FakeBroker, preload
+from lsn_merge import merge_topics
+
+USERS = "debezium.commerce.users"
+PRODUCTS = "debezium.commerce.products"
+
+
+def consumer(
+        broker: FakeBroker,
+        group_id: str = None,
+        **kwargs) -> ChangeEventConsumer:
+    """
+    Subscribe a ChangeEventConsumer to both table topics of the broker.
+
+    Args:
+        broker (FakeBroker): The broker.
+        group_id (str): Consumer group. Defaults to None.
+        **kwargs: Other ChangeEventConsumer arguments.
+
+    Returns:
+        ChangeEventConsumer: The consumer.
+    """
+    return ChangeEventConsumer([USERS, PRODUCTS], group_id=group_id, consumer_factory=broker.consumer, **kwargs)
+
+
+def test_fake_broker_consume_all() -> None:
+    """
+    Test that a consumer reads every preloaded event, keyed rows staying in one partition.
+
+    Returns:
+        None
+    """
+    broker = FakeBroker()
+    assert preload(broker, 200, partitions=3) == {USERS: 200, PRODUCTS: 200}
+    source = consumer(broker, max_records=64)
+    ids = {USERS: {}, PRODUCTS: {}}
+    for batches in source.batches(0):
+        for topic, batch in batches.items():
+            assert len(batch) <= 64
+            afters, befores = batch.after.get("id", [None] * len(batch)), batch.before.get("id", [None] * len(batch))
+            for after, before, partition in zip(afters, befores, batch.partition.tolist()):
+                id = after if after is not None else before
+                assert ids[topic].setdefault(id, partition) == partition
+    source.close()
+    assert len(ids[USERS]) == 200 and len(ids[PRODUCTS]) == 200
+    assert len(set(ids[USERS].values())) == 3
+
+
+def test_fake_broker_groups_and_commits() -> None:
+    """
+    Test that group members split the partitions and a new member resumes from the committed offsets.
+
+    Returns:
+        None
+    """
+    broker = FakeBroker()
+    preload(broker, 100, partitions=4)
+    first, second = consumer(broker, "group"), consumer(broker, "group")
+    assert len(first.consumer.assignment()) == len(second.consumer.assignment()) == 4
+    assert not first.consumer.assignment() & second.consumer.assignment()
+
+    batches = first.poll(0)
+    assert batches and first.commit() is None
+    read = sum(len(batch) for batch in batches.values())
+    first.close()
+    second.close()
+
+    rest = consumer(broker, "group")
+    assert read + sum(len(batch) for batches in rest.batches(0) for batch in batches.values()) == 200
+    rest.close()
+
+
+def test_fake_broker_start_offsets_and_pause() -> None:
+    """
+    Test that start offsets are honoured and paused topics are not fetched.
+
+    Returns:
+        None
+    """
+    broker = FakeBroker()
+    preload(broker, 50)
+    source = consumer(broker, start_offsets={(USERS, 0): 40})
+    source.pause([PRODUCTS])
+    batches = source.poll(0)
+    assert list(batches) == [USERS]
+    assert batches[USERS].offset.tolist() == list(range(40, 50))
+    source.resume([PRODUCTS])
+    assert len(source.poll(0)[PRODUCTS]) == 50
+    source.close()
+
+
+def test_fake_broker_duplicates_and_merge() -> None:
+    """
+    Test that producer-retry duplicates are caught by dedup, and per-table topics merge into lsn order.
+
+    Returns:
+        None
+    """
+    broker = FakeBroker()
+    written = preload(broker, 500, duplicate_rate=0.05)
+    assert written[USERS] > 500
+    source = consumer(broker)
+    dedup = Deduplicator(capacity=10_000)
+    kept = sum(len(dedup.filter(batch)) for batches in source.batches(0) for batch in batches.values())
+    source.close()
+    assert kept == 1_000
+    assert dedup.stats()["events"] == sum(written.values())
+
+    source = consumer(broker)
+    merged = list(merge_topics(source, [USERS, PRODUCTS], idle_ms=0, idle_timeout_ms=0))
+    source.close()
+    assert len(merged) == sum(written.values())
+    keys = [(event.commit_lsn, event.lsn) for event in merged]
+    assert keys == sorted(keys)
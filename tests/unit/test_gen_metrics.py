@@ -0,0 +1,73 @@
+import json
+from gen_metrics import GeneratorMetrics, collect_metrics, shard_path, timed
+
+
+def test_record_statement() -> None:
+    """
+    Test that statements are counted by type, from str or bytes SQL.
+
+    Returns:
+        None
+    """
+    metrics = GeneratorMetrics()
+    metrics.record_statement("INSERT INTO commerce.users VALUES (1)", 1, 0.5)
+    metrics.record_statement("COPY commerce.users FROM STDIN", 100, 0.5)
+    metrics.record_statement(b"UPDATE commerce.users AS u SET username = v.username", 3, 0.5)
+    metrics.record_statement("\n  DELETE FROM commerce.users WHERE id = 1", 0, 0.5)
+    metrics.record_statement("SELECT 1", -1, 0.5)
+
+    assert metrics.rows == {"insert": 101, "update": 3, "delete": 0, "other": 0}
+    assert metrics.statements == 5
+    assert metrics.seconds["execute"] == 2.5
+
+
+def test_timed_counts_outermost_call_only() -> None:
+    """
+    Test that nested timed functions are only counted once, and only while collecting.
+
+    Returns:
+        None
+    """
+    @timed("generate")
+    def inner() -> int:
+        return 1
+
+    @timed("generate")
+    def outer() -> int:
+        return inner() + inner()
+
+    assert outer() == 2
+    with collect_metrics() as metrics:
+        assert outer() == 2
+        assert metrics.depth == 0
+        assert metrics.seconds["generate"] > 0
+    assert metrics.seconds["execute"] == 0
+
+
+def test_metrics_file(tmp_path) -> None:
+    """
+    Test the JSON and Prometheus metrics files.
+
+    Args:
+        tmp_path: Temporary directory fixture.
+
+    Returns:
+        None
+    """
+    json_path = str(tmp_path / "datagen.json")
+    prom_path = str(tmp_path / "datagen.prom")
+    with collect_metrics(shard_path(json_path, 1), labels={"shard": "1"}) as metrics:
+        metrics.record_statement("INSERT INTO commerce.users VALUES (1)", 1, 0.1)
+        metrics.rollbacks += 1
+    metrics.write(prom_path)
+
+    with open(tmp_path / "datagen-1.json") as f:
+        values = json.load(f)
+    assert values["rows"]["insert"] == 1
+    assert values["rollbacks"] == 1
+
+    with open(prom_path) as f:
+        text = f.read()
+    assert '# TYPE datagen_rows_total counter' in text
+    assert 'datagen_rows_total{shard="1",op="insert"} 1' in text
+    assert 'datagen_rollbacks_total{shard="1"} 1' in text
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from change_events import ChangeBatch
+from envelopes import change_event
+from lag_tracer import LagHistogram, LagTracer
+
+TOPIC = "debezium.commerce.heartbeat"
+
+
+def test_lag_histogram_percentiles() -> None:
+    """
+    Test that percentiles are within the histogram's precision and negative lags are tallied.
+
+    Returns:
+        None
+    """
+    histogram = LagHistogram(precision=0.01)
+    histogram.record(np.arange(1, 1_001))
+    histogram.record(np.array([-5]))
+    assert histogram.count == 1_001
+    assert histogram.negative == 1
+    assert histogram.percentile(0.5) == pytest.approx(500, rel=0.02)
+    assert histogram.percentile(0.99) == pytest.approx(990, rel=0.02)
+    assert histogram.percentile(1.0) == 1_000
+
+
+def test_lag_tracer_stages() -> None:
+    """
+    Test that each stage's lag is taken from the right pair of timestamps and snapshot reads are skipped.
+
+    Returns:
+        None
+    """
+    # change_event stamps the connector time 5 ms after the commit
+    payloads = [change_event("heartbeat", op, None, {"id": 1, "ts_ms": ts}, lsn=ts, tx_id=1, ts_ms=ts)
+                for op, ts in (("u", 1_000), ("u", 2_000), ("r", 0))]
+    batch = ChangeBatch.from_payloads(TOPIC, payloads, [0] * 3, [0, 1, 2], timestamps=[1_025, 2_045, 50])
+
+    tracer = LagTracer(window=60)
+    tracer.observe(batch, now_ms=3_000)
+    windows = {window["stage"]: window for window in tracer.flush()}
+    assert {window["table"] for window in windows.values()} == {"heartbeat"}
+    assert windows["commit_to_connector"]["count"] == 2
+    assert windows["commit_to_connector"]["max_ms"] == 5
+    assert windows["connector_to_kafka"]["max_ms"] == 40
+    assert windows["kafka_to_consumer"]["max_ms"] == 1_975
+    assert windows["end_to_end"]["max_ms"] == 2_000
+    assert tracer.flush() == []
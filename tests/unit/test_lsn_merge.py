@@ -0,0 +1,76 @@
+from envelopes import change_event
+from lsn_merge import LsnMerger, Transaction
+
+USERS = "debezium.commerce.users"
+PRODUCTS = "debezium.commerce.products"
+
+
+def event(table: str, id: int, lsn: int, tx_id: int, commit_lsn: int) -> dict:
+    return change_event(table, "c", None, {"id": id}, lsn=lsn, tx_id=tx_id, ts_ms=0, commit_lsn=commit_lsn)
+
+
+# Three transactions in commit order; the lsns of tx 11 and tx 12 interleave, as with concurrent writers
+TRANSACTIONS = [
+    (10, 100, [("users", 1, 101), ("products", 1, 102)]),
+    (12, 150, [("products", 2, 140), ("users", 2, 145)]),
+    (11, 200, [("users", 3, 130), ("products", 3, 160), ("products", 4, 190)]),
+]
+
+
+def topic_streams() -> dict:
+    """The events of each table in the order the connector wrote them."""
+    streams = {USERS: [], PRODUCTS: []}
+    for tx_id, commit_lsn, changes in TRANSACTIONS:
+        for table, id, lsn in changes:
+            streams[f"debezium.commerce.{table}"].append(event(table, id, lsn, tx_id, commit_lsn))
+    return streams
+
+
+def test_merger_restores_commit_order() -> None:
+    """
+    Test that events are released in commit order only once every input has moved past them.
+
+    Returns:
+        None
+    """
+    streams = topic_streams()
+    merger = LsnMerger([USERS, PRODUCTS])
+    merger.add(USERS, streams[USERS][:2])
+    assert list(merger.ready()) == []  # products has not delivered anything yet
+
+    merger.add(PRODUCTS, streams[PRODUCTS][:1])
+    assert [(e.topic, e.lsn) for e in merger.ready()] == [(USERS, 101), (PRODUCTS, 102)]
+
+    merger.add(PRODUCTS, streams[PRODUCTS][1:])
+    merger.add(USERS, streams[USERS][2:])
+    released = list(merger.ready()) + list(merger.flush())
+    assert [e.payload["source"]["txId"] for e in released] == [12, 12, 11, 11, 11]
+    assert [e.lsn for e in released] == [140, 145, 130, 160, 190]
+    assert merger.late == merger.out_of_order == 0
+
+
+def test_merger_groups_transactions_and_skips_idle_inputs() -> None:
+    """
+    Test that whole transactions are released as the watermark passes them, and idle inputs do not block.
+
+    Returns:
+        None
+    """
+    streams = topic_streams()
+    merger = LsnMerger([USERS, PRODUCTS], group_transactions=True)
+    merger.add(USERS, streams[USERS], partitions=[0, 0, 0], offsets=[5, 6, 7])
+    merger.add(PRODUCTS, streams[PRODUCTS][:2], partitions=[0, 0], offsets=[0, 1])
+    transactions = list(merger.ready())
+    assert all(isinstance(tx, Transaction) for tx in transactions)
+    assert [(tx.tx_id, len(tx.events)) for tx in transactions] == [(10, 2)]  # users of tx 12 not seen yet
+    assert merger.released_offsets == {(USERS, 0): 6, (PRODUCTS, 0): 1}
+
+    merger.set_idle(PRODUCTS)
+    assert [(tx.tx_id, len(tx.events)) for tx in merger.ready()] == [(12, 2)]  # tx 11 may have more to come
+    merger.add(PRODUCTS, streams[PRODUCTS][2:], partitions=[0, 0], offsets=[2, 3])
+    merger.set_idle(PRODUCTS)
+    merger.set_idle(USERS)
+    [last] = merger.ready()
+    assert (last.tx_id, [e.lsn for e in last.events]) == (11, [130, 160, 190])
+    assert merger.released_offsets == {(USERS, 0): 8, (PRODUCTS, 0): 4}
+    assert len(merger) == 0
@@ -0,0 +1,74 @@
+from change_events import ChangeBatch
+from envelopes import change_event
+from materializer import Materializer
+
+TOPIC = "debezium.commerce.products"
+
+
+def product(id: int, price: float = 1.5, description=None) -> dict:
+    return {"id": id, "name": f"Product {id}", "description": description, "price": price}
+
+
+def batch(events, first_offset: int = 0, partition: int = 0) -> ChangeBatch:
+    """A ChangeBatch of (op, before, after) tuples at consecutive offsets."""
+    payloads = [change_event("products", op, before, after, lsn=first_offset + i, tx_id=1, ts_ms=0)
+                for i, (op, before, after) in enumerate(events)]
+    offsets = list(range(first_offset, first_offset + len(events)))
+    return ChangeBatch.from_payloads(TOPIC, payloads, [partition] * len(events), offsets)
+
+
+def test_materializer_applies_changes() -> None:
+    """
+    Test that creates, updates, deletes and truncates leave the last state of each row.
+
+    Returns:
+        None
+    """
+    materializer = Materializer()
+    materializer.apply(batch([
+        ("r", None, product(1)),
+        ("c", None, product(2, description="two")),
+        ("c", None, product(3)),
+        ("u", product(1), product(1, price=9.25)),
+        ("d", product(3), None),
+        ("c", None, product(3, price=4.0)),
+        ("d", product(2), None),
+    ]))
+    products = materializer.tables["products"]
+    assert len(products) == 2
+    assert materializer.get("products", 1) == product(1, price=9.25)
+    assert materializer.get("products", 2) is None
+    assert list(products.rows()) == [product(1, price=9.25), product(3, price=4.0)]
+
+    materializer.apply(batch([("c", None, product(id)) for id in range(4, 2_000)], first_offset=7))
+    assert len(products) == 1_998
+    assert materializer.get("products", 1_999) == product(1_999)
+
+    materializer.apply(batch([("t", None, None), ("c", None, product(5))], first_offset=2_003))
+    assert list(products.rows()) == [product(5)]
+
+
+def test_materializer_snapshot_restore(tmp_path) -> None:
+    """
+    Test that a restored snapshot has the same rows and skips events it already applied.
+
+    Returns:
+        None
+    """
+    materializer = Materializer()
+    materializer.apply(batch([("c", None, product(id)) for id in range(10)]))
+    materializer.apply(batch([("d", product(id), None) for id in range(0, 10, 2)], first_offset=10))
+    path = str(tmp_path / "state.snapshot")
+    materializer.snapshot(path)
+
+    restored = Materializer.restore(path)
+    assert list(restored.tables["products"].rows()) == list(materializer.tables["products"].rows())
+    assert restored.next_offsets() == {(TOPIC, 0): 15}
+
+    # Redelivered events are skipped, later ones applied, and freed slots reused
+    applied = restored.apply(batch([("d", product(id), None) for id in range(0, 10, 2)]
+                                   + [("c", None, product(id)) for id in (10, 11)], first_offset=10))
+    assert applied == 2
+    assert restored.skipped == 5
+    assert sorted(restored.tables["products"].index) == [1, 3, 5, 7, 9, 10, 11]
+    assert restored.tables["products"].size == 10
@@ -0,0 +1,116 @@
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import urllib.error
+from change_events import ChangeEventConsumer
+from envelopes import change_event, encode_envelope, encode_key
+from fake_broker import FakeBroker, preload
+from fake_s3 import FakeS3Server
+from kafka import TopicPartition
+from object_sink import ObjectSink
+from object_store import LocalObjectStore, S3ObjectStore
+
+USERS = "debezium.commerce.users"
+
+
+class FailingStore(LocalObjectStore):
+    """Local store whose uploads fail while `failing` is set."""
+
+    failing = False
+
+    def put_multipart(self, key, data, part_size=0, workers=0):
+        if self.failing:
+            raise OSError("upload failed")
+        super().put_multipart(key, data)
+
+
+def read_files(store: LocalObjectStore) -> list:
+    """
+    Read every file the sink wrote.
+
+    Args:
+        store (LocalObjectStore): The sink's store.
+
+    Returns:
+        list: (key, table) per file, in key order.
+    """
+    return [(info.key, pq.read_table(io.BytesIO(store.get(info.key)))) for info in store.list("sink/")]
+
+
+def test_object_sink_rolls_by_size_and_commits_uploaded_offsets(tmp_path) -> None:
+    """
+    Test that files are rolled by size per partition, hold every event once and their offsets are committed.
+
+    Returns:
+        None
+    """
+    broker = FakeBroker()
+    preload(broker, 2_000, tables=("users",), partitions=2)
+    consumer = ChangeEventConsumer([USERS], group_id="sink", max_records=300, consumer_factory=broker.consumer)
+    store = LocalObjectStore(str(tmp_path))
+    stats = ObjectSink(consumer, store, max_bytes=200_000, max_age_s=None, upload_workers=2).run(idle_timeout_ms=50)
+
+    files = read_files(store)
+    assert stats["rows"] == 2_000 and stats["files"] == len(files) > 4
+    assert all(key.startswith(f"sink/{USERS}/date=2023-11-14/hour=22/") for key, _ in files)
+    for partition in range(2):
+        tables = [table for key, table in files if key.rsplit("/", 1)[-1].startswith(f"{partition:010d}-")]
+        offsets = pa.concat_tables(tables).column("offset").to_pylist()
+        assert offsets == list(range(broker.end_offset(TopicPartition(USERS, partition))))
+        assert broker.committed["sink"][TopicPartition(USERS, partition)] == len(offsets)
+
+
+def test_object_sink_rolls_by_age_and_hour_and_commits_only_after_upload(tmp_path) -> None:
+    """
+    Test that files roll when their first record is old or the hour changes, and failed uploads commit nothing.
+
+    Returns:
+        None
+    """
+    broker = FakeBroker()
+    broker.create_topic(USERS, 1)
+    for id, timestamp in enumerate([3_599_000, 3_599_500, 3_601_000]):
+        payload = change_event("users", "c", None, {"id": id, "username": f"user{id}"}, id, id, timestamp)
+        broker.produce(USERS, encode_envelope("users", payload), encode_key("users", id), timestamp=timestamp)
+    consumer = ChangeEventConsumer([USERS], group_id="sink", consumer_factory=broker.consumer)
+    store = FailingStore(str(tmp_path))
+    now = [10_000.0]
+    sink = ObjectSink(consumer, store, max_bytes=None, max_age_s=60, clock=lambda: now[0])
+
+    assert sink.step(10) == 3
+    sink.flush()
+    assert [key.rsplit("/", 2)[-2:] for key, _ in read_files(store)] == [
+        ["hour=00", f"{0:010d}-{0:020d}.parquet"], ["hour=01", f"{0:010d}-{2:020d}.parquet"]]
+    assert broker.committed["sink"][TopicPartition(USERS, 0)] == 3
+
+    store.failing = True
+    broker.produce(USERS, encode_envelope("users", change_event("users", "d", {"id": 0}, None, 9, 9, 3_602_000)),
+                   encode_key("users", 0), timestamp=3_602_000)
+    assert sink.step(10) == 1
+    assert sink.step(10) == 0 and len(sink.files) == 1
+    now[0] += 60
+    with pytest.raises(OSError):
+        sink.step(10)
+        sink.flush()
+    assert broker.committed["sink"][TopicPartition(USERS, 0)] == 3
+    sink.pool.shutdown()
+
+
+def test_s3_multipart_upload(tmp_path) -> None:
+    """
+    Test that large objects are uploaded in parts and a rejected upload is aborted.
+
+    Returns:
+        None
+    """
+    with FakeS3Server(str(tmp_path), min_part_size=3_000) as server:
+        store = S3ObjectStore("commerce", server.endpoint)
+        data = bytes(range(256)) * 40
+        store.put_multipart("sink/a.parquet", data, part_size=3_000, workers=3)
+        assert store.get("sink/a.parquet") == data
+        with pytest.raises(urllib.error.HTTPError):
+            store.put_multipart("sink/b.parquet", data, part_size=1_000)
+        assert server.uploads == {}
+        with pytest.raises(FileNotFoundError):
+            store.get("sink/b.parquet")
@@ -0,0 +1,116 @@
+import os
+import pytest
+from collections import namedtuple
+from envelopes import change_event, encode_envelope, encode_key
+from parallel_consumer import ParallelConsumer, WorkerError
+
+Record = namedtuple("Record", ["partition", "offset", "timestamp", "key", "value"])
+TOPIC = "debezium.commerce.users"
+
+
+class FakeConsumer:
+    """Replays prepared batches and records commits."""
+
+    def __init__(self, batches, group_id="test"):
+        self.batches = list(batches)
+        self.group_id = group_id
+        self.commits = 0
+
+    def poll_records(self, timeout_ms):
+        return self.batches.pop(0) if self.batches else {}
+
+    def commit(self):
+        self.commits += 1
+
+
+class KeyRecorder:
+    """Handler returning (pid, id, lsn) for every event it sees, failing on one id."""
+
+    def __init__(self, fail_id=None):
+        self.fail_id = fail_id
+
+    def __call__(self, topic, batch):
+        ids = [after["id"] for after in batch.rows()]
+        if self.fail_id in ids:
+            raise ValueError(f"cannot handle {self.fail_id}")
+        return [(os.getpid(), id, int(lsn)) for id, lsn in zip(ids, batch.lsn)]
+
+
+def batches(num_batches: int, per_batch: int, keys: int):
+    """Batches of updates cycling over `keys` rows with increasing lsns, spread over two partitions."""
+    lsn = 0
+    result = []
+    for _ in range(num_batches):
+        records = []
+        for _ in range(per_batch):
+            id = lsn % keys
+            user = {"id": id, "username": f"user{lsn}", "email_address": f"user{lsn}@example.com"}
+            payload = change_event("users", "u", None, user, lsn=lsn, tx_id=lsn, ts_ms=0)
+            records.append(Record(id % 2, lsn, 0, encode_key("users", id), encode_envelope("users", payload)))
+            lsn += 1
+        result.append({TOPIC: records})
+    return result
+
+
+def test_parallel_consumer_keeps_per_key_order() -> None:
+    """
+    Test that all changes of a row go to one worker in lsn order, and each batch is committed once.
+
+    Returns:
+        None
+    """
+    consumer = FakeConsumer(batches(3, 40, keys=7))
+    seen = []
+    runtime = ParallelConsumer(consumer, KeyRecorder(), workers=3)
+    try:
+        events = runtime.run(idle_timeout_ms=0, on_batch=lambda outputs: seen.extend(e for o in outputs for e in o))
+    finally:
+        runtime.close()
+
+    assert events == 120
+    assert consumer.commits == 3
+    assert sorted(lsn for _, _, lsn in seen) == list(range(120))
+    pids, lsns = {}, {}
+    for pid, id, lsn in seen:
+        assert pids.setdefault(id, pid) == pid
+        assert lsn > lsns.get(id, -1)
+        lsns[id] = lsn
+    assert len(set(pids.values())) > 1
+
+
+def test_parallel_consumer_does_not_commit_failed_batch() -> None:
+    """
+    Test that a failing handler stops the run before the batch's offsets are committed.
+
+    Returns:
+        None
+    """
+    consumer = FakeConsumer(batches(3, 10, keys=30))
+    runtime = ParallelConsumer(consumer, KeyRecorder(fail_id=15), workers=2)
+    try:
+        with pytest.raises(WorkerError, match="cannot handle 15"):
+            runtime.run(idle_timeout_ms=0)
+    finally:
+        runtime.close()
+    assert consumer.commits == 1
+    assert runtime.batches == 1
+
+
+def test_parallel_consumer_drops_stale_results() -> None:
+    """
+    Test that results left over from an earlier batch are not counted for the current one.
+
+    Returns:
+        None
+    """
+    consumer = FakeConsumer(batches(2, 10, keys=10))
+    seen = []
+    runtime = ParallelConsumer(consumer, KeyRecorder(), workers=2)
+    try:
+        runtime.results.put((0, 0, 99, [["stale"]], None))
+        events = runtime.run(idle_timeout_ms=0, on_batch=lambda outputs: seen.extend(e for o in outputs for e in o))
+    finally:
+        runtime.close()
+
+    assert events == 20
+    assert sorted(lsn for _, _, lsn in seen) == list(range(20))
@@ -0,0 +1,61 @@
+import argparse
+import pytest
+from rate_driver import LatencyHistogram, RateSchedule, positive_float
+
+
+def test_latency_histogram_percentiles() -> None:
+    """
+    Test that LatencyHistogram percentiles are within its bucket precision.
+
+    Returns:
+        None
+    """
+    histogram = LatencyHistogram(precision=0.01)
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000.0)
+
+    summary = histogram.summary()
+    assert summary["count"] == 1000
+    assert abs(summary["p50_ms"] - 500) <= 500 * 0.01
+    assert abs(summary["p99_ms"] - 990) <= 990 * 0.01
+    assert abs(summary["p999_ms"] - 999) <= 999 * 0.01
+    assert summary["max_ms"] == 1000
+
+
+def test_latency_histogram_empty() -> None:
+    """
+    Test that an empty LatencyHistogram reports zeros.
+
+    Returns:
+        None
+    """
+    assert LatencyHistogram().percentile(0.99) == 0.0
+
+
+def test_rate_schedule_ramp_and_bursts() -> None:
+    """
+    Test the ramp-up and burst phases of RateSchedule.
+
+    Returns:
+        None
+    """
+    schedule = RateSchedule(100.0, ramp=10.0, burst_rate=400.0, burst_every=20.0, burst_length=5.0)
+
+    assert schedule.rate_at(0.0) == 1.0  # floor at the start of the ramp
+    assert schedule.rate_at(5.0) == 50.0
+    assert schedule.rate_at(10.0) == 400.0  # a burst starts right after the ramp
+    assert schedule.rate_at(16.0) == 100.0
+    assert schedule.rate_at(30.0) == 400.0
+
+
+def test_positive_float_rejects_rates_at_or_below_zero() -> None:
+    """
+    Test that command line rates must be above zero.
+
+    Returns:
+        None
+    """
+    assert positive_float("2.5") == 2.5
+    for value in ("0", "-1", "nan", "fast"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_float(value)
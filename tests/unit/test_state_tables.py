@@ -0,0 +1,52 @@
+import json
+from compaction import compact
+from state_tables import INDEX, StateTable
+
+
+def test_state_table_merges_incrementally(store, archive) -> None:
+    """
+    Test that refreshes keep the newest row per id, drop deletes and merge only new or recompacted files.
+
+    Returns:
+        None
+    """
+    archive.products(store, "2024-01-31/13", 0, [10, 11, 12, 13, 14])
+    archive.products(store, "2024-01-31/14", 5, [21, 23], op="ud")
+    compact(store, [archive.PRODUCTS], now=archive.NOW)
+    table = StateTable(store, archive.PRODUCTS)
+
+    state = table.refresh()
+    assert (state["merged"], state["keys"], state["rows"], state["lsn"]) == (2, 5, 4, 23)
+    rows = table.current().to_pydict()
+    assert rows["id"] == [0, 1, 2, 4] and rows["price"][1] == 21 / 4 and rows["_lsn"] == [10, 21, 12, 14]
+    assert table.refresh()["merged"] == 0
+
+    archive.products(store, "2024-01-31/13", 7, [16])  # flushed late, with a lower lsn than the delete
+    compact(store, [archive.PRODUCTS], now=archive.NOW)
+    store.reset()
+    assert table.refresh()["merged"] == 1
+    assert len([key for key in store.read if key.endswith(".parquet") and "/hour=" in key]) == 1
+    assert table.current().column("id").to_pylist() == [0, 1, 2, 4, 6]
+
+
+def test_state_table_as_of_reads_only_earlier_files(store, archive) -> None:
+    """
+    Test that time travel by lsn or commit time returns past rows and skips files that start later.
+
+    Returns:
+        None
+    """
+    archive.products(store, "2024-01-31/13", 0, [10, 11, 13])
+    archive.products(store, "2024-01-31/14", 3, [21, 23], op="ud")
+    compact(store, [archive.PRODUCTS], now=archive.NOW)
+    table = StateTable(store, archive.PRODUCTS)
+
+    store.reset()
+    rows = table.as_of(lsn=13).to_pydict()
+    assert rows["id"] == [0, 1, 3] and rows["price"][1] == 11 / 4
+    assert len([key for key in store.read if key.endswith(".parquet")]) == 1
+    rows = table.as_of(ts_ms=1_021).to_pydict()
+    assert rows["id"] == [0, 1, 3] and rows["price"][1] == 21 / 4
+    assert table.as_of(lsn=23).column("id").to_pylist() == [0, 1]
+    assert len(table.as_of(lsn=5)) == 0
+    assert json.loads(store.get(f"compacted/{archive.PRODUCTS}/{INDEX}"))["topic"] == archive.PRODUCTS